@@ -1,4 +1,17 @@
-from .accountabot import main
-from . import commands as _commands
+"""AccountaBot
+
+The bot and its commands are imported on first use of main, so that tools
+working on the user store, like accountabot.admin, don't import discord.
+"""
 
 __all__ = ["main", "_commands"]
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        from . import commands as _commands
+        from .accountabot import main
+
+        globals().update(main=main, _commands=_commands)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,30 +1,131 @@
 import logging
 import os
+from time import perf_counter
 
 import discord
 from discord import app_commands
 from dotenv import load_dotenv
 
+from . import metrics
 from .data import get_users
-from .loop import commitment_check_loop
+from .data import other_layout_files
+from .data import partition_path
+from .data import shard_partition
+from .data import use_partition
+from .data import use_snapshot_format
+from .database import use_sqlite_storage
+from .leaderboard import get_leaderboard
+from .lifecycle import get_lifecycle
+from .membership import get_guild_index
+from .message import invalidate_announcement_channel
+from .message import set_interaction_budget
+from .message import start_response_budget
+from .sync import CommandSync
 
 
-bot = discord.Client(intents=discord.Intents.all())
-command_tree = app_commands.CommandTree(bot)
+class _CommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction):
+        # Also called for autocomplete, which is answered with choices and
+        # can't be deferred
+        if interaction.type is discord.InteractionType.application_command:
+            interaction.extras[metrics.COMMAND_STARTED_AT] = perf_counter()
+            start_response_budget(interaction)
+        return True
+
+
+bot = discord.AutoShardedClient(intents=discord.Intents.all())
+command_tree = _CommandTree(bot)
+command_sync = CommandSync(command_tree)
 logger = logging.getLogger("discord")
 
 
+@bot.event
+async def setup_hook():
+    if metrics.is_enabled():
+        bot.loop.create_task(metrics.monitor_event_loop_lag())
+
+
+@bot.event
+async def on_app_command_completion(
+    interaction: discord.Interaction, _: app_commands.Command
+):
+    metrics.observe_command(interaction, "ok")
+
+
 @bot.event
 async def on_guild_join(guild: discord.Guild):
-    command_tree.copy_global_to(guild=guild)
-    await command_tree.sync(guild=guild)
+    guild_index = get_guild_index()
+    guild_index.add_guild(guild, get_users().member_id_to_user)
+    for member_id in guild_index.member_ids_of(guild.id):
+        get_leaderboard().add_member(member_id, guild.id)
+    command_sync.plan([guild.id])
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    get_guild_index().remove_guild(guild.id)
+    get_leaderboard().remove_guild(guild.id)
+    invalidate_announcement_channel(guild.id)
+    command_sync.forget(guild.id)
+
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    if member.id in get_users().member_id_to_user:
+        get_guild_index().add_member(member.id, member.guild.id)
+        get_leaderboard().add_member(member.id, member.guild.id)
+
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    get_guild_index().remove_member(member.id, member.guild.id)
+    get_leaderboard().remove_member(member.id, member.guild.id)
+
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    invalidate_announcement_channel(channel.guild.id)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    invalidate_announcement_channel(channel.guild.id)
+
+
+@bot.event
+async def on_guild_channel_update(
+    _: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+):
+    invalidate_announcement_channel(after.guild.id)
+
+
+@bot.event
+async def on_guild_role_update(_: discord.Role, after: discord.Role):
+    invalidate_announcement_channel(after.guild.id)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    invalidate_announcement_channel(role.guild.id)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    is_bot = bot.user is not None and after.id == bot.user.id
+    if is_bot and before.roles != after.roles:
+        invalidate_announcement_channel(after.guild.id)
 
 
 @bot.event
 async def on_ready():
-    get_users().load()
-    logger.info("Users loaded")
-    commitment_check_loop.start(bot.guilds)
+    get_lifecycle().ready(bot)
+    num_queued = command_sync.plan(guild.id for guild in bot.guilds)
+    logger.info(f"Syncing commands to {num_queued} guild(s)")
+
+
+@bot.event
+async def on_resumed():
+    get_lifecycle().resumed(bot)
 
 
 def main() -> int:
@@ -32,6 +133,67 @@ def main() -> int:
     token = os.getenv("DISCORD_TOKEN")
     if token is None:
         raise RuntimeError("Token environment variable not found")
+    shard_count, shard_ids = _shard_config()
+    bot.shard_count = shard_count
+    bot.shard_ids = shard_ids
+    partition = None
+    if shard_ids is not None:
+        assert shard_count is not None
+        partition = shard_partition(shard_ids, shard_count)
+    other_files = other_layout_files(partition)
+    if other_files:
+        raise RuntimeError(
+            f"{', '.join(other_files)} hold users of another shard layout, "
+            "whose guilds this process may serve. Move them to this "
+            "process's store with accountabot-admin export and import, or "
+            "restore the previous SHARD_COUNT and SHARD_IDS"
+        )
+    if partition is not None:
+        use_partition(partition)
+        command_sync.path = partition_path(command_sync.path, partition)
+        logger.info(f"Running shards {shard_ids} of {shard_count}")
 
-    bot.run(token)
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port is not None:
+        metrics.start_server(
+            int(metrics_port), os.getenv("METRICS_ADDRESS", "127.0.0.1")
+        )
+
+    budget = os.getenv("INTERACTION_BUDGET_SECONDS")
+    if budget is not None:
+        set_interaction_budget(float(budget))
+
+    backend = os.getenv("USERS_BACKEND", "pickle")
+    if backend == "sqlite":
+        use_sqlite_storage()
+    elif backend == "mmap":
+        use_snapshot_format("mmap")
+    elif backend != "pickle":
+        raise RuntimeError(f"Unknown users backend '{backend}'")
+
+    try:
+        bot.run(token)
+    finally:
+        get_users().close()
     return 0
+
+
+def _shard_config() -> tuple[int | None, list[int] | None]:
+    shard_count = os.getenv("SHARD_COUNT")
+    shard_ids = os.getenv("SHARD_IDS")
+    if shard_count is None:
+        if shard_ids is not None:
+            raise RuntimeError("SHARD_IDS requires SHARD_COUNT to be set")
+        return None, None
+    count = int(shard_count)
+    if shard_ids is None:
+        return count, None
+    try:
+        ids = sorted({int(shard_id) for shard_id in shard_ids.split(",")})
+    except ValueError:
+        raise RuntimeError(
+            f"SHARD_IDS must be comma separated shard ids, not '{shard_ids}'"
+        )
+    if not all(0 <= shard_id < count for shard_id in ids):
+        raise RuntimeError(f"SHARD_IDS must be between 0 and {count - 1}")
+    return count, ids
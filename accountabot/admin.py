@@ -0,0 +1,342 @@
+"""Offline maintenance of the user store
+
+Works on the same files as the bot, chosen by --backend and --partition like
+USERS_BACKEND and SHARD_IDS choose them, and never imports discord. Commands
+that only read leave the files as they are. Stop the bot before importing or
+migrating.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+from datetime import time
+from itertools import chain
+from typing import Any
+from typing import ContextManager
+from typing import Iterable
+from typing import Iterator
+from typing import TextIO
+
+from . import data
+from .data import Commitment
+from .data import Recurrence
+from .data import to_zone
+from .data import User
+from .data import Users
+from .snapshot import is_snapshot
+
+
+BACKENDS = ("pickle", "mmap", "sqlite")
+# Users written to the store at once while importing or migrating
+IMPORT_BATCH_SIZE = 1000
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=os.getenv("USERS_BACKEND", "pickle"),
+        help="defaults to USERS_BACKEND, pickle and mmap are interchangeable",
+    )
+    parser.add_argument(
+        "--partition", help="store of a shard process, e.g. 'shards-0-1-of-4'"
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    inspect_parser = subparsers.add_parser("inspect", help="show one user")
+    inspect_parser.add_argument("member_id", type=int)
+    inspect_parser.set_defaults(func=inspect)
+
+    stats_parser = subparsers.add_parser("stats", help="summarize the store")
+    stats_parser.set_defaults(func=stats)
+
+    export_parser = subparsers.add_parser(
+        "export", help="write the store as JSON Lines"
+    )
+    export_parser.add_argument("path", nargs="?", help="defaults to stdout")
+    export_parser.set_defaults(func=export)
+
+    import_parser = subparsers.add_parser(
+        "import", help="add or replace users and guilds from JSON Lines"
+    )
+    import_parser.add_argument("path", nargs="?", help="defaults to stdin")
+    import_parser.set_defaults(func=import_)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="move the store to another backend"
+    )
+    migrate_parser.add_argument("target", choices=BACKENDS)
+    migrate_parser.set_defaults(func=migrate)
+
+    verify_parser = subparsers.add_parser(
+        "verify", help="check every user for inconsistencies"
+    )
+    verify_parser.set_defaults(func=verify)
+
+    args = parser.parse_args(argv)
+    if args.partition is not None:
+        data.use_partition(args.partition)
+    try:
+        return args.func(args)
+    except FileNotFoundError as ex:
+        print(ex, file=sys.stderr)
+        return 1
+
+
+def inspect(args: argparse.Namespace) -> int:
+    users = _open(args.backend)
+    if args.backend == "sqlite":
+        user = users.read(args.member_id)
+    else:
+        user = users.member_id_to_user.get(args.member_id)
+    if user is None:
+        print(f"No user {args.member_id}", file=sys.stderr)
+        return 1
+    print(json.dumps(encode_user(user), indent=2, ensure_ascii=False))
+    return 0
+
+
+def stats(args: argparse.Namespace) -> int:
+    users = _open(args.backend)
+    counts: Counter[str] = Counter()
+    repetitions: Counter[str] = Counter()
+    longest_streak = 0
+    for user in users.scan():
+        counts["users"] += 1
+        counts["active"] += user.is_active
+        commitment = user.commitment
+        if commitment is None:
+            continue
+        counts["commitments"] += 1
+        counts["reminders"] += commitment.reminder is not None
+        repetitions[commitment.recurrence.repetition.name.lower()] += 1
+        longest_streak = max(longest_streak, commitment.longest_streak)
+    for name in ["users", "active", "commitments", "reminders"]:
+        print(f"{name}: {counts[name]}")
+    for repetition, count in sorted(repetitions.items()):
+        print(f"  {repetition}: {count}")
+    print(f"longest streak: {longest_streak}")
+    print(f"announcement channels: {len(_announcement_channels(users))}")
+    return 0
+
+
+def export(args: argparse.Namespace) -> int:
+    users = _open(args.backend)
+    with _output(args.path) as f:
+        for line in export_lines(
+            users.scan(), _announcement_channels(users).items()
+        ):
+            f.write(line)
+    return 0
+
+
+def import_(args: argparse.Namespace) -> int:
+    users = _open(args.backend, read_only=False)
+    with _input(args.path) as f:
+        num_users = _write(users, import_lines(f))
+    users.close()
+    print(f"Imported {num_users} user(s)", file=sys.stderr)
+    return 0
+
+
+def migrate(args: argparse.Namespace) -> int:
+    source_is_snapshot = args.backend != "sqlite"
+    if source_is_snapshot and args.target != "sqlite":
+        data.use_snapshot_format(args.target)
+        users = Users(member_id_to_user={})
+        # Loading rewrites the snapshot in the format in use
+        users.load()
+        users.compact()
+        users.close()
+        print(f"Converted {data.USERS_FILE} to {args.target}", file=sys.stderr)
+        return 0
+    source = _open(args.backend)
+    target = _open(args.target, read_only=False)
+    if next(target.scan(), None) is not None:
+        print(f"The {args.target} store is not empty", file=sys.stderr)
+        return 1
+    guilds = _announcement_channels(source).items()
+    num_users = _write(target, chain(source.scan(), guilds))
+    if isinstance(target, Users):
+        target.compact()
+    target.close()
+    source.close()
+    print(f"Migrated {num_users} user(s) to {args.target}", file=sys.stderr)
+    return 0
+
+
+def verify(args: argparse.Namespace) -> int:
+    users = _open(args.backend)
+    num_users = 0
+    num_problems = 0
+    for user in users.scan():
+        num_users += 1
+        for problem in problems_of(user):
+            num_problems += 1
+            print(f"{user.member_id}: {problem}")
+    print(
+        f"Checked {num_users} user(s), found {num_problems} problem(s)",
+        file=sys.stderr,
+    )
+    return 1 if num_problems else 0
+
+
+def problems_of(user: User) -> Iterator[str]:
+    commitment = user.commitment
+    if commitment is None:
+        return
+    if commitment.owner_id != user.member_id:
+        yield f"commitment is owned by {commitment.owner_id}"
+    if commitment.streak and commitment.num_missed_in_a_row:
+        yield "has both a streak and misses in a row"
+    if commitment.longest_streak < commitment.streak:
+        yield "longest streak is shorter than the current streak"
+    if not 0 <= commitment.num_recorded <= data.HISTORY_LENGTH:
+        yield f"records {commitment.num_recorded} check ins"
+    elif commitment.history >> commitment.num_recorded:
+        yield "history holds more check ins than were recorded"
+
+
+def export_lines(
+    users: Iterable[User], guild_id_to_channel_id: Iterable[tuple[int, int]]
+) -> Iterator[str]:
+    for user in users:
+        yield _line({"type": "user", **encode_user(user)})
+    for guild_id, channel_id in guild_id_to_channel_id:
+        yield _line(
+            {"type": "guild", "guild_id": guild_id, "channel_id": channel_id}
+        )
+
+
+def import_lines(lines: Iterable[str]) -> Iterator[User | tuple[int, int]]:
+    """Users and (guild id, announcement channel id) pairs of the lines"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if record["type"] == "guild":
+                yield record["guild_id"], record["channel_id"]
+            else:
+                yield decode_user(record)
+        except (KeyError, TypeError, ValueError) as ex:
+            raise ValueError(f"Line {number} is not a valid record: {ex}")
+
+
+def encode_user(user: User) -> dict[str, Any]:
+    commitment = user.commitment
+    return {
+        "member_id": user.member_id,
+        "is_active": user.is_active,
+        "timezone": user.timezone.key,
+        "commitment": None
+        if commitment is None
+        else {
+            "name": commitment.name,
+            "description": commitment.description,
+            "next_check_in": commitment.next_check_in.isoformat(),
+            "recurrence": str(commitment.recurrence),
+            "streak": commitment.streak,
+            "num_missed_in_a_row": commitment.num_missed_in_a_row,
+            "reminder": None
+            if commitment.reminder is None
+            else commitment.reminder.isoformat(),
+            "history": format(commitment.history, "x"),
+            "num_recorded": commitment.num_recorded,
+            "longest_streak": commitment.longest_streak,
+        },
+    }
+
+
+def decode_user(record: dict[str, Any]) -> User:
+    member_id = record["member_id"]
+    fields = record["commitment"]
+    commitment = None
+    if fields is not None:
+        reminder = fields["reminder"]
+        commitment = Commitment(
+            owner_id=member_id,
+            name=fields["name"],
+            description=fields["description"],
+            next_check_in=datetime.fromisoformat(fields["next_check_in"]),
+            recurrence=Recurrence.from_str(fields["recurrence"]),
+            streak=fields["streak"],
+            num_missed_in_a_row=fields["num_missed_in_a_row"],
+            reminder=None if reminder is None else time.fromisoformat(reminder),
+            history=int(fields.get("history", "0"), 16),
+            num_recorded=fields.get("num_recorded", 0),
+            longest_streak=fields.get("longest_streak"),
+        )
+    return User(
+        member_id=member_id,
+        commitment=commitment,
+        is_active=record["is_active"],
+        timezone=to_zone(record["timezone"]),
+    )
+
+
+def _open(backend: str, read_only: bool = True):
+    if backend == "sqlite":
+        # Imported here, pickle and mmap stores don't need the schedule
+        from .database import SqliteUsers
+
+        return SqliteUsers(data.USERS_DB_FILE, read_only=read_only)
+    if os.path.exists(data.USERS_FILE):
+        # Keep the store's format, even when writing to it
+        data.use_snapshot_format(
+            "mmap" if is_snapshot(data.USERS_FILE) else "pickle"
+        )
+    else:
+        data.use_snapshot_format(backend)
+    users = Users(member_id_to_user={})
+    users.load(read_only=read_only)
+    return users
+
+
+def _announcement_channels(users) -> dict[int, int]:
+    if isinstance(users, Users):
+        return users.guild_id_to_channel_id
+    return users.announcement_channels()
+
+
+def _write(users, records: Iterable[User | tuple[int, int]]) -> int:
+    num_users = 0
+    num_stored = len(users.member_id_to_user)
+    for record in records:
+        if isinstance(record, User):
+            users.record(record)
+            num_users += 1
+            if isinstance(users, Users):
+                users.set_num_users(num_stored + num_users)
+            if num_users % IMPORT_BATCH_SIZE == 0:
+                users.flush()
+        else:
+            users.set_announcement_channel(*record)
+    users.flush()
+    return num_users
+
+
+def _line(record: dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _output(path: str | None) -> ContextManager[TextIO]:
+    if path is None:
+        return nullcontext(sys.stdout)
+    return open(path, "w", encoding="utf-8")
+
+
+def _input(path: str | None) -> ContextManager[TextIO]:
+    if path is None:
+        return nullcontext(sys.stdin)
+    return open(path, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
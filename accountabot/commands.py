@@ -1,11 +1,17 @@
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
+from functools import cache
+from typing import Literal
 from typing import Optional
+from zoneinfo import available_timezones
+from zoneinfo import ZoneInfo
+from zoneinfo import ZoneInfoNotFoundError
 
 import discord
 from discord import app_commands
 
+from . import metrics
 from .accountabot import command_tree
 from .data import Commitment
 from .data import get_users
@@ -13,7 +19,21 @@ from .data import Recurrence
 from .data import Timezone
 from .data import User
 from .data import user_time
+from .leaderboard import get_leaderboard
+from .locks import get_user_locks
+from .membership import get_guild_index
+from .message import can_announce_in
+from .message import invalidate_announcement_channel
 from .message import save_and_message_interaction
+from .schedule import get_schedule
+
+
+# Discord shows at most this many autocomplete choices
+MAX_CHOICES = 25
+# Windows the history command shows completion rates for, in days
+HISTORY_WINDOWS = (7, 30, 90, 365)
+# Check ins shown in the history command's calendar, a week per row
+CALENDAR_CHECK_INS = 28
 
 
 def _is_registered(interaction: discord.Interaction) -> bool:
@@ -51,44 +71,77 @@ class _RecurrenceTransformer(app_commands.Transformer):
             raise app_commands.AppCommandError(ex)
 
 
+class _TimezoneTransformer(app_commands.Transformer):
+    async def transform(self, _: discord.Interaction, value: str) -> ZoneInfo:
+        legacy_timezone = Timezone.__members__.get(value.strip().upper())
+        if legacy_timezone is not None:
+            return legacy_timezone.zone
+        try:
+            return ZoneInfo(value.strip())
+        except (ValueError, ZoneInfoNotFoundError):
+            raise app_commands.AppCommandError(
+                f"Unknown timezone '{value}', pick one of the suggestions"
+            )
+
+    async def autocomplete(
+        self, _: discord.Interaction, value: str
+    ) -> list[app_commands.Choice[str]]:
+        query = value.strip().lower().replace(" ", "_")
+        return [
+            app_commands.Choice(name=key, value=key)
+            for key in _zone_keys()
+            if query in key.lower()
+        ][:MAX_CHOICES]
+
+
 @command_tree.error
 async def on_error(
     interaction: discord.Interaction, error: app_commands.AppCommandError
 ):
+    metrics.observe_command(interaction, "error")
     await save_and_message_interaction(interaction, str(error), ephemeral=True)
 
 
 @command_tree.command()
-@app_commands.describe(timezone="Your timezone")
-async def register(interaction: discord.Interaction, timezone: Timezone):
+@app_commands.describe(
+    timezone="Your timezone, e.g. 'America/New_York' or 'Europe/Berlin'"
+)
+async def register(
+    interaction: discord.Interaction,
+    timezone: app_commands.Transform[ZoneInfo, _TimezoneTransformer],
+):
     """Register yourself as a new user, or update your existing profile"""
 
     users = get_users()
     member_id = interaction.user.id
-    if member_id in users.member_id_to_user:
-        user = users.member_id_to_user[member_id]
-        user.timezone = timezone
-        await save_and_message_interaction(
-            interaction, str(user), title="User Updated"
-        )
-    else:
-        new_user = User(
-            member_id=member_id,
-            commitment=None,
-            is_active=True,
-            timezone=timezone,
-        )
-        users.member_id_to_user[member_id] = new_user
-        await save_and_message_interaction(
-            interaction, str(new_user), title="Registered!"
-        )
+    async with get_user_locks().hold(member_id):
+        if member_id in users.member_id_to_user:
+            user = users.member_id_to_user[member_id]
+            user.timezone = timezone
+            title = "User Updated"
+        else:
+            user = User(
+                member_id=member_id,
+                commitment=None,
+                is_active=True,
+                timezone=timezone,
+            )
+            users.member_id_to_user[member_id] = user
+            get_guild_index().add_user(
+                member_id, interaction.user.mutual_guilds
+            )
+            title = "Registered!"
+        _update_user(user)
+        message = str(user)
+    await save_and_message_interaction(interaction, message, title=title)
 
 
 @command_tree.command()
 @app_commands.describe(
     name="What do you want to commit to?",
     description="A brief description of your commitment",
-    recurrence="How often you want your commitment to repeat",
+    recurrence="How often to repeat, e.g. 'daily', 'weekly on Mon, Thu', "
+    "'every 3 days' or 'monthly on day 1'",
     reminder="When to be reminded about your commitment (in format HH:MM AM/PM)",
 )
 @app_commands.check(_is_registered)
@@ -101,30 +154,30 @@ async def commit(
 ):
     """Create a new commitment, or update existing commitment by name"""
 
-    user = get_users().member_id_to_user[interaction.user.id]
-    commitment = user.commitment
-    if commitment:
-        commitment.name = name
-        commitment.description = description
-        commitment.recurrence = recurrence
-        commitment.reminder = reminder
-        await save_and_message_interaction(
-            interaction, str(commitment), title="Commitment updated"
-        )
-    else:
-        user.commitment = Commitment(
-            owner_id=user.member_id,
-            name=name,
-            description=description,
-            next_check_in=_first_check_in(user, recurrence),
-            recurrence=recurrence,
-            streak=0,
-            num_missed_in_a_row=0,
-            reminder=reminder,
-        )
-        await save_and_message_interaction(
-            interaction, str(user.commitment), title="Commitment created!"
-        )
+    async with get_user_locks().hold(interaction.user.id):
+        user = get_users().member_id_to_user[interaction.user.id]
+        commitment = user.commitment
+        if commitment:
+            commitment.name = name
+            commitment.description = description
+            commitment.recurrence = recurrence
+            commitment.reminder = reminder
+            title = "Commitment updated"
+        else:
+            commitment = user.commitment = Commitment(
+                owner_id=user.member_id,
+                name=name,
+                description=description,
+                next_check_in=_first_check_in(user, recurrence),
+                recurrence=recurrence,
+                streak=0,
+                num_missed_in_a_row=0,
+                reminder=reminder,
+            )
+            title = "Commitment created!"
+        _update_user(user)
+        message = str(commitment)
+    await save_and_message_interaction(interaction, message, title=title)
 
 
 @command_tree.command()
@@ -132,27 +185,31 @@ async def commit(
 async def check(interaction: discord.Interaction):
     """Check in your accountability commitment (mark as completed)"""
 
-    user = get_users().member_id_to_user[interaction.user.id]
-    commitment = _get_user_commitment(user)
-    time_until_commitment = commitment.next_check_in - user_time(
-        user, datetime.utcnow()
-    )
-    if time_until_commitment.days >= 1:
-        raise app_commands.AppCommandError(
-            "You aren't supposed to do this commitment yet! "
-            f"Next check in is in {time_until_commitment.days} more day(s)"
+    async with get_user_locks().hold(interaction.user.id):
+        user = get_users().member_id_to_user[interaction.user.id]
+        commitment = _get_user_commitment(user)
+        time_until_commitment = commitment.next_check_in - user_time(
+            user, datetime.utcnow()
         )
+        if time_until_commitment.days >= 1:
+            raise app_commands.AppCommandError(
+                "You aren't supposed to do this commitment yet! "
+                f"Next check in is in {time_until_commitment.days} more day(s)"
+            )
 
-    commitment.cycle_check_in(missed=False)
+        commitment.cycle_check_in(missed=False)
+        _update_user(user)
+        message = str(commitment)
+        streak = commitment.streak
     await save_and_message_interaction(
-        interaction, str(commitment), title="Checked in!"
+        interaction, message, title="Checked in!"
     )
 
-    if commitment.streak % 10 == 0:
+    if streak % 10 == 0:
         await save_and_message_interaction(
             interaction,
             f"<@{user.member_id}>: {commitment.name}",
-            title=f"Streak of {commitment.streak} reached!",
+            title=f"Streak of {streak} reached!",
             mention="@everyone",
         )
 
@@ -162,9 +219,11 @@ async def check(interaction: discord.Interaction):
 async def delete(interaction: discord.Interaction):
     """Delete an accountability commitment"""
 
-    user = get_users().member_id_to_user[interaction.user.id]
-    commitment = _get_user_commitment(user)
-    user.commitment = None
+    async with get_user_locks().hold(interaction.user.id):
+        user = get_users().member_id_to_user[interaction.user.id]
+        commitment = _get_user_commitment(user)
+        user.commitment = None
+        _update_user(user)
     await save_and_message_interaction(
         interaction, str(commitment), title="Deleted commitment"
     )
@@ -181,11 +240,14 @@ async def remind(
 ):
     """Set up or remove a reminder"""
 
-    user = get_users().member_id_to_user[interaction.user.id]
-    commitment = _get_user_commitment(user)
-    commitment.reminder = reminder
+    async with get_user_locks().hold(interaction.user.id):
+        user = get_users().member_id_to_user[interaction.user.id]
+        commitment = _get_user_commitment(user)
+        commitment.reminder = reminder
+        _update_user(user)
+        message = str(commitment)
     await save_and_message_interaction(
-        interaction, str(commitment), title="Commitment updated"
+        interaction, message, title="Commitment updated"
     )
 
 
@@ -200,21 +262,142 @@ async def info(interaction: discord.Interaction):
     )
 
 
+@command_tree.command()
+@app_commands.check(_is_registered)
+async def history(interaction: discord.Interaction):
+    """Show how often you completed your commitment recently"""
+
+    user = get_users().member_id_to_user[interaction.user.id]
+    commitment = _get_user_commitment(user)
+    await save_and_message_interaction(
+        interaction,
+        _history_str(commitment),
+        title=f"History of {commitment.name}",
+    )
+
+
 @command_tree.command(name="toggle-active")
 @app_commands.check(_is_registered)
 async def toggle_active(interaction: discord.Interaction):
     """Toggles your profile between active and inactive"""
 
-    user = get_users().member_id_to_user[interaction.user.id]
-    user.is_active = not user.is_active
-    if user.is_active and user.commitment is not None:
-        commitment = user.commitment
-        commitment.next_check_in = _first_check_in(user, commitment.recurrence)
+    async with get_user_locks().hold(interaction.user.id):
+        user = get_users().member_id_to_user[interaction.user.id]
+        user.is_active = not user.is_active
+        if user.is_active and user.commitment is not None:
+            commitment = user.commitment
+            commitment.next_check_in = _first_check_in(
+                user, commitment.recurrence
+            )
+        _update_user(user)
+        message = str(user)
+    await save_and_message_interaction(
+        interaction, message, title="User activity updated"
+    )
+
+
+@command_tree.command(name="set-channel")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.describe(
+    channel="Where to post announcements, leave empty to pick automatically"
+)
+async def set_channel(
+    interaction: discord.Interaction, channel: Optional[discord.TextChannel]
+):
+    """Choose the channel that announcements are posted in"""
+
+    if channel is not None and not can_announce_in(channel):
+        raise app_commands.AppCommandError(
+            f"I don't have permission to post embeds in {channel.mention}!"
+        )
+    guild_id = interaction.guild_id
+    assert guild_id is not None
+    get_users().set_announcement_channel(
+        guild_id, None if channel is None else channel.id
+    )
+    invalidate_announcement_channel(guild_id)
+    message = (
+        "Announcements will be posted in the first channel I can post in"
+        if channel is None
+        else f"Announcements will be posted in {channel.mention}"
+    )
     await save_and_message_interaction(
-        interaction, str(user), title="User activity updated"
+        interaction, message, title="Announcement channel updated"
     )
 
 
+@command_tree.command()
+@app_commands.guild_only()
+@app_commands.describe(
+    board="Rank by current streak or by misses in a row",
+    page="Which page of the leaderboard to show",
+)
+async def leaderboard(
+    interaction: discord.Interaction,
+    board: Literal["streaks", "misses"] = "streaks",
+    page: app_commands.Range[int, 1] = 1,
+):
+    """Show this server's longest streaks, or longest runs of misses"""
+
+    guild_id = interaction.guild_id
+    assert guild_id is not None
+    leaderboard = get_leaderboard()
+    num_pages = leaderboard.num_pages(guild_id, board)
+    if page > num_pages:
+        raise app_commands.AppCommandError(
+            f"The leaderboard only has {num_pages} page(s)"
+        )
+    entries = leaderboard.page(guild_id, board, page) or "Nobody yet!"
+    rank = leaderboard.rank_of(interaction.user.id, guild_id, board)
+    if rank is not None:
+        entries += f"\n\nYou are #{rank}"
+    await save_and_message_interaction(
+        interaction,
+        entries,
+        title=f"Leaderboard: {board} (page {page}/{num_pages})",
+    )
+
+
+def _update_user(user: User) -> None:
+    get_users().record(user)
+    get_schedule().update(user)
+    get_leaderboard().update(
+        user, get_guild_index().guild_ids_of(user.member_id)
+    )
+
+
+def _history_str(commitment: Commitment) -> str:
+    output_list = []
+    for num_days in HISTORY_WINDOWS:
+        rate = commitment.completion_rate(num_days)
+        rate_str = "No check ins yet" if rate is None else f"{rate:.0%}"
+        output_list.append(f"Last {num_days} days: {rate_str}")
+    output_list += [
+        f"Current streak: {commitment.streak}",
+        f"Longest streak: {commitment.longest_streak}",
+    ]
+    recent = commitment.recent_check_ins(CALENDAR_CHECK_INS)
+    if recent:
+        output_list.append(f"\nLast {len(recent)} check ins (oldest first):")
+        for start in range(0, len(recent), 7):
+            week = recent[start:][:7]
+            output_list.append(
+                "".join(
+                    "\N{LARGE GREEN SQUARE}"
+                    if completed
+                    else "\N{LARGE RED SQUARE}"
+                    for completed in week
+                )
+            )
+    return "\n".join(output_list)
+
+
+@cache
+def _zone_keys() -> list[str]:
+    return sorted(available_timezones())
+
+
 def _first_check_in(user: User, recurrence: Recurrence) -> datetime:
     now = user_time(user, datetime.utcnow())
     midnight = datetime(
@@ -1,22 +1,61 @@
 from __future__ import annotations
 
+import glob
 import os
 import pickle
+import re
+from calendar import monthrange
 from dataclasses import dataclass
+from dataclasses import field
+from datetime import date
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
+from datetime import timezone
 from enum import IntEnum
 from enum import unique
+from time import perf_counter
+from typing import Iterable
+from typing import Iterator
+from typing import MutableMapping
+from zoneinfo import ZoneInfo
+
+from . import metrics
+from . import snapshot as binary_snapshot
+from .journal import Journal
+from .journal import read_journal
+from .writer import WriteBehind
 
 
 USERS_FILE = "users.pkl"
+USERS_JOURNAL_FILE = "users.journal"
+USERS_DB_FILE = "users.db"
+# How USERS_FILE is written, either "pickle" or "mmap" for the memory-mapped
+# format of the snapshot module. Either format is read.
+SNAPSHOT_FORMAT = "pickle"
+SNAPSHOT_FORMATS = ("pickle", "mmap")
+# The journal is compacted into USERS_FILE once it holds at least this many
+# records and at least as many records as there are users
+COMPACTION_MIN_RECORDS = 1000
+# How long shutdown waits for pending writes to reach the disk
+CLOSE_TIMEOUT_SECONDS = 30.0
+# Number of past check ins each commitment remembers the outcome of
+HISTORY_LENGTH = 366
+_HISTORY_MASK = (1 << HISTORY_LENGTH) - 1
+_GUILD_CHANNEL_RECORD = "guild_channel"
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+_ONE_DAY = timedelta(days=1)
+_UTC = timezone.utc
 
 
 @unique
 class Repetition(IntEnum):
     DAILY = 0
     WEEKLY = 1
+    INTERVAL = 2
+    TIMES_PER_WEEK = 3
+    MONTHLY = 4
 
 
 @unique
@@ -32,6 +71,12 @@ class Weekday(IntEnum):
 
 @unique
 class Timezone(IntEnum):
+    """Fixed UTC offsets that users registered with before IANA zones
+
+    Kept so that old users can be loaded, they are migrated to the IANA zone
+    of the same name.
+    """
+
     HST = -10
     AKST = -9
     PST = -8
@@ -39,25 +84,116 @@ class Timezone(IntEnum):
     CST = -6
     EST = -5
 
+    @property
+    def zone(self) -> ZoneInfo:
+        return ZoneInfo(_legacy_timezone_to_zone_key[self])
+
+
+_legacy_timezone_to_zone_key = {
+    Timezone.HST: "Pacific/Honolulu",
+    Timezone.AKST: "America/Anchorage",
+    Timezone.PST: "America/Los_Angeles",
+    Timezone.MST: "America/Denver",
+    Timezone.CST: "America/Chicago",
+    Timezone.EST: "America/New_York",
+}
+
 
-@dataclass
 class Recurrence:
-    def __init__(self, repetition: Repetition, weekdays: list[Weekday] = []):
-        self.repetition = repetition
-        self.weekdays = weekdays
+    """How often a commitment repeats
+
+    Recurrences are immutable and interned, so every commitment with the same
+    schedule shares one instance. Each one is compiled once into a 7-bit
+    weekday mask (Monday in the lowest bit) and a row of days until the next
+    occurence for each weekday, so stepping is a table lookup.
+
+    The parameter is the number of days for INTERVAL, the number of times per
+    week for TIMES_PER_WEEK and the day of the month for MONTHLY.
+    """
+
+    __slots__ = ("repetition", "weekday_mask", "parameter", "_days_until")
+
+    repetition: Repetition
+    weekday_mask: int
+    parameter: int
+    _days_until: tuple[int, ...]
+
+    def __new__(
+        cls,
+        repetition: Repetition | None = None,
+        weekdays: Iterable[Weekday] = (),
+        parameter: int = 0,
+    ) -> Recurrence:
+        if repetition is None:
+            # Unpickling a recurrence saved before recurrences were interned
+            return super().__new__(cls)
+        weekday_mask = _to_weekday_mask(weekdays)
+        if repetition == Repetition.WEEKLY and not weekday_mask:
+            raise ValueError("A weekly recurrence needs at least one weekday")
+        low, high = _parameter_bounds.get(repetition, (0, 0))
+        if not low <= parameter <= high:
+            form, name = _parameter_forms[repetition]
+            raise ValueError(f"'{form}' needs {name} between {low} and {high}")
+        return _intern_recurrence(repetition, weekday_mask, parameter)
+
+    @property
+    def weekdays(self) -> list[Weekday]:
+        return [
+            weekday
+            for weekday in Weekday
+            if self.weekday_mask & (1 << weekday.value)
+        ]
 
     def next_occurence(self, dt: datetime) -> datetime:
-        dt.month
-        repetition_to_num_days = {
-            Repetition.DAILY: 1,
-            Repetition.WEEKLY: _days_until_valid_weekday(dt, self.weekdays),
-        }
-        return dt + timedelta(days=repetition_to_num_days[self.repetition])
+        if self.repetition == Repetition.MONTHLY:
+            month_index = self._num_monthly_occurences(dt.date()) + 1
+            return datetime.combine(
+                self._monthly_occurence(month_index), dt.time()
+            )
+        return dt + timedelta(days=self._days_until[dt.weekday()])
+
+    def num_occurences_until(self, dt: datetime, end: datetime) -> int:
+        """Number of occurences after dt, up to and including end"""
+        num_days = (end - dt) // _ONE_DAY
+        if num_days <= 0:
+            return 0
+        if self.repetition == Repetition.INTERVAL:
+            return num_days // self.parameter
+        if self.repetition == Repetition.MONTHLY:
+            last = dt.date() + timedelta(days=num_days)
+            return self._num_monthly_occurences(
+                last
+            ) - self._num_monthly_occurences(dt.date())
+        num_weeks, num_extra_days = divmod(num_days, 7)
+        following = _rotate_weekday_mask(self.weekday_mask, dt.weekday() + 1)
+        num_extra_occurences = (
+            following & ((1 << num_extra_days) - 1)
+        ).bit_count()
+        return num_weeks * self.weekday_mask.bit_count() + num_extra_occurences
+
+    def next_occurence_after(self, dt: datetime, end: datetime) -> datetime:
+        """First occurence following dt that is later than end"""
+        if self.repetition == Repetition.INTERVAL:
+            num_occurences = self.num_occurences_until(dt, end)
+            return dt + timedelta(days=(num_occurences + 1) * self.parameter)
+        num_days = max((end - dt) // _ONE_DAY, 0)
+        return self.next_occurence(dt + timedelta(days=num_days))
 
     @classmethod
     def from_str(cls, value: str) -> Recurrence:
         recurrence_str = value.lower()
-        if "daily" in recurrence_str:
+        if match := re.search(r"every (\d+) days?", recurrence_str):
+            num_days = int(match[1])
+            if num_days == 1:
+                return cls(Repetition.DAILY)
+            return cls(Repetition.INTERVAL, parameter=num_days)
+        elif match := re.search(r"(\d+) times? (?:per|a) week", recurrence_str):
+            return cls(Repetition.TIMES_PER_WEEK, parameter=int(match[1]))
+        elif match := re.search(
+            r"monthly on (?:the )?(?:day )?(\d+)", recurrence_str
+        ):
+            return cls(Repetition.MONTHLY, parameter=int(match[1]))
+        elif "daily" in recurrence_str:
             return cls(Repetition.DAILY)
         elif "weekly" in recurrence_str:
             weekdays = []
@@ -72,29 +208,151 @@ class Recurrence:
             return cls(Repetition.WEEKLY, weekdays)
         else:
             raise ValueError(
-                "'daily' or 'weekly' must be specified in recurrence"
+                "'daily', 'weekly', 'every N days', 'N times per week' or "
+                "'monthly on day D' must be specified in recurrence"
             )
 
+    def _num_monthly_occurences(self, day: date) -> int:
+        """Index of the last month whose occurence is on or before day"""
+        month_index = day.year * 12 + day.month - 1
+        if day.day < self._monthly_occurence(month_index).day:
+            return month_index - 1
+        return month_index
+
+    def _monthly_occurence(self, month_index: int) -> date:
+        year, month = divmod(month_index, 12)
+        num_days_in_month = monthrange(year, month + 1)[1]
+        return date(year, month + 1, min(self.parameter, num_days_in_month))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Recurrence):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __reduce__(self):
+        return _intern_recurrence, (
+            int(self.repetition),
+            self.weekday_mask,
+            self.parameter,
+        )
+
+    def __setstate__(self, state: dict) -> None:
+        recurrence = _intern_recurrence(
+            state["repetition"], _to_weekday_mask(state.get("weekdays", ()))
+        )
+        for name in Recurrence.__slots__:
+            setattr(self, name, getattr(recurrence, name))
+
+    @classmethod
+    def from_mask(
+        cls, repetition: int, weekday_mask: int, parameter: int = 0
+    ) -> Recurrence:
+        """The recurrence with these compiled fields, as stored in snapshots"""
+        return _intern_recurrence(repetition, weekday_mask, parameter)
+
+    def _key(self) -> tuple[Repetition, int, int]:
+        return self.repetition, self.weekday_mask, self.parameter
+
+    def __repr__(self) -> str:
+        if self.parameter:
+            return (
+                f"Recurrence({self.repetition!r}, parameter={self.parameter})"
+            )
+        return f"Recurrence({self.repetition!r}, {self.weekdays!r})"
+
     def __str__(self) -> str:
+        weekdays = ", ".join(weekday.name.title() for weekday in self.weekdays)
         if self.repetition == Repetition.DAILY:
             return "daily"
+        elif self.repetition == Repetition.INTERVAL:
+            return f"every {self.parameter} days"
+        elif self.repetition == Repetition.TIMES_PER_WEEK:
+            # The days are fixed, so users know when their check ins are due
+            return f"{self.parameter} times per week, on {weekdays}"
+        elif self.repetition == Repetition.MONTHLY:
+            return f"monthly on day {self.parameter}"
         else:
-            weekdays = ", ".join(
-                weekday.name.title() for weekday in self.weekdays
-            )
             return f"weekly on {weekdays}"
 
 
-@dataclass
 class Commitment:
-    owner_id: int
-    name: str
-    description: str
-    next_check_in: datetime
-    recurrence: Recurrence
-    streak: int
-    num_missed_in_a_row: int
-    reminder: time | None
+    """A user's commitment
+
+    Check-in times are kept as whole seconds since the epoch and reminders as
+    seconds since midnight, both in the owner's local time.
+
+    The outcomes of the last HISTORY_LENGTH check ins are kept as bits of
+    history, most recent in the lowest bit and set when completed. Each check
+    in shifts the oldest one out, so the history never grows.
+    """
+
+    __slots__ = (
+        "owner_id",
+        "name",
+        "description",
+        "_next_check_in",
+        "recurrence",
+        "streak",
+        "num_missed_in_a_row",
+        "_reminder",
+        "history",
+        "num_recorded",
+        "longest_streak",
+    )
+
+    def __init__(
+        self,
+        owner_id: int,
+        name: str,
+        description: str,
+        next_check_in: datetime,
+        recurrence: Recurrence,
+        streak: int,
+        num_missed_in_a_row: int,
+        reminder: time | None,
+        history: int = 0,
+        num_recorded: int = 0,
+        longest_streak: int | None = None,
+    ):
+        self.owner_id = owner_id
+        self.name = name
+        self.description = description
+        self.next_check_in = next_check_in
+        self.recurrence = recurrence
+        self.streak = streak
+        self.num_missed_in_a_row = num_missed_in_a_row
+        self.reminder = reminder
+        self.history = history
+        self.num_recorded = num_recorded
+        self.longest_streak = (
+            streak if longest_streak is None else max(longest_streak, streak)
+        )
+
+    @property
+    def next_check_in(self) -> datetime:
+        return _EPOCH + timedelta(seconds=self._next_check_in)
+
+    @next_check_in.setter
+    def next_check_in(self, value: datetime) -> None:
+        self._next_check_in = (value - _EPOCH) // _ONE_SECOND
+
+    @property
+    def reminder(self) -> time | None:
+        if self._reminder is None:
+            return None
+        minutes, seconds = divmod(self._reminder, 60)
+        return time(minutes // 60, minutes % 60, seconds)
+
+    @reminder.setter
+    def reminder(self, value: time | None) -> None:
+        self._reminder = (
+            None
+            if value is None
+            else value.hour * 3600 + value.minute * 60 + value.second
+        )
 
     def cycle_check_in(self, missed: bool) -> None:
         if missed:
@@ -103,8 +361,98 @@ class Commitment:
         else:
             self.streak += 1
             self.num_missed_in_a_row = 0
+            self.longest_streak = max(self.longest_streak, self.streak)
+        self._record(1, completed=not missed)
         self.next_check_in = self.recurrence.next_occurence(self.next_check_in)
 
+    def catch_up(self, now: datetime) -> int:
+        """Miss every check in up to now in one step
+
+        Equivalent to calling cycle_check_in(missed=True) until the next check
+        in is after now. Returns the number of check ins missed.
+        """
+        if now < self.next_check_in:
+            return 0
+        next_check_in = self.next_check_in
+        num_missed = 1 + self.recurrence.num_occurences_until(
+            next_check_in, now
+        )
+        self.streak = 0
+        self.num_missed_in_a_row += num_missed
+        self._record(num_missed, completed=False)
+        self.next_check_in = self.recurrence.next_occurence_after(
+            next_check_in, now
+        )
+        return num_missed
+
+    def recent_check_ins(self, num_check_ins: int) -> list[bool]:
+        """Whether each of the last check ins was completed, oldest first"""
+        num_check_ins = min(num_check_ins, self.num_recorded)
+        return [
+            bool(self.history >> i & 1) for i in reversed(range(num_check_ins))
+        ]
+
+    def completion_rate(self, num_days: int) -> float | None:
+        """Fraction of the check ins of the last num_days that were completed
+
+        The window ends at the last recorded check in. None when there were
+        no check ins in it.
+        """
+        num_check_ins = min(
+            self.recurrence.num_occurences_until(
+                self.next_check_in - timedelta(days=num_days),
+                self.next_check_in,
+            ),
+            self.num_recorded,
+        )
+        if not num_check_ins:
+            return None
+        completed = self.history & ((1 << num_check_ins) - 1)
+        return completed.bit_count() / num_check_ins
+
+    def _record(self, num_check_ins: int, completed: bool) -> None:
+        history = self.history << num_check_ins
+        if completed:
+            history |= (1 << num_check_ins) - 1
+        self.history = history & _HISTORY_MASK
+        self.num_recorded = min(
+            self.num_recorded + num_check_ins, HISTORY_LENGTH
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Commitment):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state: tuple | dict) -> None:
+        if isinstance(state, dict):
+            # Commitments pickled before __slots__ was introduced
+            self.__init__(**state)
+            self.recurrence = Recurrence(
+                state["recurrence"].repetition, state["recurrence"].weekdays
+            )
+            return
+        if len(state) < len(self.__slots__):
+            # Commitments pickled before the check in history was kept
+            state = (*state, 0, 0, state[5])
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __repr__(self) -> str:
+        return (
+            f"Commitment(owner_id={self.owner_id!r}, name={self.name!r}, "
+            f"description={self.description!r}, "
+            f"next_check_in={self.next_check_in!r}, "
+            f"recurrence={self.recurrence!r}, streak={self.streak!r}, "
+            f"num_missed_in_a_row={self.num_missed_in_a_row!r}, "
+            f"reminder={self.reminder!r}, history={self.history!r}, "
+            f"num_recorded={self.num_recorded!r}, "
+            f"longest_streak={self.longest_streak!r})"
+        )
+
     def __str__(self) -> str:
         output_list = [
             f"{self.name}:",
@@ -118,17 +466,35 @@ class Commitment:
         return "\n".join(output_list)
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     member_id: int
     commitment: Commitment | None
     is_active: bool
-    timezone: Timezone
+    timezone: ZoneInfo
+
+    def __post_init__(self) -> None:
+        self.timezone = to_zone(self.timezone)
+
+    def __getstate__(self) -> tuple:
+        return (self.member_id, self.commitment, self.is_active, self.timezone)
+
+    def __setstate__(self, state: tuple | dict) -> None:
+        if isinstance(state, dict):
+            # Users pickled before __slots__ was introduced
+            state = tuple(state[name] for name in _USER_FIELDS)
+        (
+            self.member_id,
+            self.commitment,
+            self.is_active,
+            zone,
+        ) = state
+        self.timezone = to_zone(zone)
 
     def __str__(self) -> str:
         active = "Active" if self.is_active else "Inactive"
         output_list = [
-            f"<@{self.member_id}> [{active}] (Timezone: {self.timezone.name})\n",
+            f"<@{self.member_id}> [{active}] (Timezone: {self.timezone.key})\n",
             "\n".rjust(50, "-"),
             "No commitment"
             if self.commitment is None
@@ -137,27 +503,416 @@ class User:
         return "".join(output_list)
 
 
+_USER_FIELDS = ("member_id", "commitment", "is_active", "timezone")
+
+
 @dataclass
 class Users:
-    member_id_to_user: dict[int, User]
+    member_id_to_user: MutableMapping[int, User]
+    guild_id_to_channel_id: dict[int, int] = field(default_factory=dict)
+    _dirty: dict[int, User] = field(default_factory=dict, repr=False)
+    _dirty_guilds: dict[int, int | None] = field(
+        default_factory=dict, repr=False
+    )
+    _journal: Journal = field(
+        default_factory=lambda: Journal(USERS_JOURNAL_FILE), repr=False
+    )
+    _writer: WriteBehind[bytes] | None = field(default=None, repr=False)
+    _num_users: int = field(default=0, repr=False)
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self._dirty or self._dirty_guilds)
+
+    def record(self, user: User) -> None:
+        self._dirty[user.member_id] = user
+
+    def set_announcement_channel(
+        self, guild_id: int, channel_id: int | None
+    ) -> None:
+        if channel_id is None:
+            self.guild_id_to_channel_id.pop(guild_id, None)
+        else:
+            self.guild_id_to_channel_id[guild_id] = channel_id
+        self._dirty_guilds[guild_id] = channel_id
 
-    def save(self) -> None:
-        with open(USERS_FILE, "wb") as f:
-            pickle.dump(self.member_id_to_user, f)
+    def set_num_users(self, num_users: int) -> None:
+        """Users in the store when they aren't all kept in memory, e.g.
+        during an import, which the journal is compacted at"""
+        self._num_users = max(self._num_users, num_users)
 
-    def load(self) -> None:
-        if not os.path.exists(USERS_FILE):
+    def save(self) -> None:
+        if not self.is_dirty:
             return
-        with open(USERS_FILE, "rb") as f:
-            self.member_id_to_user = pickle.load(f)
+        start = perf_counter()
+        records = [(member_id, user) for member_id, user in self._dirty.items()]
+        records += [
+            (_GUILD_CHANNEL_RECORD, guild_id, channel_id)
+            for guild_id, channel_id in self._dirty_guilds.items()
+        ]
+        self._dirty.clear()
+        self._dirty_guilds.clear()
+        # Imports count the users they record with set_num_users
+        self._num_users = max(self._num_users, len(self.member_id_to_user))
+        if self._writer is None:
+            self._writer = WriteBehind(self._write, name="users-writer")
+        self._writer.submit(
+            pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            for record in records
+        )
+        metrics.USERS_SAVE_SECONDS.observe(perf_counter() - start)
+
+    def flush(self) -> None:
+        self.save()
+        if self._writer is not None:
+            self._writer.flush(CLOSE_TIMEOUT_SECONDS)
+
+    def load(self, read_only: bool = False) -> None:
+        """Read the snapshot and replay the journal over it
+
+        A normal load first repairs the files for writing: it merges a
+        rotated journal, converts the snapshot to SNAPSHOT_FORMAT and drops
+        a partial record at the end of the journal. A read only load leaves
+        the files as they are, for tools that only look at the store.
+        """
+        self.flush()
+        start = perf_counter()
+        if read_only:
+            snapshot = _read_snapshot()
+            for path in [self._journal.rotated_path, self._journal.path]:
+                if os.path.exists(path):
+                    for record in read_journal(path):
+                        _apply_record(snapshot, record)
+        else:
+            snapshot = self._repair_and_replay()
+        self.member_id_to_user = snapshot.member_id_to_user
+        self.guild_id_to_channel_id = snapshot.guild_id_to_channel_id
+        metrics.USERS_LOAD_SECONDS.observe(perf_counter() - start)
+        metrics.USERS_LOADED_BYTES.set(
+            _file_size(USERS_FILE) + _file_size(self._journal.path)
+        )
+
+    def compact(self) -> None:
+        """Merge the journal into USERS_FILE, written in SNAPSHOT_FORMAT"""
+        self.flush()
+        self._journal.close()
+        if os.path.exists(self._journal.path):
+            self._compact_journal()
+
+    def index_entries(self) -> Iterator[IndexEntry]:
+        """Index entries of every loaded user
+
+        Those of a mapped snapshot are read from its index columns, without
+        decoding the users.
+        """
+        member_id_to_user = self.member_id_to_user
+        if isinstance(member_id_to_user, binary_snapshot.LazyUsers):
+            return member_id_to_user.index_entries()
+        return map(index_entry, member_id_to_user.values())
+
+    def scan(self) -> Iterator[User]:
+        """Every loaded user, without decoding a mapped snapshot all at once"""
+        member_id_to_user = self.member_id_to_user
+        if isinstance(member_id_to_user, binary_snapshot.LazyUsers):
+            return member_id_to_user.scan()
+        return iter(member_id_to_user.values())
+
+    def close(self) -> None:
+        self.save()
+        if self._writer is not None:
+            self._writer.close(CLOSE_TIMEOUT_SECONDS)
+            self._writer = None
+        self._journal.close()
+
+    def _write(self, records: list[bytes]) -> None:
+        start = perf_counter()
+        self._journal.write(records)
+        num_records = len(self._journal)
+        if (
+            num_records >= COMPACTION_MIN_RECORDS
+            and num_records >= self._num_users
+        ):
+            self._compact_journal()
+        metrics.USERS_WRITE_SECONDS.observe(perf_counter() - start)
+        metrics.USERS_WRITTEN_BYTES.inc(amount=sum(map(len, records)))
+
+    def _compact_journal(self) -> None:
+        rotated_path = self._journal.rotated_path
+        # Records of a compaction that failed part way would be overwritten
+        # by rotating again, so they are merged first
+        if os.path.exists(rotated_path):
+            _compact_journal(rotated_path)
+        _compact_journal(self._journal.rotate())
+
+    def _repair_and_replay(self) -> _Snapshot:
+        if os.path.exists(self._journal.rotated_path):
+            _compact_journal(self._journal.rotated_path)
+        snapshot = _read_snapshot()
+        if (
+            os.path.exists(USERS_FILE)
+            and _snapshot_format(USERS_FILE) != SNAPSHOT_FORMAT
+        ):
+            _write_snapshot(snapshot)
+            snapshot = _read_snapshot()
+        for record in self._journal.replay():
+            _apply_record(snapshot, record)
+        return snapshot
+
+
+@dataclass
+class _Snapshot:
+    member_id_to_user: MutableMapping[int, User] = field(default_factory=dict)
+    guild_id_to_channel_id: dict[int, int] = field(default_factory=dict)
 
 
 def get_users():
     return _users
 
 
+def set_users(users) -> None:
+    global _users
+    _users = users
+
+
+def use_partition(name: str) -> None:
+    """Keep this process's users in their own set of files
+
+    Used when several processes each run a subset of the bot's shards. Each
+    process checks in every user of its store, so they can't share one, and
+    a member of guilds served by different processes has a separate user in
+    each of them.
+    """
+    global USERS_FILE, USERS_JOURNAL_FILE, USERS_DB_FILE, _users
+    USERS_FILE = partition_path(USERS_FILE, name)
+    USERS_JOURNAL_FILE = partition_path(USERS_JOURNAL_FILE, name)
+    USERS_DB_FILE = partition_path(USERS_DB_FILE, name)
+    _users = Users(member_id_to_user={})
+
+
+def use_snapshot_format(format: str) -> None:
+    """Write USERS_FILE in format from now on
+
+    An existing snapshot in the other format is rewritten on the next load.
+    """
+    global SNAPSHOT_FORMAT
+    if format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format '{format}'")
+    SNAPSHOT_FORMAT = format
+
+
+def convert_snapshot(source: str, destination: str, format: str) -> None:
+    """Write the snapshot in source, of either format, to destination"""
+    if format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format '{format}'")
+    _write_snapshot(_read_snapshot(source), destination, format)
+
+
+def partition_path(path: str, name: str) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}.{name}{extension}"
+
+
+def shard_partition(shard_ids: list[int], shard_count: int) -> str:
+    """Partition of a process running shard_ids out of shard_count shards"""
+    return f"shards-{'-'.join(map(str, shard_ids))}-of-{shard_count}"
+
+
+def other_layout_files(partition: str | None) -> list[str]:
+    """User files kept under a shard layout that overlaps the partition's
+
+    Their users may be in guilds the partition's process now serves, which
+    would start without them. Call before use_partition.
+    """
+    layout = _shard_layout(partition)
+    paths = []
+    for path in [USERS_FILE, USERS_JOURNAL_FILE, USERS_DB_FILE]:
+        root, extension = os.path.splitext(path)
+        start = len(root) + 1
+        pattern = f"{glob.escape(root)}.*{extension}"
+        for other_path in sorted(glob.glob(pattern)):
+            end = len(other_path) - len(extension)
+            if _overlaps(layout, _shard_layout(other_path[start:end])):
+                paths.append(other_path)
+        if partition is not None and os.path.exists(path):
+            paths.append(path)
+    return paths
+
+
+class Clock:
+    """Local times of one UTC instant, computed once per zone"""
+
+    def __init__(self, utc_now: datetime):
+        self.utc_now = utc_now
+        self._zone_to_now: dict[ZoneInfo, datetime] = {}
+
+    def now(self, zone: ZoneInfo) -> datetime:
+        local_now = self._zone_to_now.get(zone)
+        if local_now is None:
+            local_now = self._zone_to_now[zone] = _to_local(self.utc_now, zone)
+        return local_now
+
+    def user_now(self, user: User) -> datetime:
+        return self.now(user.timezone)
+
+
+def to_zone(value: ZoneInfo | Timezone | int | str) -> ZoneInfo:
+    """IANA zone of a zone name, or of a legacy Timezone or its value"""
+    if isinstance(value, ZoneInfo):
+        return value
+    if isinstance(value, str):
+        return ZoneInfo(value)
+    return Timezone(value).zone
+
+
 def user_time(user: User, dt: datetime):
-    return dt + timedelta(hours=user.timezone.value)
+    return _to_local(dt, user.timezone)
+
+
+def utc_time(user: User, dt: datetime):
+    """UTC time of a local time of the user
+
+    Times skipped by a DST transition are read with the offset from before it
+    and repeated times as their first occurence, as in PEP 495.
+    """
+    return (
+        dt.replace(tzinfo=user.timezone).astimezone(_UTC).replace(tzinfo=None)
+    )
+
+
+@dataclass(slots=True)
+class IndexEntry:
+    """What the schedule and the leaderboard index a user by
+
+    Users without an active commitment have no check in or reminder and are
+    not ranked, so their streak and misses in a row are 0.
+    """
+
+    member_id: int
+    check_in_at: datetime | None = None
+    reminder_at: datetime | None = None
+    streak: int = 0
+    num_missed_in_a_row: int = 0
+
+
+def index_entry(user: User) -> IndexEntry:
+    check_in_at = next_check_in_utc(user)
+    if check_in_at is None:
+        return IndexEntry(user.member_id)
+    commitment = user.commitment
+    assert commitment is not None
+    return IndexEntry(
+        user.member_id,
+        check_in_at,
+        next_reminder_utc(user),
+        commitment.streak,
+        commitment.num_missed_in_a_row,
+    )
+
+
+def next_check_in_utc(user: User) -> datetime | None:
+    commitment = user.commitment
+    if not user.is_active or commitment is None:
+        return None
+    return utc_time(user, commitment.next_check_in)
+
+
+def next_reminder_utc(user: User) -> datetime | None:
+    commitment = user.commitment
+    if not user.is_active or commitment is None or commitment.reminder is None:
+        return None
+    reminder_at = datetime.combine(
+        commitment.next_check_in.date(), commitment.reminder
+    )
+    return utc_time(user, reminder_at).replace(second=0, microsecond=0)
+
+
+def _to_local(dt: datetime, zone: ZoneInfo) -> datetime:
+    return dt.replace(tzinfo=_UTC).astimezone(zone).replace(tzinfo=None)
+
+
+def _shard_layout(partition: str | None) -> tuple[int, frozenset[int]] | None:
+    """Shard count and ids of a partition, (0, {}) for unknown partitions"""
+    if partition is None:
+        return None
+    match = _SHARD_PARTITION.fullmatch(partition)
+    if match is None:
+        return 0, frozenset()
+    shard_ids = frozenset(map(int, match[1].split("-")))
+    return int(match[2]), shard_ids
+
+
+def _overlaps(
+    layout: tuple[int, frozenset[int]] | None,
+    other: tuple[int, frozenset[int]] | None,
+) -> bool:
+    if layout is None or other is None:
+        return layout != other
+    if layout == other:
+        return False
+    return layout[0] != other[0] or bool(layout[1] & other[1])
+
+
+def _read_snapshot(path: str | None = None) -> _Snapshot:
+    path = path or USERS_FILE
+    if not os.path.exists(path):
+        return _Snapshot()
+    if _snapshot_format(path) == "mmap":
+        return _Snapshot(*binary_snapshot.read_snapshot(path))
+    with open(path, "rb") as f:
+        snapshot = pickle.load(f)
+    # Snapshots written before guild settings existed only hold the users
+    if isinstance(snapshot, dict):
+        return _Snapshot(member_id_to_user=snapshot)
+    return snapshot
+
+
+def _write_snapshot(
+    snapshot: _Snapshot, path: str | None = None, format: str | None = None
+) -> None:
+    path = path or USERS_FILE
+    if (format or SNAPSHOT_FORMAT) == "mmap":
+        binary_snapshot.write_snapshot(
+            path, snapshot.member_id_to_user, snapshot.guild_id_to_channel_id
+        )
+        return
+    # Users of a memory-mapped snapshot are only decoded when accessed
+    snapshot = _Snapshot(
+        dict(snapshot.member_id_to_user), snapshot.guild_id_to_channel_id
+    )
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+def _snapshot_format(path: str) -> str:
+    return "mmap" if binary_snapshot.is_snapshot(path) else "pickle"
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _apply_record(snapshot: _Snapshot, record: tuple) -> None:
+    if record[0] == _GUILD_CHANNEL_RECORD:
+        _, guild_id, channel_id = record
+        if channel_id is None:
+            snapshot.guild_id_to_channel_id.pop(guild_id, None)
+        else:
+            snapshot.guild_id_to_channel_id[guild_id] = channel_id
+    else:
+        member_id, user = record
+        snapshot.member_id_to_user[member_id] = user
+
+
+def _compact_journal(journal_file: str) -> None:
+    snapshot = _read_snapshot()
+    for record in read_journal(journal_file):
+        _apply_record(snapshot, record)
+    _write_snapshot(snapshot)
+    os.remove(journal_file)
 
 
 _users = Users(member_id_to_user={})
@@ -174,13 +929,82 @@ _abbreviation_to_weekday: dict[str, Weekday] = {
 }
 
 
-def _days_until_valid_weekday(
-    dt: datetime, valid_weekdays: list[Weekday]
-) -> int:
-    if not valid_weekdays:
-        return -1
-    current_weekday = dt.weekday()
-    days = 1
-    while (current_weekday := (current_weekday + 1) % 7) not in valid_weekdays:
-        days += 1
-    return days
+_SHARD_PARTITION = re.compile(r"shards-(\d+(?:-\d+)*)-of-(\d+)")
+_parameter_bounds: dict[Repetition, tuple[int, int]] = {
+    Repetition.INTERVAL: (1, 366),
+    Repetition.TIMES_PER_WEEK: (1, 7),
+    Repetition.MONTHLY: (1, 31),
+}
+# How users write the recurrences with a parameter, and its name there
+_parameter_forms: dict[Repetition, tuple[str, str]] = {
+    Repetition.INTERVAL: ("every N days", "N"),
+    Repetition.TIMES_PER_WEEK: ("N times per week", "N"),
+    Repetition.MONTHLY: ("monthly on day D", "D"),
+}
+_ALL_WEEKDAYS_MASK = 0b1111111
+
+
+def _build_days_until_table() -> tuple[tuple[int, ...], ...]:
+    """Days from each weekday until the next weekday in each weekday mask
+
+    An empty mask waits a full week rather than moving backwards.
+    """
+    return tuple(
+        tuple(
+            next(
+                (
+                    days
+                    for days in range(1, 8)
+                    if mask & (1 << (weekday + days) % 7)
+                ),
+                7,
+            )
+            for weekday in range(7)
+        )
+        for mask in range(_ALL_WEEKDAYS_MASK + 1)
+    )
+
+
+_DAYS_UNTIL = _build_days_until_table()
+_recurrences: dict[tuple[Repetition, int, int], Recurrence] = {}
+
+
+def _intern_recurrence(
+    repetition: int, weekday_mask: int, parameter: int = 0
+) -> Recurrence:
+    repetition = Repetition(repetition)
+    if repetition == Repetition.DAILY:
+        weekday_mask = _ALL_WEEKDAYS_MASK
+    elif repetition == Repetition.TIMES_PER_WEEK:
+        # Spread the days as evenly as possible across the week
+        weekday_mask = sum(1 << i * 7 // parameter for i in range(parameter))
+    elif repetition != Repetition.WEEKLY:
+        weekday_mask = 0
+    key = (repetition, weekday_mask, parameter)
+    recurrence = _recurrences.get(key)
+    if recurrence is None:
+        recurrence = object.__new__(Recurrence)
+        (
+            recurrence.repetition,
+            recurrence.weekday_mask,
+            recurrence.parameter,
+        ) = key
+        if repetition == Repetition.INTERVAL:
+            recurrence._days_until = (parameter,) * 7
+        else:
+            recurrence._days_until = _DAYS_UNTIL[weekday_mask]
+        _recurrences[key] = recurrence
+    return recurrence
+
+
+def _to_weekday_mask(weekdays: Iterable[Weekday]) -> int:
+    mask = 0
+    for weekday in weekdays:
+        mask |= 1 << weekday
+    return mask
+
+
+def _rotate_weekday_mask(mask: int, num_days: int) -> int:
+    """Rotate mask so the bit of weekday num_days % 7 is the lowest"""
+    num_days %= 7
+    return ((mask >> num_days) | (mask << (7 - num_days))) & _ALL_WEEKDAYS_MASK
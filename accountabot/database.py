@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import os
+import pathlib
+import sqlite3
+from datetime import datetime
+from datetime import time
+from datetime import timedelta
+from time import perf_counter
+from typing import Iterable
+from typing import Iterator
+from zoneinfo import ZoneInfo
+
+from . import data
+from . import metrics
+from .data import Commitment
+from .data import index_entry
+from .data import IndexEntry
+from .data import Recurrence
+from .data import set_users
+from .data import to_zone
+from .data import User
+from .data import Users
+from .schedule import next_check_in_utc
+from .schedule import next_reminder_utc
+from .schedule import set_schedule
+from .writer import WriteBehind
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    member_id INTEGER PRIMARY KEY,
+    is_active INTEGER NOT NULL,
+    timezone TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commitments (
+    owner_id INTEGER PRIMARY KEY
+        REFERENCES users (member_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    next_check_in TEXT NOT NULL,
+    recurrence TEXT NOT NULL,
+    streak INTEGER NOT NULL,
+    num_missed_in_a_row INTEGER NOT NULL,
+    reminder TEXT,
+    next_check_in_utc INTEGER,
+    next_reminder_utc INTEGER,
+    history BLOB NOT NULL DEFAULT x'',
+    num_recorded INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS commitments_next_check_in_utc
+    ON commitments (next_check_in_utc);
+CREATE INDEX IF NOT EXISTS commitments_next_reminder_utc
+    ON commitments (next_reminder_utc);
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id INTEGER PRIMARY KEY,
+    announcement_channel_id INTEGER
+);
+"""
+# Columns added to commitments after its creation, with their definitions
+_ADDED_COLUMNS = {
+    "history": "BLOB NOT NULL DEFAULT x''",
+    "num_recorded": "INTEGER NOT NULL DEFAULT 0",
+    "longest_streak": "INTEGER NOT NULL DEFAULT 0",
+}
+_EPOCH = datetime(1970, 1, 1)
+_Statement = tuple[str, tuple]
+
+
+class SqliteUsers:
+    """User store backed by SQLite with one row per user and commitment
+
+    All users are kept in memory for the command handlers. Upserts for changed
+    users and guilds are built on save and executed by a background writer
+    with its own connection, so the event loop only ever reads from the
+    database.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self.member_id_to_user: dict[int, User] = {}
+        self.guild_id_to_channel_id: dict[int, int] = {}
+        self._dirty: dict[int, User] = {}
+        self._dirty_guilds: dict[int, int | None] = {}
+        self._connection: sqlite3.Connection | None = None
+        self._writer_connection: sqlite3.Connection | None = None
+        self._writer: WriteBehind[_Statement] | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.read_only:
+                self._connection = _connect_read_only(self.path)
+            else:
+                self._connection = _connect(self.path)
+        return self._connection
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self._dirty or self._dirty_guilds)
+
+    def record(self, user: User) -> None:
+        self._dirty[user.member_id] = user
+
+    def set_announcement_channel(
+        self, guild_id: int, channel_id: int | None
+    ) -> None:
+        if channel_id is None:
+            self.guild_id_to_channel_id.pop(guild_id, None)
+        else:
+            self.guild_id_to_channel_id[guild_id] = channel_id
+        self._dirty_guilds[guild_id] = channel_id
+
+    def save(self) -> None:
+        if not self.is_dirty:
+            return
+        start = perf_counter()
+        statements = [
+            statement
+            for user in self._dirty.values()
+            for statement in _user_statements(user)
+        ]
+        statements += [
+            _guild_statement(guild_id, channel_id)
+            for guild_id, channel_id in self._dirty_guilds.items()
+        ]
+        self._dirty.clear()
+        self._dirty_guilds.clear()
+        if self._writer is None:
+            self._writer = WriteBehind(self._write, name="users-db-writer")
+        self._writer.submit(statements)
+        metrics.USERS_SAVE_SECONDS.observe(perf_counter() - start)
+
+    def flush(self) -> None:
+        self.save()
+        if self._writer is not None:
+            self._writer.flush(data.CLOSE_TIMEOUT_SECONDS)
+
+    def load(self) -> None:
+        self.flush()
+        start = perf_counter()
+        if self._is_empty():
+            _migrate_from_pickle(self.connection)
+        self.member_id_to_user = {
+            user.member_id: user for user in _select_users(self.connection)
+        }
+        self.guild_id_to_channel_id = self.announcement_channels()
+        metrics.USERS_LOAD_SECONDS.observe(perf_counter() - start)
+        metrics.USERS_LOADED_BYTES.set(os.path.getsize(self.path))
+
+    def scan(self) -> Iterator[User]:
+        """Every stored user, read from the database one row at a time"""
+        self.flush()
+        return _select_users(self.connection)
+
+    def index_entries(self) -> Iterator[IndexEntry]:
+        return map(index_entry, self.member_id_to_user.values())
+
+    def read(self, member_id: int) -> User | None:
+        """The stored user, read without scanning the others"""
+        self.flush()
+        return next(_select_users(self.connection, member_id), None)
+
+    def announcement_channels(self) -> dict[int, int]:
+        return dict(
+            self.connection.execute(
+                "SELECT guild_id, announcement_channel_id FROM guilds "
+                "WHERE announcement_channel_id IS NOT NULL"
+            )
+        )
+
+    def close(self) -> None:
+        self.save()
+        if self._writer is not None:
+            self._writer.close(data.CLOSE_TIMEOUT_SECONDS)
+            self._writer = None
+        for connection in [self._connection, self._writer_connection]:
+            if connection is not None:
+                connection.close()
+        self._connection = None
+        self._writer_connection = None
+
+    def _write(self, statements: list[_Statement]) -> None:
+        if self._writer_connection is None:
+            self._writer_connection = _connect(
+                self.path, check_same_thread=False
+            )
+        start = perf_counter()
+        _execute(self._writer_connection, statements)
+        metrics.USERS_WRITE_SECONDS.observe(perf_counter() - start)
+
+    def _is_empty(self) -> bool:
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM users"
+        ).fetchone()
+        return count == 0
+
+
+class SqliteSchedule:
+    """Schedule answering due queries with range scans over the indexed
+    UTC columns that SqliteUsers.record keeps up to date"""
+
+    def __init__(self, users: SqliteUsers):
+        self._users = users
+        self._reminded_until: datetime | None = None
+
+    # The due times are columns written with each user, so there is no
+    # separate index to maintain and these are no-ops
+
+    def update(self, user: User) -> None:
+        pass
+
+    def remove(self, member_id: int) -> None:
+        pass
+
+    def rebuild(self, users: Iterable[User]) -> None:
+        pass
+
+    def rebuild_from_entries(self, entries: Iterable[IndexEntry]) -> None:
+        pass
+
+    def due_check_ins(self, now: datetime) -> list[int]:
+        rows = self._users.connection.execute(
+            "SELECT owner_id FROM commitments "
+            "WHERE next_check_in_utc <= ? ORDER BY next_check_in_utc",
+            (_to_seconds(now),),
+        )
+        return [member_id for (member_id,) in rows]
+
+    def due_reminders(self, now: datetime) -> list[tuple[int, datetime]]:
+        until = now.replace(second=0, microsecond=0)
+        since = self._reminded_until or until - timedelta(minutes=1)
+        since = max(since, until - timedelta(days=1))
+        rows = self._users.connection.execute(
+            "SELECT owner_id, next_reminder_utc FROM commitments "
+            "WHERE next_reminder_utc > ? AND next_reminder_utc <= ?",
+            (_to_seconds(since), _to_seconds(until)),
+        )
+        self._reminded_until = max(since, until)
+        return [
+            (member_id, _EPOCH + timedelta(seconds=seconds))
+            for member_id, seconds in rows
+        ]
+
+
+def use_sqlite_storage(path: str | None = None) -> None:
+    users = SqliteUsers(path or data.USERS_DB_FILE)
+    set_users(users)
+    set_schedule(SqliteSchedule(users))
+
+
+def _connect(path: str, check_same_thread=True) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(_SCHEMA)
+    _add_missing_columns(connection)
+    return connection
+
+
+def _connect_read_only(path: str) -> sqlite3.Connection:
+    """Connection that can't create, migrate or write to the database"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No database at {path}")
+    query = "mode=ro"
+    if not os.path.exists(f"{path}-wal"):
+        # Not open elsewhere, so SQLite needn't create its -wal and -shm
+        # files to share it
+        query += "&immutable=1"
+    uri = f"{pathlib.Path(path).absolute().as_uri()}?{query}"
+    return sqlite3.connect(uri, uri=True)
+
+
+def _add_missing_columns(connection: sqlite3.Connection) -> None:
+    columns = {
+        name
+        for _, name, *_ in connection.execute("PRAGMA table_info(commitments)")
+    }
+    with connection:
+        for name, definition in _ADDED_COLUMNS.items():
+            if name not in columns:
+                connection.execute(
+                    f"ALTER TABLE commitments ADD COLUMN {name} {definition}"
+                )
+
+
+def _user_statements(user: User) -> list[_Statement]:
+    statements = [
+        (
+            "INSERT INTO users (member_id, is_active, timezone) "
+            "VALUES (?, ?, ?) ON CONFLICT (member_id) DO UPDATE SET "
+            "is_active = excluded.is_active, timezone = excluded.timezone",
+            (user.member_id, user.is_active, user.timezone.key),
+        )
+    ]
+    commitment = user.commitment
+    if commitment is None:
+        statements.append(
+            (
+                "DELETE FROM commitments WHERE owner_id = ?",
+                (user.member_id,),
+            )
+        )
+        return statements
+    check_in_at = next_check_in_utc(user)
+    reminder_at = next_reminder_utc(user)
+    statements.append(
+        (
+            "INSERT OR REPLACE INTO commitments VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                user.member_id,
+                commitment.name,
+                commitment.description,
+                commitment.next_check_in.isoformat(),
+                str(commitment.recurrence),
+                commitment.streak,
+                commitment.num_missed_in_a_row,
+                None
+                if commitment.reminder is None
+                else commitment.reminder.isoformat(),
+                None if check_in_at is None else _to_seconds(check_in_at),
+                None if reminder_at is None else _to_seconds(reminder_at),
+                commitment.history.to_bytes(
+                    (commitment.history.bit_length() + 7) // 8, "little"
+                ),
+                commitment.num_recorded,
+                commitment.longest_streak,
+            ),
+        )
+    )
+    return statements
+
+
+def _guild_statement(guild_id: int, channel_id: int | None) -> _Statement:
+    return (
+        "INSERT OR REPLACE INTO guilds (guild_id, announcement_channel_id) "
+        "VALUES (?, ?)",
+        (guild_id, channel_id),
+    )
+
+
+def _execute(
+    connection: sqlite3.Connection, statements: list[_Statement]
+) -> None:
+    with connection:
+        for sql, parameters in statements:
+            connection.execute(sql, parameters)
+
+
+def _select_users(
+    connection: sqlite3.Connection, member_id: int | None = None
+) -> Iterator[User]:
+    query = (
+        "SELECT users.member_id, users.is_active, users.timezone, "
+        "commitments.name, commitments.description, "
+        "commitments.next_check_in, commitments.recurrence, "
+        "commitments.streak, commitments.num_missed_in_a_row, "
+        "commitments.reminder, commitments.history, "
+        "commitments.num_recorded, commitments.longest_streak "
+        "FROM users LEFT JOIN commitments "
+        "ON commitments.owner_id = users.member_id"
+    )
+    if member_id is None:
+        rows = connection.execute(query)
+    else:
+        rows = connection.execute(
+            f"{query} WHERE users.member_id = ?", (member_id,)
+        )
+    for (
+        member_id,
+        is_active,
+        timezone,
+        name,
+        description,
+        next_check_in,
+        recurrence,
+        streak,
+        num_missed_in_a_row,
+        reminder,
+        history,
+        num_recorded,
+        longest_streak,
+    ) in rows:
+        commitment = None
+        if name is not None:
+            commitment = Commitment(
+                owner_id=member_id,
+                name=name,
+                description=description,
+                next_check_in=datetime.fromisoformat(next_check_in),
+                recurrence=Recurrence.from_str(recurrence),
+                streak=streak,
+                num_missed_in_a_row=num_missed_in_a_row,
+                reminder=None
+                if reminder is None
+                else time.fromisoformat(reminder),
+                history=int.from_bytes(history, "little"),
+                num_recorded=num_recorded,
+                longest_streak=longest_streak,
+            )
+        yield User(
+            member_id=member_id,
+            commitment=commitment,
+            is_active=bool(is_active),
+            timezone=_read_timezone(timezone),
+        )
+
+
+def _migrate_from_pickle(connection: sqlite3.Connection) -> None:
+    if not (
+        os.path.exists(data.USERS_FILE)
+        or os.path.exists(data.USERS_JOURNAL_FILE)
+    ):
+        return
+    users = Users(member_id_to_user={})
+    users.load()
+    statements = [
+        statement
+        for user in users.member_id_to_user.values()
+        for statement in _user_statements(user)
+    ]
+    statements += [
+        _guild_statement(guild_id, channel_id)
+        for guild_id, channel_id in users.guild_id_to_channel_id.items()
+    ]
+    _execute(connection, statements)
+    users.close()
+
+
+def _read_timezone(value: int | str) -> ZoneInfo:
+    # Users saved before IANA zones hold the offset of a legacy Timezone
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        value = int(value)
+    return to_zone(value)
+
+
+def _to_seconds(dt: datetime) -> int:
+    return int((dt - _EPOCH).total_seconds())
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import os
+import pickle
+from typing import Any
+from typing import BinaryIO
+from typing import Iterator
+
+
+class Journal:
+    """Append-only log of pickled records
+
+    Each batch of records is written and fsynced together (group commit). When
+    the journal is rotated for compaction its records move to a side file
+    until they have been merged into a snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: BinaryIO | None = None
+        self._num_records = 0
+
+    @property
+    def rotated_path(self) -> str:
+        return f"{self.path}.compacting"
+
+    def __len__(self) -> int:
+        return self._num_records
+
+    def write(self, records: list[bytes]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(b"".join(records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._num_records += len(records)
+
+    def replay(self) -> Iterator[Any]:
+        self.close()
+        self._num_records = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+b") as f:
+            for record in _read_records(f):
+                self._num_records += 1
+                yield record
+            # Drop a partially written trailing record left by a crash
+            f.truncate()
+
+    def rotate(self) -> str:
+        self.close()
+        os.replace(self.path, self.rotated_path)
+        self._num_records = 0
+        return self.rotated_path
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_journal(path: str) -> Iterator[Any]:
+    with open(path, "rb") as f:
+        yield from _read_records(f)
+
+
+def _read_records(f: BinaryIO) -> Iterator[Any]:
+    while True:
+        offset = f.tell()
+        try:
+            record = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            f.seek(offset)
+            return
+        yield record
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Iterable
+from typing import Iterator
+
+from .data import index_entry
+from .data import IndexEntry
+from .data import User
+from .membership import GuildIndex
+
+
+PAGE_SIZE = 10
+BOARDS = ("streaks", "misses")
+# Enough levels for skip lists of millions of keys
+_MAX_LEVELS = 24
+
+
+class RankedList:
+    """Indexable skip list of unique keys in ascending order
+
+    Every link stores how many keys it skips, so inserting, removing, looking
+    up the key at an index and the index of a key all take O(log n).
+    """
+
+    def __init__(self, rng: random.Random | None = None):
+        self._head = _Node(None, _MAX_LEVELS)
+        self._head.widths = [1] * _MAX_LEVELS
+        self._size = 0
+        self._rng = rng or random.Random()
+
+    @classmethod
+    def from_sorted(
+        cls, keys: Iterable[tuple], rng: random.Random | None = None
+    ) -> RankedList:
+        """List of unique keys given in ascending order, built in O(n)"""
+        ranked = cls(rng)
+        # The last node on each level and its 1-based position
+        last = [ranked._head] * _MAX_LEVELS
+        last_position = [0] * _MAX_LEVELS
+        position = 0
+        for key in keys:
+            position += 1
+            node = _Node(key, ranked._random_level())
+            for i in range(len(node.nexts)):
+                last[i].nexts[i] = node
+                last[i].widths[i] = position - last_position[i]
+                last[i] = node
+                last_position[i] = position
+        for i in range(_MAX_LEVELS):
+            last[i].widths[i] = position + 1 - last_position[i]
+        ranked._size = position
+        return ranked
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> tuple:
+        return self._node_at(index).key
+
+    def __iter__(self) -> Iterator[tuple]:
+        return self.slice(0, self._size)
+
+    def insert(self, key: tuple) -> None:
+        chain, steps_at_level = self._search(key, inclusive=True)
+        level = self._random_level()
+        node = _Node(key, level)
+        steps = 0
+        for i in range(level):
+            previous = chain[i]
+            node.nexts[i] = previous.nexts[i]
+            previous.nexts[i] = node
+            node.widths[i] = previous.widths[i] - steps
+            previous.widths[i] = steps + 1
+            steps += steps_at_level[i]
+        for i in range(level, _MAX_LEVELS):
+            chain[i].widths[i] += 1
+        self._size += 1
+
+    def remove(self, key: tuple) -> None:
+        if not self.discard(key):
+            raise KeyError(key)
+
+    def discard(self, key: tuple) -> bool:
+        """Remove key if present, returning whether it was"""
+        chain, _ = self._search(key, inclusive=False)
+        node = chain[0].nexts[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(len(node.nexts)):
+            previous = chain[i]
+            previous.widths[i] += node.widths[i] - 1
+            previous.nexts[i] = node.nexts[i]
+        for i in range(len(node.nexts), _MAX_LEVELS):
+            chain[i].widths[i] -= 1
+        self._size -= 1
+        return True
+
+    def index(self, key: tuple) -> int:
+        chain, steps_at_level = self._search(key, inclusive=False)
+        node = chain[0].nexts[0]
+        if node is None or node.key != key:
+            raise ValueError(f"{key} is not in the list")
+        return sum(steps_at_level)
+
+    def slice(self, start: int, stop: int) -> Iterator[tuple]:
+        stop = min(stop, self._size)
+        if start >= stop:
+            return
+        node: _Node | None = self._node_at(start)
+        for _ in range(stop - start):
+            assert node is not None
+            yield node.key
+            node = node.nexts[0]
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < _MAX_LEVELS and self._rng.random() < 0.5:
+            level += 1
+        return level
+
+    def _node_at(self, index: int) -> _Node:
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        node = self._head
+        remaining = index + 1
+        for i in reversed(range(_MAX_LEVELS)):
+            while node.widths[i] <= remaining:
+                remaining -= node.widths[i]
+                node = node.nexts[i]
+        return node
+
+    def _search(
+        self, key: tuple, inclusive: bool
+    ) -> tuple[list[_Node], list[int]]:
+        # The last node before key on each level, and how many keys were
+        # stepped over on each level to reach it
+        chain = [self._head] * _MAX_LEVELS
+        steps_at_level = [0] * _MAX_LEVELS
+        node = self._head
+        for i in reversed(range(_MAX_LEVELS)):
+            while (following := node.nexts[i]) is not None and (
+                following.key <= key if inclusive else following.key < key
+            ):
+                steps_at_level[i] += node.widths[i]
+                node = following
+            chain[i] = node
+        return chain, steps_at_level
+
+
+class _Node:
+    __slots__ = ("key", "nexts", "widths")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.nexts: list[_Node | None] = [None] * level
+        self.widths = [0] * level
+
+
+@dataclass
+class Leaderboard:
+    """Per guild rankings of current streaks and misses in a row
+
+    Only active users with a commitment and a non-zero score are ranked.
+    Rendered pages are cached per guild until one of its rankings changes.
+    """
+
+    _guild_id_to_boards: dict[int, dict[str, RankedList]] = field(
+        default_factory=dict
+    )
+    _member_id_to_scores: dict[int, tuple[int, int]] = field(
+        default_factory=dict
+    )
+    _guild_id_to_pages: dict[int, dict[tuple[str, int], str]] = field(
+        default_factory=dict
+    )
+
+    def rebuild(self, users: Iterable[User], guild_index: GuildIndex) -> None:
+        self.rebuild_from_entries(map(index_entry, users), guild_index)
+
+    def rebuild_from_entries(
+        self, entries: Iterable[IndexEntry], guild_index: GuildIndex
+    ) -> None:
+        self._member_id_to_scores.clear()
+        self._guild_id_to_pages.clear()
+        guild_id_to_keys: dict[int, dict[str, list[tuple]]] = {}
+        for entry in entries:
+            scores = _scores(entry)
+            if scores is None:
+                continue
+            member_id = entry.member_id
+            self._member_id_to_scores[member_id] = scores
+            for guild_id in guild_index.guild_ids_of(member_id):
+                board_to_keys = guild_id_to_keys.get(guild_id)
+                if board_to_keys is None:
+                    board_to_keys = guild_id_to_keys[guild_id] = {
+                        board: [] for board in BOARDS
+                    }
+                for board, score in zip(BOARDS, scores):
+                    if score:
+                        board_to_keys[board].append(
+                            _key(member_id, scores, board)
+                        )
+        # Sorted and linked at once, which is much faster than inserting
+        self._guild_id_to_boards = {
+            guild_id: {
+                board: RankedList.from_sorted(sorted(keys))
+                for board, keys in board_to_keys.items()
+            }
+            for guild_id, board_to_keys in guild_id_to_keys.items()
+        }
+
+    def update(self, user: User, guild_ids: Iterable[int]) -> None:
+        """Rerank the user in the guilds they are a member of"""
+        scores = _scores(index_entry(user))
+        previous = self._member_id_to_scores.get(user.member_id)
+        if scores == previous:
+            return
+        if scores is None:
+            del self._member_id_to_scores[user.member_id]
+        else:
+            self._member_id_to_scores[user.member_id] = scores
+        for guild_id in guild_ids:
+            if previous is not None:
+                self._remove(guild_id, user.member_id, previous)
+            if scores is not None:
+                self._insert(guild_id, user.member_id, scores)
+
+    def add_member(self, member_id: int, guild_id: int) -> None:
+        scores = self._member_id_to_scores.get(member_id)
+        if scores is not None:
+            self._insert(guild_id, member_id, scores)
+
+    def remove_member(self, member_id: int, guild_id: int) -> None:
+        scores = self._member_id_to_scores.get(member_id)
+        if scores is not None:
+            self._remove(guild_id, member_id, scores)
+
+    def remove_guild(self, guild_id: int) -> None:
+        self._guild_id_to_boards.pop(guild_id, None)
+        self._guild_id_to_pages.pop(guild_id, None)
+
+    def num_pages(self, guild_id: int, board: str) -> int:
+        ranking = self._ranking(guild_id, board)
+        return max(-(-len(ranking) // PAGE_SIZE), 1)
+
+    def rank_of(self, member_id: int, guild_id: int, board: str) -> int | None:
+        """1-based rank of the member, or None when they are not ranked"""
+        scores = self._member_id_to_scores.get(member_id)
+        if scores is None:
+            return None
+        try:
+            key = _key(member_id, scores, board)
+            return self._ranking(guild_id, board).index(key) + 1
+        except ValueError:
+            return None
+
+    def page(self, guild_id: int, board: str, page: int) -> str:
+        """Rendered entries of the 1-based page, empty past the last page"""
+        pages = self._guild_id_to_pages.setdefault(guild_id, {})
+        rendered = pages.get((board, page))
+        if rendered is None:
+            start = (page - 1) * PAGE_SIZE
+            keys = self._ranking(guild_id, board).slice(
+                start, start + PAGE_SIZE
+            )
+            rendered = pages[(board, page)] = "\n".join(
+                f"{rank}. <@{member_id}>: {-negated_score}"
+                for rank, (negated_score, member_id) in enumerate(
+                    keys, start + 1
+                )
+            )
+        return rendered
+
+    def _ranking(self, guild_id: int, board: str) -> RankedList:
+        boards = self._guild_id_to_boards.get(guild_id)
+        if boards is None:
+            return RankedList()
+        return boards[board]
+
+    def _insert(
+        self, guild_id: int, member_id: int, scores: tuple[int, int]
+    ) -> None:
+        boards = self._guild_id_to_boards.get(guild_id)
+        if boards is None:
+            boards = self._guild_id_to_boards[guild_id] = {
+                board: RankedList() for board in BOARDS
+            }
+        for board, score in zip(BOARDS, scores):
+            if score:
+                key = _key(member_id, scores, board)
+                # Members can be added again, e.g. when a guild is rejoined
+                boards[board].discard(key)
+                boards[board].insert(key)
+        self._guild_id_to_pages.pop(guild_id, None)
+
+    def _remove(
+        self, guild_id: int, member_id: int, scores: tuple[int, int]
+    ) -> None:
+        boards = self._guild_id_to_boards.get(guild_id)
+        if boards is None:
+            return
+        for board, score in zip(BOARDS, scores):
+            if score:
+                boards[board].discard(_key(member_id, scores, board))
+        self._guild_id_to_pages.pop(guild_id, None)
+
+
+def get_leaderboard():
+    return _leaderboard
+
+
+def _scores(entry: IndexEntry) -> tuple[int, int] | None:
+    if not entry.streak and not entry.num_missed_in_a_row:
+        return None
+    return entry.streak, entry.num_missed_in_a_row
+
+
+def _key(member_id: int, scores: tuple[int, int], board: str) -> tuple:
+    # Highest score first, ties broken by member id
+    return -scores[BOARDS.index(board)], member_id
+
+
+_leaderboard = Leaderboard()
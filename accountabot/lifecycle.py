@@ -0,0 +1,77 @@
+import logging
+from dataclasses import dataclass
+from typing import Iterable
+
+import discord
+
+from .data import get_users
+from .data import IndexEntry
+from .leaderboard import get_leaderboard
+from .loop import commitment_check_loop
+from .membership import get_guild_index
+from .schedule import get_schedule
+
+
+logger = logging.getLogger("discord")
+
+
+@dataclass
+class Lifecycle:
+    """Brings the bot's state up whenever the gateway becomes ready
+
+    The first ready event loads users from disk, builds the indexes over them
+    and starts the commitment check loop. Ready events after a reconnect only
+    rebuild what is derived from the guild cache, which a new gateway session
+    replaces. Users in memory may have changes that aren't saved yet, so they
+    are never reloaded, and the loop keeps running.
+    """
+
+    is_loaded: bool = False
+    num_resumes: int = 0
+
+    def ready(self, client: discord.Client) -> None:
+        if self.is_loaded:
+            self._warm_resume(client)
+        else:
+            self._cold_load(client)
+
+    def resumed(self, client: discord.Client) -> None:
+        """The gateway resumed its session, so no events were missed"""
+        self._start_loop(client)
+
+    def _cold_load(self, client: discord.Client) -> None:
+        users = get_users()
+        users.load()
+        logger.info("Users loaded")
+        # One pass over the users, which only reads the index columns of a
+        # mapped snapshot instead of decoding every user
+        entries = list(users.index_entries())
+        get_schedule().rebuild_from_entries(entries)
+        self._rebuild_guilds(client, entries)
+        self.is_loaded = True
+        self._start_loop(client)
+
+    def _warm_resume(self, client: discord.Client) -> None:
+        self.num_resumes += 1
+        self._rebuild_guilds(client, get_users().index_entries())
+        logger.info(f"Resumed with {len(client.guilds)} guild(s)")
+        self._start_loop(client)
+
+    @staticmethod
+    def _rebuild_guilds(
+        client: discord.Client, entries: Iterable[IndexEntry]
+    ) -> None:
+        get_guild_index().rebuild(client.guilds, get_users().member_id_to_user)
+        get_leaderboard().rebuild_from_entries(entries, get_guild_index())
+
+    @staticmethod
+    def _start_loop(client: discord.Client) -> None:
+        if not commitment_check_loop.is_running():
+            commitment_check_loop.start(client)
+
+
+def get_lifecycle():
+    return _lifecycle
+
+
+_lifecycle = Lifecycle()
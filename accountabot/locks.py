@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from typing import AsyncIterator
+
+
+@dataclass
+class UserLocks:
+    """One asyncio lock per user, serializing changes to the user
+
+    Locks only exist while they are held or waited for, so memory follows the
+    number of users being changed rather than the number of users.
+    """
+
+    _member_id_to_lock: dict[int, asyncio.Lock] = field(default_factory=dict)
+    _member_id_to_num_holders: dict[int, int] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self._member_id_to_lock)
+
+    def locked(self, member_id: int) -> bool:
+        lock = self._member_id_to_lock.get(member_id)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, member_id: int) -> AsyncIterator[None]:
+        lock = self._member_id_to_lock.get(member_id)
+        if lock is None:
+            lock = self._member_id_to_lock[member_id] = asyncio.Lock()
+        self._member_id_to_num_holders[member_id] = (
+            self._member_id_to_num_holders.get(member_id, 0) + 1
+        )
+        try:
+            async with lock:
+                yield
+        finally:
+            num_holders = self._member_id_to_num_holders[member_id] - 1
+            if num_holders:
+                self._member_id_to_num_holders[member_id] = num_holders
+            else:
+                del self._member_id_to_num_holders[member_id]
+                del self._member_id_to_lock[member_id]
+
+
+def get_user_locks():
+    return _user_locks
+
+
+_user_locks = UserLocks()
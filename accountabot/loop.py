@@ -1,62 +1,159 @@
+import asyncio
+import logging
+from collections import defaultdict
 from datetime import datetime
+from time import perf_counter
 
 import discord
 from discord.ext import tasks
 
+from . import metrics
+from .data import Clock
 from .data import get_users
 from .data import User
-from .data import user_time
-from .message import save_and_message_guild
+from .leaderboard import get_leaderboard
+from .locks import get_user_locks
+from .membership import get_guild_index
+from .membership import GuildIndex
+from .message import message_guild_digest
+from .message import Notification
+from .schedule import get_schedule
+from .schedule import next_reminder_utc
+
+
+# Guilds whose notifications are sent at the same time
+MAX_CONCURRENT_GUILDS = 8
+# How long sending one guild's notifications may take before it is abandoned
+GUILD_SEND_TIMEOUT_SECONDS = 20.0
+logger = logging.getLogger("discord")
 
 
 @tasks.loop(minutes=1)
-async def commitment_check_loop(guilds: list[discord.Guild]):
+async def commitment_check_loop(client: discord.Client):
+    # tasks.loop awaits each tick before scheduling the next, so ticks never
+    # overlap
+    await _tick(client)
+
+
+async def _tick(client: discord.Client) -> None:
+    start = perf_counter()
     users = get_users()
-    for guild in guilds:
-        for member in guild.members:
-            if member.id not in users.member_id_to_user:
-                continue
-            user = users.member_id_to_user[member.id]
-            if not user.is_active:
+    schedule = get_schedule()
+    utc_now = datetime.utcnow()
+    clock = Clock(utc_now)
+    guild_index = get_guild_index()
+    leaderboard = get_leaderboard()
+    user_locks = get_user_locks()
+    digests: dict[int, list[Notification]] = defaultdict(list)
+    due_check_ins = schedule.due_check_ins(utc_now)
+    num_missed = 0
+    for member_id in due_check_ins:
+        async with user_locks.hold(member_id):
+            user = users.member_id_to_user.get(member_id)
+            if user is None or not user.is_active:
                 continue
-            await _check_commitment_check_ins_of_user(guild, user)
-            await _check_commitment_reminders_of_user(guild, user)
+            notification = _check_commitment_check_ins_of_user(user, clock)
+            users.record(user)
+            schedule.update(user)
+            leaderboard.update(user, guild_index.guild_ids_of(member_id))
+        num_missed += notification is not None
+        _add_to_digests(digests, guild_index, member_id, notification)
+    due_reminders = schedule.due_reminders(utc_now)
+    num_reminded = 0
+    for member_id, reminder_at in due_reminders:
+        user = users.member_id_to_user.get(member_id)
+        if user is None or next_reminder_utc(user) != reminder_at:
+            continue
+        notification = _reminder_of_user(user)
+        num_reminded += notification is not None
+        _add_to_digests(digests, guild_index, member_id, notification)
+    metrics.LOOP_USERS_SCANNED.set(len(due_check_ins), "check_in")
+    metrics.LOOP_USERS_SCANNED.set(len(due_reminders), "reminder")
+    metrics.LOOP_USERS_DUE.set(num_missed, "check_in")
+    metrics.LOOP_USERS_DUE.set(num_reminded, "reminder")
+    # Looked up on every tick, so guilds joined since the loop started are
+    # notified too
+    guild_and_notifications = [
+        (guild, notifications)
+        for guild_id, notifications in digests.items()
+        if (guild := client.get_guild(guild_id)) is not None
+    ]
+    # Once per tick, before sending, so what was announced is kept
     users.save()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GUILDS)
+    await asyncio.gather(
+        *(
+            _send_digest(guild, notifications, semaphore)
+            for guild, notifications in guild_and_notifications
+        )
+    )
+    metrics.LOOP_TICK_SECONDS.observe(perf_counter() - start)
 
 
-async def _check_commitment_check_ins_of_user(
-    guild: discord.Guild, user: User
+async def _send_digest(
+    guild: discord.Guild,
+    notifications: list[Notification],
+    semaphore: asyncio.Semaphore,
 ) -> None:
-    user_now = user_time(user, datetime.utcnow())
-    commitment = user.commitment
-    if commitment is None or user_now < commitment.next_check_in:
+    async with semaphore:
+        try:
+            num_messages = await asyncio.wait_for(
+                message_guild_digest(guild, notifications),
+                GUILD_SEND_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            metrics.SEND_FAILURES.inc(str(guild.id), "timeout")
+            logger.warning(
+                f"Timed out sending {len(notifications)} notification(s) to "
+                f"guild#{guild.id}"
+            )
+            return
+        except discord.errors.HTTPException as ex:
+            logger.warning(
+                f"Failed to send notifications to guild#{guild.id}: {ex}"
+            )
+            return
+    logger.info(
+        f"Sent {len(notifications)} notification(s) to guild#{guild.id} "
+        f"in {num_messages} message(s)"
+    )
+
+
+def _add_to_digests(
+    digests: dict[int, list[Notification]],
+    guild_index: GuildIndex,
+    member_id: int,
+    notification: Notification | None,
+) -> None:
+    if notification is None:
         return
-    commitment.cycle_check_in(missed=True)
-    await save_and_message_guild(
-        guild=guild,
-        message=f"<@{user.member_id}> missed accountability commitment: \n{commitment}",
+    for guild_id in guild_index.guild_ids_of(member_id):
+        digests[guild_id].append(notification)
+
+
+def _check_commitment_check_ins_of_user(
+    user: User, clock: Clock
+) -> Notification | None:
+    user_now = clock.user_now(user)
+    commitment = user.commitment
+    if commitment is None:
+        return None
+    num_missed = commitment.catch_up(user_now)
+    if num_missed == 0:
+        return None
+    times = "" if num_missed == 1 else f" {num_missed} times"
+    return Notification(
+        message=f"<@{user.member_id}> missed accountability commitment{times}: \n{commitment}",
         title="Missed commitment",
         mention="@everyone",
     )
 
 
-async def _check_commitment_reminders_of_user(
-    guild: discord.Guild, user: User
-) -> None:
-    user_now = user_time(user, datetime.utcnow())
+def _reminder_of_user(user: User) -> Notification | None:
     commitment = user.commitment
-    if commitment is None:
-        return
-    reminder = commitment.reminder
-    if (
-        reminder is None
-        or user_now.hour != reminder.hour
-        or user_now.minute != reminder.minute
-        or user_now.date() != commitment.next_check_in.date()
-    ):
-        return
-    await save_and_message_guild(
-        guild=guild,
+    if commitment is None or commitment.reminder is None:
+        return None
+    return Notification(
         message=str(commitment),
         title="Reminder",
         mention=f"<@{user.member_id}>",
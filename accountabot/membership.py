@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Container
+from typing import Iterable
+
+import discord
+
+
+@dataclass
+class GuildIndex:
+    """Which guilds each registered user is a member of"""
+
+    _member_id_to_guild_ids: defaultdict[int, set[int]] = field(
+        default_factory=lambda: defaultdict(set)
+    )
+    _guild_id_to_member_ids: defaultdict[int, set[int]] = field(
+        default_factory=lambda: defaultdict(set)
+    )
+
+    def guild_ids_of(self, member_id: int) -> set[int]:
+        return self._member_id_to_guild_ids.get(member_id, set())
+
+    def member_ids_of(self, guild_id: int) -> set[int]:
+        return self._guild_id_to_member_ids.get(guild_id, set())
+
+    def rebuild(
+        self, guilds: Iterable[discord.Guild], member_ids: Container[int]
+    ) -> None:
+        self._member_id_to_guild_ids.clear()
+        self._guild_id_to_member_ids.clear()
+        for guild in guilds:
+            self.add_guild(guild, member_ids)
+
+    def add_guild(
+        self, guild: discord.Guild, member_ids: Container[int]
+    ) -> None:
+        for member in guild.members:
+            if member.id in member_ids:
+                self.add_member(member.id, guild.id)
+
+    def remove_guild(self, guild_id: int) -> None:
+        for member_id in self._guild_id_to_member_ids.pop(guild_id, set()):
+            self._discard(self._member_id_to_guild_ids, member_id, guild_id)
+
+    def add_member(self, member_id: int, guild_id: int) -> None:
+        self._member_id_to_guild_ids[member_id].add(guild_id)
+        self._guild_id_to_member_ids[guild_id].add(member_id)
+
+    def remove_member(self, member_id: int, guild_id: int) -> None:
+        self._discard(self._member_id_to_guild_ids, member_id, guild_id)
+        self._discard(self._guild_id_to_member_ids, guild_id, member_id)
+
+    def add_user(self, member_id: int, guilds: Iterable[discord.Guild]) -> None:
+        for guild in guilds:
+            self.add_member(member_id, guild.id)
+
+    @staticmethod
+    def _discard(index: defaultdict[int, set[int]], key: int, value: int):
+        values = index.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del index[key]
+
+
+def get_guild_index():
+    return _guild_index
+
+
+_guild_index = GuildIndex()
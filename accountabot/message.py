@@ -1,11 +1,29 @@
+import asyncio
 import logging
+from dataclasses import dataclass
+from time import perf_counter
 
 import discord
 
+from . import metrics
 from .data import get_users
 
 
 EMBED_COLOR = 0x8906A9
+# Discord's limits on a single message
+MAX_CONTENT_CHARS = 2000
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_DESCRIPTION_CHARS = 4096
+# Discord invalidates an interaction that is not responded to within this
+INTERACTION_DEADLINE_SECONDS = 3.0
+# Interactions that are not responded to within this are deferred, so the
+# handler has 15 minutes to send its reply as a follow-up
+INTERACTION_BUDGET_SECONDS = 2.0
+# Key in Interaction.extras holding the interaction's pending deferral
+_DEFERRAL = "deferral"
+# Key in Interaction.extras set while the deferral's "thinking" message is shown
+_THINKING = "thinking"
 logger = logging.getLogger("discord")
 
 
@@ -16,27 +34,246 @@ async def save_and_message_interaction(
     mention: str | None = None,
     ephemeral=False,
 ) -> None:
-    get_users().save()
+    """Reply to the interaction, then save the users
+
+    Replies after the first one, or after the interaction was deferred, are
+    sent as follow-ups.
+    """
     embed = discord.Embed(title=title, description=message, color=EMBED_COLOR)
-    await interaction.response.send_message(
-        content=mention, embed=embed, ephemeral=ephemeral
+    try:
+        await _respond(interaction, mention, embed, ephemeral)
+    finally:
+        get_users().save()
+
+
+def set_interaction_budget(seconds: float) -> None:
+    global INTERACTION_BUDGET_SECONDS
+    INTERACTION_BUDGET_SECONDS = seconds
+
+
+def start_response_budget(interaction: discord.Interaction) -> None:
+    """Defer the interaction if it is not responded to within the budget"""
+    started_at = interaction.extras.setdefault(
+        metrics.COMMAND_STARTED_AT, perf_counter()
     )
+    delay = started_at + INTERACTION_BUDGET_SECONDS - perf_counter()
+    interaction.extras[_DEFERRAL] = _Deferral(interaction, delay)
 
 
-async def save_and_message_guild(
-    guild: discord.Guild,
-    message: str,
-    title: str | None = None,
-    mention: str | None = None,
-) -> None:
-    get_users().save()
-    embed = discord.Embed(title=title, description=message, color=EMBED_COLOR)
-    for channel in guild.text_channels:
+class _Deferral:
+    def __init__(self, interaction: discord.Interaction, delay: float):
+        self._interaction = interaction
+        self._is_deferring = False
+        self._task = asyncio.create_task(self._defer_after(delay))
+
+    async def stop(self) -> None:
+        """Cancel the deferral, or wait for it if it already started"""
+        if not self._is_deferring:
+            self._task.cancel()
+            return
         try:
-            await channel.send(content=mention, embed=embed)
+            await self._task
+        except discord.errors.HTTPException as ex:
+            logger.warning(f"Failed to defer interaction: {ex}")
+
+    async def _defer_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if self._interaction.response.is_done():
             return
+        self._is_deferring = True
+        # Public, since most replies are
+        await self._interaction.response.defer(thinking=True)
+        self._interaction.extras[_THINKING] = True
+        metrics.INTERACTION_DEFERRALS.inc(_command_name(self._interaction))
+        _observe_first_response(self._interaction)
+
+
+async def _respond(
+    interaction: discord.Interaction,
+    content: str | None,
+    embed: discord.Embed,
+    ephemeral: bool,
+) -> None:
+    deferral = interaction.extras.pop(_DEFERRAL, None)
+    if deferral is not None:
+        await deferral.stop()
+    if interaction.response.is_done():
+        # The first follow-up replaces the "thinking" message and keeps its
+        # visibility, so it is removed to keep ephemeral replies private
+        if interaction.extras.pop(_THINKING, False) and ephemeral:
+            await interaction.delete_original_response()
+        await interaction.followup.send(
+            content=content, embed=embed, ephemeral=ephemeral
+        )
+        return
+    await interaction.response.send_message(
+        content=content, embed=embed, ephemeral=ephemeral
+    )
+    _observe_first_response(interaction)
+
+
+def _observe_first_response(interaction: discord.Interaction) -> None:
+    started_at = interaction.extras.get(metrics.COMMAND_STARTED_AT)
+    if started_at is None:
+        return
+    elapsed = perf_counter() - started_at
+    if elapsed > INTERACTION_DEADLINE_SECONDS:
+        command_name = _command_name(interaction)
+        metrics.INTERACTION_DEADLINE_MISSES.inc(command_name)
+        logger.warning(
+            f"Responded to /{command_name} after {elapsed:.1f}s, past the "
+            "interaction deadline"
+        )
+
+
+def _command_name(interaction: discord.Interaction) -> str:
+    command = interaction.command
+    return "unknown" if command is None else command.name
+
+
+@dataclass
+class Notification:
+    message: str
+    title: str | None = None
+    mention: str | None = None
+
+
+async def message_guild_digest(
+    guild: discord.Guild, notifications: list[Notification]
+) -> int:
+    """Send notifications packed into as few messages as possible
+
+    Returns the number of messages sent.
+    """
+    num_messages = 0
+    for content, embeds in _pack(notifications):
+        if not await _send_to_guild(guild, content, embeds):
+            break
+        num_messages += 1
+    return num_messages
+
+
+def announcement_channel(guild: discord.Guild) -> discord.TextChannel | None:
+    if guild.id not in _guild_id_to_channel:
+        _guild_id_to_channel[guild.id] = _resolve_announcement_channel(guild)
+    return _guild_id_to_channel[guild.id]
+
+
+def invalidate_announcement_channel(guild_id: int | None = None) -> None:
+    if guild_id is None:
+        _guild_id_to_channel.clear()
+    else:
+        _guild_id_to_channel.pop(guild_id, None)
+
+
+def can_announce_in(channel: discord.TextChannel) -> bool:
+    permissions = channel.permissions_for(channel.guild.me)
+    return permissions.send_messages and permissions.embed_links
+
+
+async def _send_to_guild(
+    guild: discord.Guild, content: str | None, embeds: list[discord.Embed]
+) -> bool:
+    channel = announcement_channel(guild)
+    if channel is not None:
+        try:
+            await _send(channel, content, embeds)
+            return True
         except discord.errors.Forbidden:
-            continue
+            # Local permission checks disagreed with Discord, probe each channel
+            channel = await _send_to_any_channel(guild, content, embeds)
+            _guild_id_to_channel[guild.id] = channel
+            if channel is not None:
+                return True
     logger.warn(
         f"Unable to find a channel in guild#{guild.id} with permissions to send message"
     )
+    return False
+
+
+async def _send_to_any_channel(
+    guild: discord.Guild, content: str | None, embeds: list[discord.Embed]
+) -> discord.TextChannel | None:
+    for channel in guild.text_channels:
+        try:
+            await _send(channel, content, embeds)
+            return channel
+        except discord.errors.Forbidden:
+            continue
+    return None
+
+
+async def _send(
+    channel: discord.TextChannel,
+    content: str | None,
+    embeds: list[discord.Embed],
+) -> None:
+    start = perf_counter()
+    try:
+        await channel.send(content=content, embeds=embeds)
+    except discord.errors.HTTPException as ex:
+        metrics.SEND_FAILURES.inc(str(channel.guild.id), _failure_reason(ex))
+        raise
+    finally:
+        metrics.SEND_SECONDS.observe(perf_counter() - start)
+
+
+def _failure_reason(ex: discord.errors.HTTPException) -> str:
+    if isinstance(ex, discord.errors.Forbidden):
+        return "forbidden"
+    if ex.status == 429:
+        return "rate_limited"
+    return "http_error"
+
+
+def _pack(
+    notifications: list[Notification],
+) -> list[tuple[str | None, list[discord.Embed]]]:
+    messages: list[tuple[str | None, list[discord.Embed]]] = []
+    mentions: list[str] = []
+    embeds: list[discord.Embed] = []
+    num_embed_chars = 0
+    for notification in notifications:
+        embed = discord.Embed(
+            title=notification.title,
+            description=notification.message[:MAX_DESCRIPTION_CHARS],
+            color=EMBED_COLOR,
+        )
+        new_mentions = mentions
+        if notification.mention and notification.mention not in mentions:
+            new_mentions = mentions + [notification.mention]
+        if embeds and (
+            len(embeds) == MAX_EMBEDS_PER_MESSAGE
+            or num_embed_chars + len(embed) > MAX_EMBED_CHARS_PER_MESSAGE
+            or len(" ".join(new_mentions)) > MAX_CONTENT_CHARS
+        ):
+            messages.append((" ".join(mentions) or None, embeds))
+            embeds, num_embed_chars = [], 0
+            new_mentions = (
+                [notification.mention] if notification.mention else []
+            )
+        mentions = new_mentions
+        embeds.append(embed)
+        num_embed_chars += len(embed)
+    if embeds:
+        messages.append((" ".join(mentions) or None, embeds))
+    return messages
+
+
+def _resolve_announcement_channel(
+    guild: discord.Guild,
+) -> discord.TextChannel | None:
+    channel_id = get_users().guild_id_to_channel_id.get(guild.id)
+    if channel_id is not None:
+        channel = guild.get_channel(channel_id)
+        if isinstance(channel, discord.TextChannel) and can_announce_in(
+            channel
+        ):
+            return channel
+    for channel in guild.text_channels:
+        if can_announce_in(channel):
+            return channel
+    return None
+
+
+_guild_id_to_channel: dict[int, discord.TextChannel | None] = {}
@@ -0,0 +1,277 @@
+"""Optional Prometheus metrics
+
+Metrics are only recorded once start_server has been called, until then every
+update returns straight away. asyncio and http.server are imported when they
+are first needed, so that offline tools importing the user store start fast.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from bisect import bisect_left
+from functools import cache
+from time import perf_counter
+from typing import Iterator
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+    import discord
+
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+LAG_SAMPLE_SECONDS = 1.0
+# Key in Interaction.extras holding when the command tree received it
+COMMAND_STARTED_AT = "started_at"
+logger = logging.getLogger("discord")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+    def _label_str(self, values: tuple[str, ...], **extra: str) -> str:
+        pairs = list(zip(self.labels, values)) + list(extra.items())
+        if not pairs:
+            return ""
+        escaped = ",".join(
+            f'{name}="{_escape(value)}"' for name, value in pairs
+        )
+        return f"{{{escaped}}}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield from super().render()
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{self._label_str(labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # Per label values: count in each bucket, then the sum
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield from super().render()
+        with self._lock:
+            values = [
+                (labels, list(counts))
+                for labels, counts in self._values.items()
+            ]
+        for labels, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_str = self._label_str(labels, le=le)
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            yield f"{self.name}_sum{self._label_str(labels)} {counts[-1]}"
+            yield f"{self.name}_count{self._label_str(labels)} {cumulative}"
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def render() -> str:
+    return (
+        "\n".join(line for metric in _registry for line in metric.render())
+        + "\n"
+    )
+
+
+def start_server(port: int, address: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the metrics on http://address:port/metrics and start recording"""
+    from http.server import ThreadingHTTPServer
+
+    global _enabled
+    server = ThreadingHTTPServer((address, port), _handler_class())
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    _enabled = True
+    logger.info(f"Serving metrics on {address}:{server.server_address[1]}")
+    return server
+
+
+def observe_command(interaction: discord.Interaction, status: str) -> None:
+    """Record how long the command of an interaction took to handle"""
+    if not _enabled or interaction.command is None:
+        return
+    started_at = interaction.extras.get(COMMAND_STARTED_AT)
+    if started_at is not None:
+        COMMAND_SECONDS.observe(
+            perf_counter() - started_at, interaction.command.name, status
+        )
+
+
+async def monitor_event_loop_lag(interval: float = LAG_SAMPLE_SECONDS) -> None:
+    """Record how late the event loop wakes up from a sleep"""
+    import asyncio
+
+    while True:
+        expected = perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(perf_counter() - expected, 0.0))
+
+
+@cache
+def _handler_class() -> type:
+    from http.server import BaseHTTPRequestHandler
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            ...
+
+    return _Handler
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_enabled = False
+_registry: list[_Metric] = []
+
+LOOP_TICK_SECONDS = Histogram(
+    "accountabot_loop_tick_seconds", "Duration of a commitment check loop tick"
+)
+LOOP_USERS_SCANNED = Gauge(
+    "accountabot_loop_users_scanned",
+    "Users the schedule returned as due in the last tick",
+    ("kind",),
+)
+LOOP_USERS_DUE = Gauge(
+    "accountabot_loop_users_due",
+    "Users notified in the last tick",
+    ("kind",),
+)
+USERS_SAVE_SECONDS = Histogram(
+    "accountabot_users_save_seconds",
+    "Time the event loop was blocked by saving users",
+)
+USERS_WRITE_SECONDS = Histogram(
+    "accountabot_users_write_seconds",
+    "Duration of a background write of saved users",
+)
+USERS_WRITTEN_BYTES = Counter(
+    "accountabot_users_written_bytes_total", "Bytes of users written"
+)
+USERS_LOAD_SECONDS = Histogram(
+    "accountabot_users_load_seconds", "Duration of loading users"
+)
+USERS_LOADED_BYTES = Gauge(
+    "accountabot_users_loaded_bytes", "Size of the users loaded last"
+)
+SEND_SECONDS = Histogram(
+    "accountabot_send_seconds", "Duration of sending a message to a channel"
+)
+SEND_FAILURES = Counter(
+    "accountabot_send_failures_total",
+    "Messages that could not be sent",
+    ("guild", "reason"),
+)
+COMMAND_SECONDS = Histogram(
+    "accountabot_command_seconds",
+    "Duration of command handlers",
+    ("command", "status"),
+)
+INTERACTION_DEFERRALS = Counter(
+    "accountabot_interaction_deferrals_total",
+    "Interactions deferred automatically for running over their budget",
+    ("command",),
+)
+INTERACTION_DEADLINE_MISSES = Counter(
+    "accountabot_interaction_deadline_misses_total",
+    "Interactions first responded to after Discord's deadline",
+    ("command",),
+)
+COMMAND_SYNCS = Counter(
+    "accountabot_command_syncs_total",
+    "Command tree syncs to guilds",
+    ("result",),
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "accountabot_event_loop_lag_seconds",
+    "How late the event loop ran a scheduled wake up",
+)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from datetime import timedelta
+from typing import Iterable
+
+from .data import index_entry
+from .data import IndexEntry
+from .data import next_check_in_utc
+from .data import next_reminder_utc
+from .data import User
+
+
+# Stale heap entries are only discarded when they reach the top, so rebuild
+# the heap once it holds this many times more entries than live commitments
+_COMPACTION_FACTOR = 2
+MINUTES_PER_DAY = 24 * 60
+_ONE_MINUTE = timedelta(minutes=1)
+_ONE_DAY = timedelta(days=1)
+
+
+@dataclass
+class CheckInQueue:
+    """Min-heap of member ids keyed by the UTC instant of their next check in"""
+
+    _heap: list[tuple[datetime, int]] = field(default_factory=list)
+    _member_id_to_due: dict[int, datetime] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self._member_id_to_due)
+
+    def __contains__(self, member_id: int) -> bool:
+        return member_id in self._member_id_to_due
+
+    def push(self, member_id: int, due: datetime) -> None:
+        if self._member_id_to_due.get(member_id) == due:
+            return
+        self._member_id_to_due[member_id] = due
+        heapq.heappush(self._heap, (due, member_id))
+        if len(self._heap) > _COMPACTION_FACTOR * len(self) + 1:
+            self._compact()
+
+    def remove(self, member_id: int) -> None:
+        self._member_id_to_due.pop(member_id, None)
+
+    def next_due(self) -> datetime | None:
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[int]:
+        due_member_ids = []
+        while (due := self.next_due()) is not None and due <= now:
+            _, member_id = heapq.heappop(self._heap)
+            del self._member_id_to_due[member_id]
+            due_member_ids.append(member_id)
+        return due_member_ids
+
+    def _discard_stale(self) -> None:
+        while self._heap:
+            due, member_id = self._heap[0]
+            if self._member_id_to_due.get(member_id) == due:
+                return
+            heapq.heappop(self._heap)
+
+    def _compact(self) -> None:
+        self._heap = [
+            (due, member_id)
+            for member_id, due in self._member_id_to_due.items()
+        ]
+        heapq.heapify(self._heap)
+
+
+@dataclass
+class ReminderWheel:
+    """Timing wheel of pending reminders with one slot per UTC minute of day"""
+
+    _slots: list[dict[int, datetime]] = field(
+        default_factory=lambda: [{} for _ in range(MINUTES_PER_DAY)]
+    )
+    _member_id_to_slot: dict[int, int] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self._member_id_to_slot)
+
+    def __contains__(self, member_id: int) -> bool:
+        return member_id in self._member_id_to_slot
+
+    def add(self, member_id: int, fire_at: datetime) -> None:
+        fire_at = _truncate_to_minute(fire_at)
+        self.remove(member_id)
+        slot = _minute_of_day(fire_at)
+        self._slots[slot][member_id] = fire_at
+        self._member_id_to_slot[member_id] = slot
+
+    def remove(self, member_id: int) -> None:
+        slot = self._member_id_to_slot.pop(member_id, None)
+        if slot is not None:
+            del self._slots[slot][member_id]
+
+    def due(
+        self, since: datetime | None, now: datetime
+    ) -> list[tuple[int, datetime]]:
+        """Reminders firing after since, up to and including now
+
+        Only the minute of now is checked without a since. At most a day of
+        slots is scanned, so a long stall can't make one call arbitrarily slow.
+        """
+        now = _truncate_to_minute(now)
+        if since is None:
+            since = now - _ONE_MINUTE
+        since = max(_truncate_to_minute(since), now - _ONE_DAY)
+        num_minutes = (now - since) // _ONE_MINUTE
+        first_slot = _minute_of_day(since) + 1
+        return [
+            (member_id, fire_at)
+            for i in range(num_minutes)
+            for member_id, fire_at in self._slots[
+                (first_slot + i) % MINUTES_PER_DAY
+            ].items()
+            if since < fire_at <= now
+        ]
+
+
+@dataclass
+class Schedule:
+    check_ins: CheckInQueue = field(default_factory=CheckInQueue)
+    reminders: ReminderWheel = field(default_factory=ReminderWheel)
+    # Reminders up to this instant have been handed out by due_reminders
+    reminded_until: datetime | None = None
+
+    def update(self, user: User) -> None:
+        check_in_at = next_check_in_utc(user)
+        if check_in_at is None:
+            self.remove(user.member_id)
+            return
+        self.check_ins.push(user.member_id, check_in_at)
+        reminder_at = next_reminder_utc(user)
+        if reminder_at is None:
+            self.reminders.remove(user.member_id)
+        else:
+            self.reminders.add(user.member_id, reminder_at)
+
+    def remove(self, member_id: int) -> None:
+        self.check_ins.remove(member_id)
+        self.reminders.remove(member_id)
+
+    def rebuild(self, users: Iterable[User]) -> None:
+        self.rebuild_from_entries(map(index_entry, users))
+
+    def rebuild_from_entries(self, entries: Iterable[IndexEntry]) -> None:
+        member_id_to_due = {}
+        self.reminders = ReminderWheel()
+        for entry in entries:
+            if entry.check_in_at is None:
+                continue
+            member_id_to_due[entry.member_id] = entry.check_in_at
+            if entry.reminder_at is not None:
+                self.reminders.add(entry.member_id, entry.reminder_at)
+        # Heapified at once instead of pushing every check in
+        self.check_ins = CheckInQueue(_member_id_to_due=member_id_to_due)
+        self.check_ins._compact()
+
+    def due_check_ins(self, now: datetime) -> list[int]:
+        return self.check_ins.pop_due(now)
+
+    def due_reminders(self, now: datetime) -> list[tuple[int, datetime]]:
+        """Reminders firing since the last call, up to and including now"""
+        due = self.reminders.due(self.reminded_until, now)
+        self.reminded_until = _advance(self.reminded_until, now)
+        return due
+
+
+def _advance(until: datetime | None, now: datetime) -> datetime:
+    """Move a processed-until instant forward, never backward"""
+    now = _truncate_to_minute(now)
+    return now if until is None else max(until, now)
+
+
+def _truncate_to_minute(dt: datetime) -> datetime:
+    return dt.replace(second=0, microsecond=0)
+
+
+def _minute_of_day(dt: datetime) -> int:
+    return dt.hour * 60 + dt.minute
+
+
+def get_schedule():
+    return _schedule
+
+
+def set_schedule(schedule) -> None:
+    global _schedule
+    _schedule = schedule
+
+
+_schedule = Schedule()
@@ -0,0 +1,437 @@
+"""Memory-mapped binary snapshot of the user store
+
+Layout (little-endian, version 3):
+
+    header      magic, version, counts and the offsets of the sections below
+    member ids  one u64 per user, sorted, so a user is found by bisection
+    users       one fixed-width record per user, in member id order, holding
+                the user and its commitment (if any), including its check in
+                history since version 2
+    index       since version 3, one fixed-width record per user, in member
+                id order, holding the UTC times of its next check in and
+                reminder and its leaderboard scores
+    guilds      one (guild id, announcement channel id) u64 pair per guild
+    strings     u64 end offsets of each string, then their UTF-8 bytes
+
+Names, descriptions and zone keys are stored once in the string table and
+referenced by index. Opening a snapshot only maps the file and reads the
+header, users are decoded on first access. The schedule and leaderboard are
+built from the index without decoding any user.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from datetime import datetime
+from datetime import timedelta
+from typing import Iterator
+from typing import Mapping
+from typing import MutableMapping
+from zoneinfo import ZoneInfo
+
+from . import data
+
+
+MAGIC = b"ACCTBOT\0"
+VERSION = 3
+_MAGIC_AND_VERSION = struct.Struct("<8sH")
+_VERSION_TO_HEADER = {
+    1: struct.Struct("<8sHxxIIIQQQQ"),
+    2: struct.Struct("<8sHxxIIIQQQQ"),
+    3: struct.Struct("<8sHxxIIIQQQQQ"),
+}
+_HEADER = _VERSION_TO_HEADER[VERSION]
+# Enough bytes for data.HISTORY_LENGTH bits
+_HISTORY_BYTES = 46
+_VERSION_TO_USER = {
+    1: struct.Struct("<BBBxHxxIIIqIII"),
+    2: struct.Struct(f"<BBBxHxxIIIqIIIHxxI{_HISTORY_BYTES}s"),
+    3: struct.Struct(f"<BBBxHxxIIIqIIIHxxI{_HISTORY_BYTES}s"),
+}
+_USER = _VERSION_TO_USER[VERSION]
+# Times are UTC seconds since the epoch, or _NO_TIME
+_INDEX_ENTRY = struct.Struct("<qqII")
+_NO_TIME = -(2**63)
+_EPOCH = datetime(1970, 1, 1)
+_GUILD = struct.Struct("<QQ")
+_IS_ACTIVE = 1
+_HAS_COMMITMENT = 2
+_HAS_REMINDER = 4
+
+
+class SnapshotError(Exception):
+    ...
+
+
+class LazyUsers(MutableMapping[int, "data.User"]):
+    """Users of a mapped snapshot, decoded into User objects on first access
+
+    Changes are kept in memory on top of the snapshot, which is never written
+    to.
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        self._snapshot = snapshot
+        self._member_id_to_user: dict[int, data.User] = {}
+        # Member ids of the snapshot that were deleted
+        self._deleted: set[int] = set()
+        # Users in memory that aren't in the snapshot, kept count of so that
+        # len, which every save calls, doesn't search the snapshot
+        self._num_added = 0
+
+    def __getitem__(self, member_id: int) -> data.User:
+        user = self._member_id_to_user.get(member_id)
+        if user is not None:
+            return user
+        if member_id in self._deleted:
+            raise KeyError(member_id)
+        index = self._snapshot.index_of(member_id)
+        if index is None:
+            raise KeyError(member_id)
+        user = self._member_id_to_user[member_id] = self._snapshot.user(index)
+        return user
+
+    def __setitem__(self, member_id: int, user: data.User) -> None:
+        if member_id not in self._member_id_to_user:
+            if member_id in self._deleted:
+                self._deleted.remove(member_id)
+            elif self._snapshot.index_of(member_id) is None:
+                self._num_added += 1
+        self._member_id_to_user[member_id] = user
+
+    def __delitem__(self, member_id: int) -> None:
+        if member_id not in self:
+            raise KeyError(member_id)
+        self._member_id_to_user.pop(member_id, None)
+        if self._snapshot.index_of(member_id) is None:
+            self._num_added -= 1
+        else:
+            self._deleted.add(member_id)
+
+    def __contains__(self, member_id: object) -> bool:
+        if member_id in self._member_id_to_user:
+            return True
+        if not isinstance(member_id, int) or member_id in self._deleted:
+            return False
+        return self._snapshot.index_of(member_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        for member_id in self._snapshot.member_ids:
+            if member_id not in self._deleted:
+                yield member_id
+        for member_id in self._member_id_to_user:
+            if self._snapshot.index_of(member_id) is None:
+                yield member_id
+
+    def __len__(self) -> int:
+        return (
+            len(self._snapshot.member_ids)
+            - len(self._deleted)
+            + self._num_added
+        )
+
+    def scan(self) -> Iterator[data.User]:
+        """Every user, decoding the ones not in memory without keeping them"""
+        for index, member_id in enumerate(self._snapshot.member_ids):
+            user = self._member_id_to_user.get(member_id)
+            if user is not None:
+                yield user
+            elif member_id not in self._deleted:
+                yield self._snapshot.user(index)
+        for member_id, user in self._member_id_to_user.items():
+            if self._snapshot.index_of(member_id) is None:
+                yield user
+
+    def index_entries(self) -> Iterator[data.IndexEntry]:
+        """Index entries of every user, read from the snapshot's index for
+        the users not in memory"""
+        for entry in self._snapshot.index_entries():
+            user = self._member_id_to_user.get(entry.member_id)
+            if user is not None:
+                yield data.index_entry(user)
+            elif entry.member_id not in self._deleted:
+                yield entry
+        for member_id, user in self._member_id_to_user.items():
+            if self._snapshot.index_of(member_id) is None:
+                yield data.index_entry(user)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+
+class Snapshot:
+    """Read-only view of a mapped snapshot file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _MAGIC_AND_VERSION.size:
+            raise SnapshotError(f"{path} is too short to be a snapshot")
+        magic, version = _MAGIC_AND_VERSION.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot")
+        if version not in _VERSION_TO_USER:
+            raise SnapshotError(f"Unsupported snapshot version {version}")
+        header = _VERSION_TO_HEADER[version]
+        if len(self._mmap) < header.size:
+            raise SnapshotError(f"{path} is too short to be a snapshot")
+        (
+            num_users,
+            num_guilds,
+            num_strings,
+            member_ids_offset,
+            users_offset,
+            guilds_offset,
+            strings_offset,
+            *index_offset,
+        ) = header.unpack_from(self._mmap)[2:]
+        self._user = _VERSION_TO_USER[version]
+        view = memoryview(self._mmap)
+        self.member_ids = _u64_column(view, member_ids_offset, num_users)
+        self._users_offset = users_offset
+        self._index: memoryview | None = None
+        if index_offset:
+            index_start = index_offset[0]
+            index_end = index_start + _INDEX_ENTRY.size * num_users
+            self._index = view[index_start:index_end]
+        self._guilds = view[guilds_offset:strings_offset]
+        self._string_ends = _u64_column(view, strings_offset, num_strings)
+        text_offset = strings_offset + 8 * num_strings
+        self._strings = view[text_offset:]
+        self._zones: dict[int, ZoneInfo] = {}
+
+    def index_of(self, member_id: int) -> int | None:
+        index = bisect_left(self.member_ids, member_id)
+        if index < len(self.member_ids) and self.member_ids[index] == member_id:
+            return index
+        return None
+
+    def user(self, index: int) -> data.User:
+        fields = self._user.unpack_from(
+            self._mmap, self._users_offset + index * self._user.size
+        )
+        (
+            flags,
+            repetition,
+            weekday_mask,
+            parameter,
+            zone,
+            name,
+            description,
+            next_check_in,
+            streak,
+            num_missed_in_a_row,
+            reminder,
+        ) = fields[:11]
+        history: tuple[int, ...] = ()
+        if len(fields) > 11:
+            num_recorded, longest_streak, history_bytes = fields[11:]
+            history = (
+                int.from_bytes(history_bytes, "little"),
+                num_recorded,
+                longest_streak,
+            )
+        member_id = self.member_ids[index]
+        commitment = None
+        if flags & _HAS_COMMITMENT:
+            # Commitments keep times as seconds, like the records do
+            commitment = data.Commitment.__new__(data.Commitment)
+            commitment.__setstate__(
+                (
+                    member_id,
+                    self.string(name),
+                    self.string(description),
+                    next_check_in,
+                    data.Recurrence.from_mask(
+                        repetition, weekday_mask, parameter
+                    ),
+                    streak,
+                    num_missed_in_a_row,
+                    reminder if flags & _HAS_REMINDER else None,
+                    *history,
+                )
+            )
+        if zone not in self._zones:
+            self._zones[zone] = data.to_zone(self.string(zone))
+        return data.User(
+            member_id=member_id,
+            commitment=commitment,
+            is_active=bool(flags & _IS_ACTIVE),
+            timezone=self._zones[zone],
+        )
+
+    def index_entries(self) -> Iterator[data.IndexEntry]:
+        """Index entries of every user, in member id order"""
+        if self._index is None:
+            # Snapshots before version 3 have no index
+            for index in range(len(self.member_ids)):
+                yield data.index_entry(self.user(index))
+            return
+        for member_id, (check_in_at, reminder_at, *scores) in zip(
+            self.member_ids, _INDEX_ENTRY.iter_unpack(self._index)
+        ):
+            yield data.IndexEntry(
+                member_id,
+                _to_time(check_in_at),
+                _to_time(reminder_at),
+                *scores,
+            )
+
+    def guild_id_to_channel_id(self) -> dict[int, int]:
+        return dict(_GUILD.iter_unpack(self._guilds))
+
+    def string(self, index: int) -> str:
+        start = self._string_ends[index - 1] if index else 0
+        end = self._string_ends[index]
+        return str(self._strings[start:end], "utf-8")
+
+
+def is_snapshot(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_snapshot(path: str) -> tuple[LazyUsers, dict[int, int]]:
+    snapshot = Snapshot(path)
+    return LazyUsers(snapshot), snapshot.guild_id_to_channel_id()
+
+
+def write_snapshot(
+    path: str,
+    member_id_to_user: Mapping[int, data.User],
+    guild_id_to_channel_id: Mapping[int, int],
+) -> None:
+    """Atomically replace path with a snapshot of the users and guilds"""
+    strings = _StringTable()
+    member_ids = sorted(member_id_to_user)
+    users = bytearray()
+    index = bytearray()
+    for member_id in member_ids:
+        user = member_id_to_user[member_id]
+        users += _pack_user(user, strings)
+        index += _pack_index_entry(data.index_entry(user))
+    guilds = b"".join(
+        _GUILD.pack(guild_id, channel_id)
+        for guild_id, channel_id in sorted(guild_id_to_channel_id.items())
+    )
+    string_bytes, string_ends = strings.encode()
+
+    member_ids_offset = _HEADER.size
+    users_offset = member_ids_offset + 8 * len(member_ids)
+    index_offset = users_offset + len(users)
+    guilds_offset = index_offset + len(index)
+    strings_offset = guilds_offset + len(guilds)
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(member_ids),
+        len(guild_id_to_channel_id),
+        len(string_ends),
+        member_ids_offset,
+        users_offset,
+        guilds_offset,
+        strings_offset,
+        index_offset,
+    )
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(header)
+        f.write(struct.pack(f"<{len(member_ids)}Q", *member_ids))
+        f.write(users)
+        f.write(index)
+        f.write(guilds)
+        f.write(struct.pack(f"<{len(string_ends)}Q", *string_ends))
+        f.write(string_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+def _pack_index_entry(entry: data.IndexEntry) -> bytes:
+    return _INDEX_ENTRY.pack(
+        _to_seconds(entry.check_in_at),
+        _to_seconds(entry.reminder_at),
+        entry.streak,
+        entry.num_missed_in_a_row,
+    )
+
+
+def _to_seconds(dt: datetime | None) -> int:
+    if dt is None:
+        return _NO_TIME
+    return (dt - _EPOCH) // timedelta(seconds=1)
+
+
+def _to_time(seconds: int) -> datetime | None:
+    if seconds == _NO_TIME:
+        return None
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def _u64_column(view: memoryview, offset: int, length: int) -> memoryview:
+    # Snapshots are little-endian, like every platform the bot runs on
+    end = offset + 8 * length
+    return view[offset:end].cast("Q")
+
+
+class _StringTable:
+    def __init__(self):
+        self._string_to_index: dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        index = self._string_to_index.get(value)
+        if index is None:
+            index = self._string_to_index[value] = len(self._string_to_index)
+        return index
+
+    def encode(self) -> tuple[bytes, list[int]]:
+        encoded = [value.encode() for value in self._string_to_index]
+        ends = []
+        end = 0
+        for value in encoded:
+            end += len(value)
+            ends.append(end)
+        return b"".join(encoded), ends
+
+
+def _pack_user(user: data.User, strings: _StringTable) -> bytes:
+    flags = _IS_ACTIVE if user.is_active else 0
+    zone = strings.add(user.timezone.key)
+    if user.commitment is None:
+        return _USER.pack(flags, 0, 0, 0, zone, 0, 0, 0, 0, 0, 0, 0, 0, b"")
+    (
+        _,
+        name,
+        description,
+        next_check_in,
+        recurrence,
+        streak,
+        num_missed_in_a_row,
+        reminder,
+        history,
+        num_recorded,
+        longest_streak,
+    ) = user.commitment.__getstate__()
+    flags |= _HAS_COMMITMENT
+    if reminder is not None:
+        flags |= _HAS_REMINDER
+    return _USER.pack(
+        flags,
+        recurrence.repetition,
+        recurrence.weekday_mask,
+        recurrence.parameter,
+        zone,
+        strings.add(name),
+        strings.add(description),
+        next_check_in,
+        streak,
+        num_missed_in_a_row,
+        reminder or 0,
+        num_recorded,
+        longest_streak,
+        history.to_bytes(_HISTORY_BYTES, "little"),
+    )
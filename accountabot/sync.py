@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Iterable
+
+import discord
+from discord import app_commands
+
+from . import metrics
+
+
+COMMAND_SYNCS_FILE = "command_syncs.json"
+# Pause between two syncs, so that syncing thousands of guilds after a deploy
+# trickles along instead of hitting the rate limit and stalling other requests
+SYNC_INTERVAL_SECONDS = 1.0
+# Guilds synced between two writes of the synced fingerprints, which are
+# also written once the queue is empty. Syncs not written yet when the bot
+# stops are only repeated on the next start.
+SAVE_BATCH_SIZE = 100
+logger = logging.getLogger("discord")
+
+
+@dataclass
+class CommandSync:
+    """Syncs the command tree to the guilds that don't have its latest version
+
+    The fingerprint of the tree last synced to each guild is kept in path, so
+    restarts and reconnects only sync the guilds whose commands changed.
+    Syncs run one at a time in a background task, interval seconds apart,
+    which also writes path in batches off the event loop.
+    """
+
+    tree: app_commands.CommandTree
+    path: str = COMMAND_SYNCS_FILE
+    interval: float = SYNC_INTERVAL_SECONDS
+    _guild_id_to_fingerprint: dict[int, str] | None = field(
+        default=None, repr=False
+    )
+    _fingerprint: str | None = field(default=None, repr=False)
+    _queue: deque[int] = field(default_factory=deque, repr=False)
+    _queued: set[int] = field(default_factory=set, repr=False)
+    _task: asyncio.Task | None = field(default=None, repr=False)
+    _num_unsaved: int = field(default=0, repr=False)
+
+    @property
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.tree)
+        return self._fingerprint
+
+    def is_synced(self, guild_id: int) -> bool:
+        return self._synced().get(guild_id) == self.fingerprint
+
+    def plan(self, guild_ids: Iterable[int]) -> int:
+        """Queue syncs for the guilds that are out of date
+
+        Returns how many guilds were queued.
+        """
+        num_queued = 0
+        for guild_id in guild_ids:
+            if guild_id in self._queued or self.is_synced(guild_id):
+                continue
+            self._queue.append(guild_id)
+            self._queued.add(guild_id)
+            num_queued += 1
+        if self._queue:
+            self._start()
+        return num_queued
+
+    def forget(self, guild_id: int) -> None:
+        """Drop the guild, e.g. after leaving it, so it is synced on rejoin"""
+        if guild_id in self._queued:
+            self._queued.remove(guild_id)
+            self._queue.remove(guild_id)
+        if self._synced().pop(guild_id, None) is not None:
+            self._num_unsaved += 1
+            self._start()
+
+    async def join(self) -> None:
+        """Wait until every queued guild has been synced and saved"""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        # The only writer of path, so writes never overlap
+        while self._queue or self._num_unsaved:
+            if self._queue:
+                guild_id = self._queue.popleft()
+                self._queued.remove(guild_id)
+                await self._sync(guild_id)
+            if self._num_unsaved and (
+                self._num_unsaved >= SAVE_BATCH_SIZE or not self._queue
+            ):
+                await self._save()
+            if self._queue:
+                await asyncio.sleep(self.interval)
+
+    async def _sync(self, guild_id: int) -> None:
+        guild = discord.Object(id=guild_id)
+        self.tree.copy_global_to(guild=guild)
+        try:
+            await self.tree.sync(guild=guild)
+        except discord.HTTPException as ex:
+            # Left for the next plan, e.g. the next restart, to retry
+            metrics.COMMAND_SYNCS.inc("error")
+            logger.warning(f"Failed to sync commands to guild {guild_id}: {ex}")
+            return
+        metrics.COMMAND_SYNCS.inc("ok")
+        self._synced()[guild_id] = self.fingerprint
+        self._num_unsaved += 1
+
+    def _synced(self) -> dict[int, str]:
+        if self._guild_id_to_fingerprint is None:
+            self._guild_id_to_fingerprint = _load(self.path)
+        return self._guild_id_to_fingerprint
+
+    async def _save(self) -> None:
+        self._num_unsaved = 0
+        await asyncio.to_thread(_dump, self.path, dict(self._synced()))
+
+
+def fingerprint(tree: app_commands.CommandTree) -> str:
+    """Hash of the global commands as they are sent to Discord"""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands()),
+        key=lambda command: (command["type"], command["name"]),
+    )
+    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def _dump(path: str, guild_id_to_fingerprint: dict[int, str]) -> None:
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(
+            {
+                str(guild_id): fingerprint
+                for guild_id, fingerprint in guild_id_to_fingerprint.items()
+            },
+            f,
+        )
+    os.replace(temp_path, path)
+
+
+def _load(path: str) -> dict[int, str]:
+    try:
+        with open(path) as f:
+            guild_id_to_fingerprint = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning(f"Ignoring unreadable command syncs in {path}")
+        return {}
+    return {
+        int(guild_id): fingerprint
+        for guild_id, fingerprint in guild_id_to_fingerprint.items()
+    }
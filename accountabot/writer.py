@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Callable
+from typing import Generic
+from typing import Iterable
+from typing import TypeVar
+
+
+# Items submitted within this window are written together as one batch
+COALESCE_SECONDS = 1.0
+T = TypeVar("T")
+logger = logging.getLogger("discord")
+
+
+class WriteBehind(Generic[T]):
+    """Background thread applying submitted items in coalesced batches
+
+    Submitting never blocks on I/O. A failed batch is logged and retried with
+    the next batch so that nothing submitted is dropped.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[T]], None],
+        name: str,
+        delay: float = COALESCE_SECONDS,
+    ):
+        self._write = write
+        self._name = name
+        self._delay = delay
+        self._condition = threading.Condition()
+        self._pending: list[T] = []
+        self._num_submitted = 0
+        self._num_written = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def submit(self, items: Iterable[T]) -> None:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self._name} is closed")
+            self._pending.extend(items)
+            self._num_submitted += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self._name, daemon=True
+                )
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._condition:
+            target = self._num_submitted
+            self._flush_requested = True
+            self._condition.notify_all()
+            return self._condition.wait_for(
+                lambda: self._num_written >= target, timeout
+            )
+
+    def close(self, timeout: float | None = None) -> bool:
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return flushed
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                self._condition.wait_for(
+                    lambda: self._flush_requested or self._closed, self._delay
+                )
+                items, self._pending = self._pending, []
+                target = self._num_submitted
+                self._flush_requested = False
+            try:
+                self._write(items)
+            except Exception:
+                logger.exception(f"{self._name} failed to write, retrying")
+                with self._condition:
+                    self._pending[:0] = items
+                    if self._closed:
+                        return
+                continue
+            with self._condition:
+                self._num_written = target
+                self._condition.notify_all()
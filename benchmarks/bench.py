@@ -0,0 +1,292 @@
+"""Data-layer micro-benchmarks
+
+Run the suite and write the results as JSON:
+
+    python -m benchmarks.bench run --sizes 1000 100000 --output after.json
+
+Compare two runs, exiting with 1 if any benchmark got slower than the
+threshold allows:
+
+    python -m benchmarks.bench compare before.json after.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+from typing import Callable
+from zoneinfo import ZoneInfo
+
+from accountabot import data
+from accountabot.data import Recurrence
+from accountabot.data import set_users
+from accountabot.data import Users
+from accountabot.loop import commitment_check_loop
+from accountabot.membership import get_guild_index
+from accountabot.message import invalidate_announcement_channel
+from accountabot.schedule import Schedule
+from accountabot.schedule import set_schedule
+from benchmarks.population import generate_users
+from benchmarks.population import mock_client
+from benchmarks.population import mock_guilds
+from benchmarks.population import PopulationConfig
+from benchmarks.population import RECURRENCES
+from benchmarks.population import TIMEZONES
+
+
+NUM_RECURRENCE_CALLS = 100_000
+DEFAULT_THRESHOLD = 0.1
+
+
+@dataclass
+class Result:
+    name: str
+    size: int
+    repeat: int
+    min: float
+    median: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.size}]"
+
+
+def measure(
+    name: str,
+    size: int,
+    run: Callable[[], object],
+    setup: Callable[[], object] = lambda: None,
+    repeat: int = 5,
+) -> Result:
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    result = Result(
+        name=name,
+        size=size,
+        repeat=repeat,
+        min=min(timings),
+        median=statistics.median(timings),
+    )
+    print(f"{result.key:<40} {result.median * 1000:>12.3f} ms", file=sys.stderr)
+    return result
+
+
+def bench_users(config: PopulationConfig, repeat: int) -> list[Result]:
+    population = generate_users(config)
+    users = Users(member_id_to_user={})
+
+    def setup_save():
+        nonlocal users
+        users.close()
+        for path in [data.USERS_FILE, data.USERS_JOURNAL_FILE]:
+            if os.path.exists(path):
+                os.remove(path)
+        users = Users(member_id_to_user=population)
+        for user in population.values():
+            users.record(user)
+
+    def save():
+        users.save()
+        users.flush()
+
+    results = [
+        measure("users.save", config.num_users, save, setup_save, repeat)
+    ]
+    users.close()
+    results.append(
+        measure(
+            "users.load",
+            config.num_users,
+            lambda: Users(member_id_to_user={}).load(),
+            repeat=repeat,
+        )
+    )
+    results.append(
+        measure(
+            "user.str",
+            config.num_users,
+            lambda: [str(user) for user in population.values()],
+            repeat=repeat,
+        )
+    )
+    return results
+
+
+def bench_loop_tick(
+    config: PopulationConfig, num_guilds: int, repeat: int
+) -> Result:
+    event_loop = asyncio.new_event_loop()
+    client = mock_client([])
+    users = Users(member_id_to_user={})
+
+    def setup():
+        nonlocal client, users
+        users.close()
+        users = Users(member_id_to_user=generate_users(config))
+        set_users(users)
+        schedule = Schedule()
+        schedule.rebuild(users.member_id_to_user.values())
+        set_schedule(schedule)
+        guilds = mock_guilds(list(users.member_id_to_user), num_guilds)
+        client = mock_client(guilds)
+        get_guild_index().rebuild(guilds, users.member_id_to_user)
+        invalidate_announcement_channel()
+
+    def tick():
+        event_loop.run_until_complete(commitment_check_loop(client))
+
+    result = measure("loop.tick", config.num_users, tick, setup, repeat)
+    users.close()
+    event_loop.close()
+    return result
+
+
+def bench_recurrences(repeat: int) -> list[Result]:
+    recurrences = [Recurrence.from_str(value) for value in RECURRENCES]
+    start = datetime(2023, 1, 1, 23, 59, 59)
+    dts = [
+        start + timedelta(hours=7 * i)
+        for i in range(NUM_RECURRENCE_CALLS // len(recurrences))
+    ]
+
+    def next_occurences():
+        for recurrence in recurrences:
+            for dt in dts:
+                recurrence.next_occurence(dt)
+
+    values = RECURRENCES * (NUM_RECURRENCE_CALLS // len(RECURRENCES))
+    return [
+        measure(
+            "recurrence.next_occurence",
+            len(dts) * len(recurrences),
+            next_occurences,
+            repeat=repeat,
+        ),
+        measure(
+            "recurrence.from_str",
+            len(values),
+            lambda: [Recurrence.from_str(value) for value in values],
+            repeat=repeat,
+        ),
+    ]
+
+
+def run(args: argparse.Namespace) -> int:
+    results = bench_recurrences(args.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            for size in args.sizes:
+                config = PopulationConfig(
+                    num_users=size,
+                    commitment_density=args.commitment_density,
+                    reminder_density=args.reminder_density,
+                    overdue_density=args.overdue_density,
+                    timezones=[ZoneInfo(key) for key in args.timezones],
+                    seed=args.seed,
+                )
+                results += bench_users(config, args.repeat)
+                results.append(
+                    bench_loop_tick(config, args.num_guilds, args.repeat)
+                )
+        finally:
+            os.chdir(cwd)
+    report = {
+        "metadata": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "arguments": vars(args) | {"func": None},
+        },
+        "results": {result.key: asdict(result) for result in results},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as f:
+            f.write(output)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys()):
+        before = baseline[key]["median"]
+        after = current[key]["median"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions.append(key)
+        print(
+            f"{key:<40} {before * 1000:>12.3f} ms {after * 1000:>12.3f} ms "
+            f"{change:>+8.1%} {flag}"
+        )
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(f"{key:<40} only in one run")
+    if regressions:
+        print(
+            f"{len(regressions)} benchmark(s) regressed by more than "
+            f"{args.threshold:.0%}"
+        )
+        return 1
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 100_000]
+    )
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--commitment-density", type=float, default=0.9)
+    run_parser.add_argument("--reminder-density", type=float, default=0.5)
+    run_parser.add_argument("--overdue-density", type=float, default=0.01)
+    run_parser.add_argument("--timezones", nargs="+", default=TIMEZONES)
+    run_parser.add_argument("--num-guilds", type=int, default=10)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="defaults to stdout")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="flag regressions between two runs"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="allowed slowdown of the median, as a fraction",
+    )
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""End-to-end load harness for the slash commands
+
+Drives the registered command_tree handlers with fake interactions at a given
+arrival rate and concurrency while the commitment check loop ticks
+concurrently, then reports time-to-first-response per command and event loop
+lag:
+
+    python -m benchmarks.load --users 100000 --rate 200 --requests 5000
+
+Interactions are dispatched the way CommandTree does it (the response budget,
+checks, argument transformers, the command callback and the tree's error
+handler), so failed checks are answered by on_error and slow handlers are
+deferred like they would be on Discord.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import MagicMock
+
+import discord
+from discord import app_commands
+
+from accountabot import commands  # noqa: F401 registers the commands
+from accountabot.accountabot import command_tree
+from accountabot.data import get_users
+from accountabot.data import set_users
+from accountabot.data import Users
+from accountabot.database import use_sqlite_storage
+from accountabot.loop import commitment_check_loop
+from accountabot.membership import get_guild_index
+from accountabot.message import INTERACTION_DEADLINE_SECONDS
+from accountabot.message import start_response_budget
+from accountabot.schedule import get_schedule
+from benchmarks.population import generate_users
+from benchmarks.population import mock_client
+from benchmarks.population import mock_guilds
+from benchmarks.population import PopulationConfig
+from benchmarks.population import RECURRENCES
+from benchmarks.population import TIMEZONES
+
+
+LAG_SAMPLE_SECONDS = 0.01
+DEFAULT_MIX = {
+    "register": 1.0,
+    "commit": 1.0,
+    "check": 3.0,
+    "remind": 1.0,
+    "info": 3.0,
+    "toggle-active": 0.5,
+}
+PERCENTILES = [50, 95, 99]
+
+
+@dataclass
+class Stats:
+    command_to_latencies: defaultdict[str, list[float]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+    command_to_num_errors: defaultdict[str, int] = field(
+        default_factory=lambda: defaultdict(int)
+    )
+    lags: list[float] = field(default_factory=list)
+    ticks: list[float] = field(default_factory=list)
+
+
+class FakeInteraction:
+    """Interaction whose responses go to a fake REST layer
+
+    Records when the first response was sent, measured from when the
+    interaction arrived.
+    """
+
+    def __init__(
+        self, member_id: int, guild: discord.Guild, rest_latency: float
+    ):
+        self.arrived_at = time.perf_counter()
+        self.first_response_at: float | None = None
+        self._rest_latency = rest_latency
+        self.interaction = MagicMock(spec=discord.Interaction)
+        self.interaction.user.id = member_id
+        self.interaction.user.mutual_guilds = [guild]
+        self.interaction.guild_id = guild.id
+        self.interaction.extras = {}
+        self.interaction.response.is_done = self._is_done
+        self.interaction.response.send_message = self._respond
+        self.interaction.response.defer = self._respond
+        self.interaction.followup.send = self._respond
+
+    def _is_done(self) -> bool:
+        return self.first_response_at is not None
+
+    async def _respond(self, *_, **__) -> None:
+        if self.first_response_at is None:
+            self.first_response_at = time.perf_counter()
+        await asyncio.sleep(self._rest_latency)
+
+    @property
+    def latency(self) -> float | None:
+        if self.first_response_at is None:
+            return None
+        return self.first_response_at - self.arrived_at
+
+
+def command_options(name: str, rng: random.Random) -> dict[str, Any]:
+    """Raw option values as Discord would send them for a command"""
+    if name == "register":
+        return {"timezone": rng.choice(TIMEZONES)}
+    if name == "commit":
+        options = {
+            "name": "Load test",
+            "description": "Commitment created by the load harness",
+            "recurrence": rng.choice(RECURRENCES),
+        }
+        if rng.random() < 0.5:
+            options["reminder"] = "8:00 PM"
+        return options
+    if name == "remind":
+        return {"reminder": f"{rng.randrange(1, 13)}:30 AM"}
+    return {}
+
+
+async def dispatch(
+    command: app_commands.Command, interaction: discord.Interaction, options
+) -> bool:
+    start_response_budget(interaction)
+    try:
+        await command._invoke_with_namespace(
+            interaction, SimpleNamespace(**options)  # type: ignore
+        )
+        return True
+    except app_commands.AppCommandError as error:
+        await command_tree.on_error(interaction, error)
+        return False
+
+
+async def run_load(
+    args: argparse.Namespace, guilds: list[discord.Guild], stats: Stats
+) -> None:
+    rng = random.Random(args.seed)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    pending = set()
+
+    async def handle(name: str, fake: FakeInteraction, options) -> None:
+        async with semaphore:
+            command = command_tree.get_command(name)
+            assert isinstance(command, app_commands.Command)
+            if not await dispatch(command, fake.interaction, options):
+                stats.command_to_num_errors[name] += 1
+        if fake.latency is not None:
+            stats.command_to_latencies[name].append(fake.latency)
+
+    for _ in range(args.requests):
+        await asyncio.sleep(rng.expovariate(args.rate))
+        name = rng.choices(names, weights)[0]
+        # Some registrations come from new users
+        member_id = rng.randrange(1, int(args.users * 1.1) + 2)
+        fake = FakeInteraction(member_id, rng.choice(guilds), args.rest_latency)
+        task = asyncio.create_task(
+            handle(name, fake, command_options(name, rng))
+        )
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    await asyncio.gather(*pending)
+
+
+async def run_loop(
+    client: discord.Client, interval: float, stats: Stats
+) -> None:
+    while True:
+        start = time.perf_counter()
+        await commitment_check_loop(client)
+        stats.ticks.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def monitor_lag(stats: Stats) -> None:
+    while True:
+        expected = time.perf_counter() + LAG_SAMPLE_SECONDS
+        await asyncio.sleep(LAG_SAMPLE_SECONDS)
+        stats.lags.append(max(time.perf_counter() - expected, 0.0))
+
+
+async def run(args: argparse.Namespace) -> Stats:
+    stats = Stats()
+    guilds = prepare(args)
+    background = [
+        asyncio.create_task(
+            run_loop(mock_client(guilds), args.tick_interval, stats)
+        ),
+        asyncio.create_task(monitor_lag(stats)),
+    ]
+    try:
+        await run_load(args, guilds, stats)
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        get_users().close()
+    return stats
+
+
+def prepare(args: argparse.Namespace) -> list[discord.Guild]:
+    """Persist a synthetic population and load it like on_ready would"""
+    population = generate_users(
+        PopulationConfig(num_users=args.users, seed=args.seed)
+    )
+    users = Users(member_id_to_user=population)
+    for user in population.values():
+        users.record(user)
+    users.close()
+    if args.backend == "sqlite":
+        use_sqlite_storage()
+    else:
+        set_users(Users(member_id_to_user={}))
+    users = get_users()
+    users.load()
+    get_schedule().rebuild(users.member_id_to_user.values())
+    guilds = mock_guilds(list(users.member_id_to_user), args.num_guilds)
+    get_guild_index().rebuild(guilds, users.member_id_to_user)
+    return guilds
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(int(len(ordered) * percent / 100 + 0.5) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(stats: Stats) -> dict[str, Any]:
+    def distribution(values: list[float]) -> dict[str, float]:
+        if not values:
+            return {}
+        summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+        summary["max"] = max(values)
+        return summary
+
+    return {
+        "commands": {
+            name: {
+                "count": len(latencies),
+                "errors": stats.command_to_num_errors[name],
+                "deadline_misses": sum(
+                    latency > INTERACTION_DEADLINE_SECONDS
+                    for latency in latencies
+                ),
+                "time_to_first_response": distribution(latencies),
+            }
+            for name, latencies in sorted(stats.command_to_latencies.items())
+        },
+        "event_loop_lag": distribution(stats.lags),
+        "loop_tick": distribution(stats.ticks) | {"count": len(stats.ticks)},
+    }
+
+
+def print_summary(summary: dict[str, Any]) -> None:
+    columns = [f"p{p}" for p in PERCENTILES] + ["max"]
+    header = "".join(f"{column:>10}" for column in columns)
+    print(f"{'':<24}{'count':>8}{'errors':>8}{'late':>6}{header}  (ms)")
+
+    def row(distribution: dict[str, float]) -> str:
+        return "".join(
+            f"{distribution.get(column, 0.0) * 1000:>10.2f}"
+            for column in columns
+        )
+
+    for name, command in summary["commands"].items():
+        print(
+            f"{name:<24}{command['count']:>8}{command['errors']:>8}"
+            f"{command['deadline_misses']:>6}"
+            f"{row(command['time_to_first_response'])}"
+        )
+    print(f"{'event loop lag':<46}{row(summary['event_loop_lag'])}")
+    tick = summary["loop_tick"]
+    print(f"{'loop tick':<24}{tick['count']:>8}{'':<14}{row(tick)}")
+
+
+def _mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown command '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument(
+        "--rate", type=float, default=100.0, help="interactions per second"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=50,
+        help="interactions handled at once",
+    )
+    parser.add_argument(
+        "--mix",
+        type=_mix,
+        default=DEFAULT_MIX,
+        help="command weights, e.g. 'check=3,info=1'",
+    )
+    parser.add_argument(
+        "--tick-interval",
+        type=float,
+        default=1.0,
+        help="seconds between loop ticks",
+    )
+    parser.add_argument(
+        "--rest-latency",
+        type=float,
+        default=0.05,
+        help="seconds each fake REST call takes",
+    )
+    parser.add_argument("--num-guilds", type=int, default=10)
+    parser.add_argument(
+        "--backend", choices=["pickle", "sqlite"], default="pickle"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            stats = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+    summary = summarize(stats)
+    print_summary(summary)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
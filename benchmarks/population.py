@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from datetime import time
+from datetime import timedelta
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+from zoneinfo import ZoneInfo
+
+import discord
+
+from accountabot.data import Commitment
+from accountabot.data import Recurrence
+from accountabot.data import User
+from accountabot.data import user_time
+
+
+TIMEZONES = [
+    "America/Los_Angeles",
+    "America/New_York",
+    "Europe/London",
+    "Europe/Berlin",
+    "Asia/Kolkata",
+    "Asia/Tokyo",
+    "Australia/Sydney",
+]
+RECURRENCES = [
+    "daily",
+    "weekly on Mon, Wed, Fri",
+    "weekly on Sat, Sun",
+    "every 3 days",
+    "3 times per week",
+    "monthly on day 31",
+]
+
+
+@dataclass
+class PopulationConfig:
+    num_users: int
+    # Fraction of users with a commitment
+    commitment_density: float = 0.9
+    # Fraction of commitments with a reminder
+    reminder_density: float = 0.5
+    # Fraction of commitments whose check in is already due
+    overdue_density: float = 0.01
+    timezones: list[ZoneInfo] = field(
+        default_factory=lambda: [ZoneInfo(key) for key in TIMEZONES]
+    )
+    seed: int = 0
+
+
+def generate_users(
+    config: PopulationConfig, now: datetime | None = None
+) -> dict[int, User]:
+    """Random users with commitments spread over the next week"""
+    rng = random.Random(config.seed)
+    utc_now = now or datetime.utcnow()
+    recurrences = [Recurrence.from_str(value) for value in RECURRENCES]
+    member_id_to_user = {}
+    for member_id in range(1, config.num_users + 1):
+        user = User(
+            member_id=member_id,
+            commitment=None,
+            is_active=True,
+            timezone=rng.choice(config.timezones),
+        )
+        if rng.random() < config.commitment_density:
+            if rng.random() < config.overdue_density:
+                offset = -rng.randrange(1, 3 * 24 * 60)
+            else:
+                offset = rng.randrange(1, 7 * 24 * 60)
+            reminder = None
+            if rng.random() < config.reminder_density:
+                reminder = time(rng.randrange(24), rng.randrange(60))
+            user.commitment = Commitment(
+                owner_id=member_id,
+                name=f"Commitment {member_id}",
+                description="Work on my habit for at least half an hour",
+                next_check_in=user_time(user, utc_now)
+                + timedelta(minutes=offset),
+                recurrence=rng.choice(recurrences),
+                streak=rng.randrange(100),
+                num_missed_in_a_row=0,
+                reminder=reminder,
+            )
+        member_id_to_user[member_id] = user
+    return member_id_to_user
+
+
+def mock_guild(guild_id: int, member_ids: list[int]) -> discord.Guild:
+    """Guild whose members are member_ids, with one writable text channel"""
+    guild = MagicMock(spec=discord.Guild, id=guild_id)
+    guild.members = [
+        MagicMock(spec=discord.Member, id=member_id) for member_id in member_ids
+    ]
+    channel = MagicMock(spec=discord.TextChannel, guild=guild)
+    channel.send = AsyncMock()
+    guild.text_channels = [channel]
+    guild.get_channel.return_value = None
+    return guild
+
+
+def mock_guilds(member_ids: list[int], num_guilds: int) -> list[discord.Guild]:
+    """Mock guilds with the members spread evenly across them"""
+    return [
+        mock_guild(guild_id, member_ids[guild_id::num_guilds])
+        for guild_id in range(num_guilds)
+    ]
+
+
+def mock_client(guilds: list[discord.Guild]) -> discord.Client:
+    """Client connected to guilds"""
+    client = MagicMock(spec=discord.Client, guilds=guilds)
+    client.get_guild.side_effect = {guild.id: guild for guild in guilds}.get
+    return client
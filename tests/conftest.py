@@ -2,24 +2,30 @@ from datetime import datetime
 from datetime import timedelta
 from unittest.mock import MagicMock
 from unittest.mock import patch
+from zoneinfo import ZoneInfo
 
 import discord
 import pytest
 from discord import Interaction
 
 from accountabot.data import Commitment
+from accountabot.data import index_entry
 from accountabot.data import Recurrence
 from accountabot.data import Repetition
-from accountabot.data import Timezone
 from accountabot.data import User
 from accountabot.data import user_time
 from accountabot.data import Users
+from accountabot.leaderboard import Leaderboard
+from accountabot.membership import GuildIndex
+from accountabot.message import invalidate_announcement_channel
+from accountabot.schedule import Schedule
 
 
 UNREGISTERED_USER_ID = 0
 UNCOMMITED_USER_ID = 1
 COMMITTED_USER_ID = 2
 OVERDUE_COMMITED_USER_ID = 3
+GUILD_ID = 100
 
 
 MOCK_DATETIME = datetime(2022, 12, 20, 5, 0, 0, 0)
@@ -35,9 +41,16 @@ class MockSendMessage(MagicMock):
         return mock_send_message()
 
 
+@pytest.fixture(autouse=True)
+def _working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
 @pytest.fixture
 def _interaction():
     interaction = MagicMock(spec=Interaction)
+    interaction.extras = {}
+    interaction.response.is_done.return_value = False
     interaction.response.send_message = MockSendMessage()
     return interaction
 
@@ -69,13 +82,24 @@ def users():
             UNCOMMITED_USER_ID: _get_user(committed=False),
             OVERDUE_COMMITED_USER_ID: _get_user(committed=True, overdue=True),
         },
+        guild_id_to_channel_id={},
+    )
+    users.index_entries.side_effect = lambda: map(
+        index_entry, users.member_id_to_user.values()
     )
     return users
 
 
+@pytest.fixture
+def schedule(users):
+    schedule = Schedule()
+    schedule.rebuild(users.member_id_to_user.values())
+    return schedule
+
+
 @pytest.fixture
 def guild():
-    guild = MagicMock(spec=discord.Guild)
+    guild = MagicMock(spec=discord.Guild, id=GUILD_ID)
     guild.members = [
         MagicMock(spec=discord.Member, id=id)
         for id in [
@@ -92,6 +116,59 @@ def guild():
     return guild
 
 
+@pytest.fixture
+def client(guild):
+    client = MagicMock(spec=discord.Client)
+    client.guilds = [guild]
+    client.get_guild.side_effect = lambda guild_id: next(
+        (guild for guild in client.guilds if guild.id == guild_id), None
+    )
+    return client
+
+
+@pytest.fixture
+def guild_index(guild, users):
+    guild_index = GuildIndex()
+    guild_index.rebuild([guild], users.member_id_to_user)
+    return guild_index
+
+
+@pytest.fixture
+def leaderboard(users, guild_index):
+    leaderboard = Leaderboard()
+    leaderboard.rebuild(users.member_id_to_user.values(), guild_index)
+    return leaderboard
+
+
+@pytest.fixture(autouse=True)
+def patch_leaderboard(leaderboard):
+    with (
+        patch("accountabot.commands.get_leaderboard") as commands_leaderboard,
+        patch("accountabot.loop.get_leaderboard") as loop_leaderboard,
+    ):
+        commands_leaderboard.return_value = leaderboard
+        loop_leaderboard.return_value = leaderboard
+        yield
+
+
+@pytest.fixture(autouse=True)
+def patch_guild_index(guild_index):
+    with (
+        patch("accountabot.commands.get_guild_index") as commands_index,
+        patch("accountabot.loop.get_guild_index") as loop_index,
+    ):
+        commands_index.return_value = guild_index
+        loop_index.return_value = guild_index
+        yield
+
+
+@pytest.fixture(autouse=True)
+def reset_announcement_channels():
+    invalidate_announcement_channel()
+    yield
+    invalidate_announcement_channel()
+
+
 @pytest.fixture(autouse=True)
 def patch_users(users):
     with (
@@ -103,11 +180,22 @@ def patch_users(users):
         yield
 
 
+@pytest.fixture(autouse=True)
+def patch_schedule(schedule):
+    with (
+        patch("accountabot.commands.get_schedule") as commands_schedule,
+        patch("accountabot.loop.get_schedule") as loop_schedule,
+    ):
+        commands_schedule.return_value = schedule
+        loop_schedule.return_value = schedule
+        yield
+
+
 @pytest.fixture(autouse=True)
 def patch_now():
     with (
-        patch("accountabot.commands.datetime") as commands_dt,
-        patch("accountabot.loop.datetime") as loop_dt,
+        patch("accountabot.commands.datetime", wraps=datetime) as commands_dt,
+        patch("accountabot.loop.datetime", wraps=datetime) as loop_dt,
     ):
         commands_dt.utcnow.return_value = MOCK_DATETIME
         loop_dt.utcnow.return_value = MOCK_DATETIME
@@ -127,7 +215,7 @@ def _get_user(committed: bool, overdue: bool = False):
         member_id=member_id,
         commitment=None,
         is_active=True,
-        timezone=Timezone.PST,
+        timezone=ZoneInfo("America/Los_Angeles"),
     )
     user_now = user_time(user, MOCK_DATETIME)
     commitment = Commitment(
@@ -0,0 +1,60 @@
+import discord
+import pytest
+
+from accountabot import metrics
+from accountabot.accountabot import _shard_config
+from accountabot.accountabot import command_tree
+from accountabot.message import _DEFERRAL
+
+
+@pytest.mark.parametrize(
+    ["env", "expected"],
+    [
+        ({}, (None, None)),
+        ({"SHARD_COUNT": "4"}, (4, None)),
+        ({"SHARD_COUNT": "4", "SHARD_IDS": "3,1"}, (4, [1, 3])),
+    ],
+)
+def test_shard_config(
+    env: dict[str, str], expected, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.delenv("SHARD_COUNT", raising=False)
+    monkeypatch.delenv("SHARD_IDS", raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+
+    assert _shard_config() == expected
+
+
+@pytest.mark.parametrize(
+    "env",
+    [
+        {"SHARD_IDS": "0"},
+        {"SHARD_COUNT": "2", "SHARD_IDS": "0,2"},
+        {"SHARD_COUNT": "2", "SHARD_IDS": ""},
+        {"SHARD_COUNT": "2", "SHARD_IDS": ","},
+    ],
+)
+def test_shard_config_invalid_throws(
+    env: dict[str, str], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.delenv("SHARD_COUNT", raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+
+    with pytest.raises(RuntimeError):
+        _shard_config()
+
+
+@pytest.mark.asyncio
+async def test_interaction_check_only_times_commands(_interaction):
+    _interaction.type = discord.InteractionType.autocomplete
+
+    assert await command_tree.interaction_check(_interaction)
+    assert _interaction.extras == {}
+
+    _interaction.type = discord.InteractionType.application_command
+
+    assert await command_tree.interaction_check(_interaction)
+    assert metrics.COMMAND_STARTED_AT in _interaction.extras
+    await _interaction.extras[_DEFERRAL].stop()
@@ -0,0 +1,215 @@
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from accountabot import admin
+from accountabot import data
+from accountabot.data import User
+from accountabot.data import Users
+from accountabot.database import SqliteUsers
+from accountabot.snapshot import is_snapshot
+from tests.conftest import _get_user
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import OVERDUE_COMMITED_USER_ID
+from tests.conftest import UNCOMMITED_USER_ID
+
+
+@pytest.fixture(autouse=True)
+def restore_snapshot_format(monkeypatch):
+    monkeypatch.setattr(data, "SNAPSHOT_FORMAT", data.SNAPSHOT_FORMAT)
+
+
+@pytest.fixture
+def population() -> dict[int, User]:
+    committed = _get_user(committed=True)
+    for missed in [False, True, False, False]:
+        committed.commitment.cycle_check_in(missed=missed)
+    committed.commitment.name = "Läufe"
+    users = [
+        committed,
+        _get_user(committed=False),
+        _get_user(committed=True, overdue=True),
+    ]
+    return {user.member_id: user for user in users}
+
+
+@pytest.fixture
+def store(population: dict[int, User]) -> dict[int, User]:
+    users = Users(member_id_to_user={})
+    for user in population.values():
+        users.record(user)
+    users.set_announcement_channel(10, 100)
+    users.close()
+    return population
+
+
+def _load_users() -> Users:
+    users = Users(member_id_to_user={})
+    users.load()
+    users.close()
+    return users
+
+
+def test_export_and_import_round_trip_through_sqlite(
+    store: dict[int, User], capsys
+):
+    assert admin.main(["export", "users.jsonl"]) == 0
+    assert admin.main(["--backend", "sqlite", "import", "users.jsonl"]) == 0
+
+    sqlite_users = SqliteUsers(data.USERS_DB_FILE)
+    sqlite_users.load()
+    sqlite_users.close()
+
+    assert sqlite_users.member_id_to_user == store
+    assert sqlite_users.guild_id_to_channel_id == {10: 100}
+
+    with open("users.jsonl") as f:
+        exported = f.read()
+    capsys.readouterr()
+    admin.main(["--backend", "sqlite", "export"])
+
+    assert sorted(capsys.readouterr().out.splitlines()) == sorted(
+        exported.splitlines()
+    )
+
+    assert admin.main(["--backend", "sqlite", "inspect", "404"]) == 1
+    assert (
+        admin.main(["--backend", "sqlite", "inspect", str(COMMITTED_USER_ID)])
+        == 0
+    )
+    assert '"name": "Läufe"' in capsys.readouterr().out
+
+
+def test_import_replaces_existing_users(store: dict[int, User]):
+    user = store[COMMITTED_USER_ID]
+    user.is_active = False
+    with open("users.jsonl", "w") as f:
+        f.writelines(admin.export_lines([user], []))
+
+    assert admin.main(["import", "users.jsonl"]) == 0
+
+    users = _load_users()
+    assert users.member_id_to_user == store
+    assert users.guild_id_to_channel_id == {10: 100}
+
+
+def test_import_does_not_keep_users_in_memory(
+    store: dict[int, User], monkeypatch
+):
+    monkeypatch.setattr(admin, "IMPORT_BATCH_SIZE", 1)
+    monkeypatch.setattr(data, "COMPACTION_MIN_RECORDS", 1)
+    assert admin.main(["migrate", "mmap"]) == 0
+    users = admin._open("mmap", read_only=False)
+
+    assert admin._write(users, store.values()) == 3
+    assert len(users.member_id_to_user._member_id_to_user) == 0
+    assert os.path.exists(data.USERS_JOURNAL_FILE)
+
+    users.close()
+    assert dict(_load_users().member_id_to_user) == store
+
+
+def test_import_rejects_invalid_lines(store: dict[int, User]):
+    with open("users.jsonl", "w") as f:
+        f.write('{"type": "user", "member_id": 5}\n')
+
+    with pytest.raises(ValueError, match="Line 1"):
+        admin.main(["import", "users.jsonl"])
+
+
+def test_migrate_between_backends(store: dict[int, User]):
+    assert admin.main(["migrate", "mmap"]) == 0
+
+    assert is_snapshot(data.USERS_FILE)
+    assert dict(_load_users().member_id_to_user) == store
+    assert not os.path.exists(data.USERS_JOURNAL_FILE)
+
+    assert admin.main(["--backend", "mmap", "migrate", "sqlite"]) == 0
+    assert admin.main(["--backend", "mmap", "migrate", "sqlite"]) == 1
+
+    sqlite_users = SqliteUsers(data.USERS_DB_FILE)
+    sqlite_users.load()
+    sqlite_users.close()
+    assert sqlite_users.member_id_to_user == store
+
+
+def test_inspect_stats_and_verify(store: dict[int, User], capsys):
+    assert admin.main(["inspect", str(COMMITTED_USER_ID)]) == 0
+    assert '"name": "Läufe"' in capsys.readouterr().out
+    assert admin.main(["inspect", "404"]) == 1
+
+    admin.main(["stats"])
+    output = capsys.readouterr().out
+
+    assert "users: 3\n" in output
+    assert "commitments: 2\n" in output
+    assert "longest streak: 2\n" in output
+    assert admin.main(["verify"]) == 0
+
+    user = store[OVERDUE_COMMITED_USER_ID]
+    user.commitment.owner_id = UNCOMMITED_USER_ID
+    user.commitment.streak = 3
+    problems = list(admin.problems_of(user))
+
+    assert problems == [
+        f"commitment is owned by {UNCOMMITED_USER_ID}",
+        "longest streak is shorter than the current streak",
+    ]
+
+
+def test_reading_commands_leave_the_store_unchanged(
+    store: dict[int, User], capsys
+):
+    user = store[COMMITTED_USER_ID]
+    with open(f"{data.USERS_JOURNAL_FILE}.compacting", "wb") as f:
+        pickle.dump((user.member_id, user), f)
+    with open(data.USERS_JOURNAL_FILE, "ab") as f:
+        f.write(b"partial")
+    files = {path: _read(path) for path in os.listdir(".")}
+
+    for argv in [["stats"], ["inspect", str(COMMITTED_USER_ID)], ["verify"]]:
+        admin.main(argv)
+    capsys.readouterr()
+    admin.main(["export"])
+
+    assert {path: _read(path) for path in os.listdir(".")} == files
+    assert len(capsys.readouterr().out.splitlines()) == 4
+
+
+def test_reading_commands_dont_create_or_change_sqlite_store(
+    store: dict[int, User], capsys
+):
+    assert admin.main(["--backend", "sqlite", "stats"]) == 1
+    assert "No database" in capsys.readouterr().err
+    assert not os.path.exists(data.USERS_DB_FILE)
+
+    admin.main(["export", "users.jsonl"])
+    admin.main(["--backend", "sqlite", "import", "users.jsonl"])
+    files = {path: _read(path) for path in os.listdir(".")}
+
+    for command in ["stats", "verify", "export"]:
+        assert admin.main(["--backend", "sqlite", command]) == 0
+    admin.main(["--backend", "sqlite", "inspect", str(COMMITTED_USER_ID)])
+
+    assert {path: _read(path) for path in os.listdir(".")} == files
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_admin_does_not_import_discord():
+    code = "import sys, accountabot.admin; print('discord' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert output == "False\n"
@@ -1,13 +1,18 @@
 from datetime import time
+from zoneinfo import ZoneInfo
 
 import pytest
+from discord import Guild
 from discord import Interaction
 from discord.app_commands.errors import AppCommandError
 
+from accountabot.commands import _TimezoneTransformer
 from accountabot.commands import check
 from accountabot.commands import commit
 from accountabot.commands import delete
+from accountabot.commands import history
 from accountabot.commands import info
+from accountabot.commands import leaderboard
 from accountabot.commands import register
 from accountabot.commands import remind
 from accountabot.commands import toggle_active
@@ -15,19 +20,32 @@ from accountabot.data import Recurrence
 from accountabot.data import Repetition
 from accountabot.data import Timezone
 from accountabot.data import Users
+from accountabot.membership import GuildIndex
+from accountabot.schedule import Schedule
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import GUILD_ID
 
 
 @pytest.mark.asyncio
 async def test_register_new_user(
-    interaction_with_unregistered_user: Interaction, users: Users
+    interaction_with_unregistered_user: Interaction,
+    users: Users,
+    guild: Guild,
+    guild_index: GuildIndex,
 ):
     member_id = interaction_with_unregistered_user.user.id
+    interaction_with_unregistered_user.user.mutual_guilds = [guild]
     previous_num_users = len(users.member_id_to_user)
-    await register.callback(interaction_with_unregistered_user, Timezone.MST)
+    await register.callback(
+        interaction_with_unregistered_user, ZoneInfo("America/Denver")
+    )
 
     assert member_id in users.member_id_to_user
-    assert users.member_id_to_user[member_id].timezone == Timezone.MST
+    assert users.member_id_to_user[member_id].timezone == ZoneInfo(
+        "America/Denver"
+    )
     assert len(users.member_id_to_user) == previous_num_users + 1
+    assert guild_index.guild_ids_of(member_id) == {guild.id}
 
 
 @pytest.mark.asyncio
@@ -42,10 +60,12 @@ async def test_register_existing_user(
     member_id = interaction.user.id
     previous_num_users = len(users.member_id_to_user)
     previous_commitment = users.member_id_to_user[member_id].commitment
-    await register.callback(interaction, Timezone.MST)
+    await register.callback(interaction, ZoneInfo("America/Denver"))
 
     assert member_id in users.member_id_to_user
-    assert users.member_id_to_user[member_id].timezone == Timezone.MST
+    assert users.member_id_to_user[member_id].timezone == ZoneInfo(
+        "America/Denver"
+    )
     assert len(users.member_id_to_user) == previous_num_users
     assert previous_commitment == users.member_id_to_user[member_id].commitment
 
@@ -96,6 +116,46 @@ async def test_check(
     assert user.commitment.next_check_in > previous_check_in
 
 
+@pytest.mark.asyncio
+async def test_check_updates_leaderboard(
+    interaction_with_committed_user: Interaction,
+):
+    interaction_with_committed_user.guild_id = GUILD_ID
+    await check.callback(interaction_with_committed_user)
+    await leaderboard.callback(interaction_with_committed_user, "streaks", 1)
+
+    (
+        _,
+        kwargs,
+    ), _ = interaction_with_committed_user.response.send_message.call_args
+    description = kwargs["embed"].description
+    assert f"1. <@{COMMITTED_USER_ID}>: 1" in description
+    assert "You are #1" in description
+    with pytest.raises(AppCommandError):
+        await leaderboard.callback(
+            interaction_with_committed_user, "streaks", 2
+        )
+
+
+@pytest.mark.asyncio
+async def test_history_shows_completion_rates(
+    interaction_with_committed_user: Interaction, users: Users
+):
+    user = users.member_id_to_user[interaction_with_committed_user.user.id]
+    user.commitment.cycle_check_in(missed=True)
+    user.commitment.cycle_check_in(missed=False)
+    await history.callback(interaction_with_committed_user)
+
+    (
+        _,
+        kwargs,
+    ), _ = interaction_with_committed_user.response.send_message.call_args
+    description = kwargs["embed"].description
+    assert "Last 7 days: 50%" in description
+    assert "Longest streak: 1" in description
+    assert "\N{LARGE RED SQUARE}\N{LARGE GREEN SQUARE}" in description
+
+
 @pytest.mark.asyncio
 async def test_delete(
     interaction_with_committed_user: Interaction, users: Users
@@ -108,13 +168,16 @@ async def test_delete(
 
 @pytest.mark.asyncio
 async def test_remind(
-    interaction_with_committed_user: Interaction, users: Users
+    interaction_with_committed_user: Interaction,
+    users: Users,
+    schedule: Schedule,
 ):
     user = users.member_id_to_user[interaction_with_committed_user.user.id]
     reminder = time(10, 10, 10, 0)
     await remind.callback(interaction_with_committed_user, reminder)
 
     assert user.commitment.reminder == reminder
+    assert COMMITTED_USER_ID in schedule.reminders
 
 
 @pytest.mark.asyncio
@@ -147,3 +210,31 @@ async def test_toggle_active(
 
     assert not is_active_after_toggle
     assert user.is_active
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [("Europe/Berlin", "Europe/Berlin"), ("pst", "America/Los_Angeles")],
+)
+async def test_timezone_transformer_accepts_zones_and_legacy_names(
+    _interaction: Interaction, value: str, expected: str
+):
+    transformer = _TimezoneTransformer()
+
+    assert await transformer.transform(_interaction, value) == ZoneInfo(
+        expected
+    )
+
+
+@pytest.mark.asyncio
+async def test_timezone_transformer_rejects_unknown_zone_and_autocompletes(
+    _interaction: Interaction,
+):
+    transformer = _TimezoneTransformer()
+    choices = await transformer.autocomplete(_interaction, "new york")
+
+    with pytest.raises(AppCommandError):
+        await transformer.transform(_interaction, "Mars/Olympus_Mons")
+    assert [choice.value for choice in choices] == ["America/New_York"]
+    assert Timezone.EST.zone == ZoneInfo("America/New_York")
@@ -0,0 +1,310 @@
+import os
+import pickle
+from datetime import datetime
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from accountabot import data
+from accountabot.data import Clock
+from accountabot.data import Commitment
+from accountabot.data import Recurrence
+from accountabot.data import Repetition
+from accountabot.data import Timezone
+from accountabot.data import User
+from accountabot.data import user_time
+from accountabot.data import Users
+from accountabot.data import utc_time
+from accountabot.data import Weekday
+from accountabot.journal import read_journal
+from tests.conftest import _get_user
+
+
+def test_users_load_replays_journal_over_snapshot():
+    user = _get_user(committed=True)
+    with open(data.USERS_FILE, "wb") as f:
+        pickle.dump({user.member_id: user}, f)
+    users = Users(member_id_to_user={})
+    users.load()
+    user = users.member_id_to_user[user.member_id]
+    user.commitment.cycle_check_in(missed=False)
+    users.record(user)
+    new_user = _get_user(committed=False)
+    users.record(new_user)
+    users.close()
+
+    loaded = Users(member_id_to_user={})
+    loaded.load()
+
+    assert loaded.member_id_to_user == {
+        user.member_id: user,
+        new_user.member_id: new_user,
+    }
+
+
+def test_users_load_ignores_truncated_journal_record():
+    users = Users(member_id_to_user={})
+    user = _get_user(committed=True)
+    users.record(user)
+    users.close()
+    with open(data.USERS_JOURNAL_FILE, "ab") as f:
+        f.write(pickle.dumps((0, user))[:-5])
+
+    loaded = Users(member_id_to_user={})
+    loaded.load()
+    loaded.record(_get_user(committed=False))
+    loaded.close()
+    reloaded = Users(member_id_to_user={})
+    reloaded.load()
+
+    assert set(reloaded.member_id_to_user) == {
+        user.member_id,
+        _get_user(committed=False).member_id,
+    }
+
+
+def test_users_save_compacts_journal_into_snapshot(monkeypatch):
+    monkeypatch.setattr(data, "COMPACTION_MIN_RECORDS", 2)
+    users = Users(member_id_to_user={})
+    for committed in [True, False, True]:
+        user = _get_user(committed=committed)
+        users.member_id_to_user[user.member_id] = user
+        users.record(user)
+    users.save()
+    users.close()
+
+    assert not os.path.exists(data.USERS_JOURNAL_FILE)
+    with open(data.USERS_FILE, "rb") as f:
+        assert pickle.load(f).member_id_to_user == users.member_id_to_user
+
+
+def test_users_compaction_keeps_a_leftover_rotated_journal(monkeypatch):
+    monkeypatch.setattr(data, "COMPACTION_MIN_RECORDS", 1)
+    leftover = _get_user(committed=True)
+    with open(f"{data.USERS_JOURNAL_FILE}.compacting", "wb") as f:
+        pickle.dump((leftover.member_id, leftover), f)
+    users = Users(member_id_to_user={})
+    user = _get_user(committed=False)
+    users.member_id_to_user[user.member_id] = user
+    users.record(user)
+    users.close()
+
+    assert not os.path.exists(f"{data.USERS_JOURNAL_FILE}.compacting")
+    loaded = Users(member_id_to_user={})
+    loaded.load()
+    loaded.close()
+    assert loaded.member_id_to_user == {
+        leftover.member_id: leftover,
+        user.member_id: user,
+    }
+
+
+def test_users_save_skips_when_nothing_changed():
+    users = Users(member_id_to_user={})
+    users.save()
+
+    assert not users.is_dirty
+    assert not os.path.exists(data.USERS_JOURNAL_FILE)
+
+    user = _get_user(committed=True)
+    users.record(user)
+    users.record(user)
+
+    assert users.is_dirty
+
+    users.flush()
+
+    assert not users.is_dirty
+    assert len(list(read_journal(data.USERS_JOURNAL_FILE))) == 1
+
+
+def test_users_persist_announcement_channels(monkeypatch):
+    monkeypatch.setattr(data, "COMPACTION_MIN_RECORDS", 1)
+    users = Users(member_id_to_user={})
+    users.set_announcement_channel(10, 100)
+    users.set_announcement_channel(20, 200)
+    users.flush()
+    users.set_announcement_channel(20, None)
+    users.close()
+
+    loaded = Users(member_id_to_user={})
+    loaded.load()
+
+    assert loaded.guild_id_to_channel_id == {10: 100}
+
+
+def test_use_partition_separates_user_files(monkeypatch):
+    for name in ["USERS_FILE", "USERS_JOURNAL_FILE", "USERS_DB_FILE", "_users"]:
+        monkeypatch.setattr(data, name, getattr(data, name))
+    data.use_partition("shards-0-1")
+
+    assert data.USERS_FILE == "users.shards-0-1.pkl"
+    assert data.USERS_JOURNAL_FILE == "users.shards-0-1.journal"
+    assert data.get_users()._journal.path == "users.shards-0-1.journal"
+
+
+def test_other_layout_files_overlap_the_partition():
+    for path in [
+        "users.pkl",
+        "users.shards-0-1-of-4.pkl",
+        "users.shards-2-3-of-4.journal",
+        "users.shards-1-2-of-4.db",
+        "users.shards-0-of-2.pkl",
+        "users.shards-0-1.pkl",
+    ]:
+        open(path, "w").close()
+
+    assert data.other_layout_files(data.shard_partition([0, 1], 4)) == [
+        "users.shards-0-1.pkl",
+        "users.shards-0-of-2.pkl",
+        "users.pkl",
+        "users.shards-1-2-of-4.db",
+    ]
+    assert data.other_layout_files(None) == [
+        "users.shards-0-1-of-4.pkl",
+        "users.shards-0-1.pkl",
+        "users.shards-0-of-2.pkl",
+        "users.shards-2-3-of-4.journal",
+        "users.shards-1-2-of-4.db",
+    ]
+
+
+class _LegacyPickle:
+    """Pickles like the plain dataclasses that older users.pkl files hold"""
+
+    def __init__(self, cls: type, state: dict):
+        self.cls = cls
+        self.state = state
+
+    def __reduce__(self):
+        return _new, (self.cls,), self.state
+
+
+def _new(cls: type):
+    return cls.__new__(cls)
+
+
+def test_users_load_legacy_dataclass_snapshot():
+    user = _get_user(committed=True)
+    commitment = user.commitment
+    recurrence = _LegacyPickle(
+        Recurrence,
+        {"repetition": Repetition.WEEKLY, "weekdays": [Weekday.FRIDAY]},
+    )
+    legacy_commitment = _LegacyPickle(
+        Commitment,
+        {
+            "owner_id": commitment.owner_id,
+            "name": commitment.name,
+            "description": commitment.description,
+            "next_check_in": commitment.next_check_in,
+            "recurrence": recurrence,
+            "streak": 3,
+            "num_missed_in_a_row": 0,
+            "reminder": commitment.reminder,
+        },
+    )
+    legacy_user = _LegacyPickle(
+        User,
+        {
+            "member_id": user.member_id,
+            "commitment": legacy_commitment,
+            "is_active": True,
+            "timezone": Timezone.PST,
+        },
+    )
+    with open(data.USERS_FILE, "wb") as f:
+        pickle.dump({user.member_id: legacy_user}, f)
+
+    users = Users(member_id_to_user={})
+    users.load()
+    loaded = users.member_id_to_user[user.member_id]
+
+    assert loaded.timezone == ZoneInfo("America/Los_Angeles")
+    assert loaded.commitment.next_check_in == commitment.next_check_in
+    assert loaded.commitment.reminder == commitment.reminder
+    assert loaded.commitment.streak == 3
+    assert loaded.commitment.recurrence is Recurrence(
+        Repetition.WEEKLY, [Weekday.FRIDAY]
+    )
+
+
+def test_commitment_is_slotted_and_recurrences_are_shared():
+    user = _get_user(committed=True)
+    copy = pickle.loads(pickle.dumps(user))
+
+    assert not hasattr(user, "__dict__")
+    assert not hasattr(user.commitment, "__dict__")
+    assert copy == user
+    assert copy.commitment.recurrence is user.commitment.recurrence
+
+
+def test_user_times_follow_daylight_saving_time():
+    user = _get_user(committed=True)
+
+    assert utc_time(user, datetime(2023, 1, 10, 23, 59)) == datetime(
+        2023, 1, 11, 7, 59
+    )
+    assert utc_time(user, datetime(2023, 7, 10, 23, 59)) == datetime(
+        2023, 7, 11, 6, 59
+    )
+    # Skipped by the spring forward, read with the offset from before it
+    assert utc_time(user, datetime(2023, 3, 12, 2, 30)) == datetime(
+        2023, 3, 12, 10, 30
+    )
+    assert user_time(user, datetime(2023, 11, 5, 9, 30)) == datetime(
+        2023, 11, 5, 1, 30
+    )
+
+
+def test_clock_computes_local_time_once_per_zone():
+    user = _get_user(committed=True)
+    other = _get_user(committed=False)
+    clock = Clock(datetime(2023, 7, 10, 12, 0))
+
+    assert clock.user_now(user) == datetime(2023, 7, 10, 5, 0)
+    assert clock.user_now(other) is clock.user_now(user)
+
+
+def test_commitment_history_records_check_ins():
+    commitment = _get_user(committed=True).commitment
+    for missed in [False, False, True, False, False, False]:
+        commitment.cycle_check_in(missed=missed)
+    commitment.catch_up(commitment.next_check_in + timedelta(days=1))
+
+    assert commitment.recent_check_ins(10) == [
+        True,
+        True,
+        False,
+        True,
+        True,
+        True,
+        False,
+        False,
+    ]
+    assert commitment.longest_streak == 3
+    assert commitment.completion_rate(4) == 0.5
+    assert commitment.completion_rate(30) == 5 / 8
+
+
+def test_commitment_history_is_bounded():
+    commitment = _get_user(committed=True).commitment
+    for _ in range(data.HISTORY_LENGTH + 10):
+        commitment.cycle_check_in(missed=False)
+    commitment.cycle_check_in(missed=True)
+
+    assert commitment.num_recorded == data.HISTORY_LENGTH
+    assert commitment.history.bit_length() == data.HISTORY_LENGTH
+    assert commitment.completion_rate(1000) == 1 - 1 / data.HISTORY_LENGTH
+    assert commitment.longest_streak == data.HISTORY_LENGTH + 10
+
+
+def test_commitment_without_history_unpickles():
+    commitment = _get_user(committed=True).commitment
+    commitment.streak = 4
+    state = commitment.__getstate__()[:8]
+    legacy = Commitment.__new__(Commitment)
+    legacy.__setstate__(state)
+
+    assert legacy.num_recorded == 0
+    assert legacy.completion_rate(30) is None
+    assert legacy.longest_streak == 4
@@ -0,0 +1,102 @@
+import pickle
+import sqlite3
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from accountabot import data
+from accountabot.data import Users
+from accountabot.database import SqliteSchedule
+from accountabot.database import SqliteUsers
+from tests.conftest import _get_user
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import MOCK_DATETIME
+from tests.conftest import OVERDUE_COMMITED_USER_ID
+
+
+def test_sqlite_users_round_trip(users: Users):
+    commitment = users.member_id_to_user[COMMITTED_USER_ID].commitment
+    for missed in [False, True, False]:
+        commitment.cycle_check_in(missed=missed)
+    store = SqliteUsers(data.USERS_DB_FILE)
+    for user in users.member_id_to_user.values():
+        store.record(user)
+    store.close()
+
+    loaded = SqliteUsers(data.USERS_DB_FILE)
+    loaded.load()
+
+    assert loaded.member_id_to_user == users.member_id_to_user
+    for member_id, user in users.member_id_to_user.items():
+        if user.commitment is not None:
+            loaded_commitment = loaded.member_id_to_user[member_id].commitment
+            assert str(loaded_commitment) == str(user.commitment)
+
+
+def test_sqlite_schedule_queries_due_commitments(users: Users):
+    store = SqliteUsers(data.USERS_DB_FILE)
+    for user in users.member_id_to_user.values():
+        store.record(user)
+    store.flush()
+    schedule = SqliteSchedule(store)
+
+    assert schedule.due_check_ins(MOCK_DATETIME) == [OVERDUE_COMMITED_USER_ID]
+    assert set(schedule.due_reminders(MOCK_DATETIME)) == {
+        (COMMITTED_USER_ID, MOCK_DATETIME),
+        (OVERDUE_COMMITED_USER_ID, MOCK_DATETIME),
+    }
+
+    user = users.member_id_to_user[OVERDUE_COMMITED_USER_ID]
+    user.commitment.cycle_check_in(missed=True)
+    store.record(user)
+    user = users.member_id_to_user[COMMITTED_USER_ID]
+    user.is_active = False
+    store.record(user)
+    store.flush()
+
+    assert schedule.due_check_ins(MOCK_DATETIME) == []
+    assert schedule.due_reminders(MOCK_DATETIME) == []
+    assert schedule.due_reminders(MOCK_DATETIME + timedelta(days=1)) == [
+        (OVERDUE_COMMITED_USER_ID, MOCK_DATETIME + timedelta(days=1))
+    ]
+
+
+def test_sqlite_users_migrates_existing_pickle():
+    user = _get_user(committed=True)
+    with open(data.USERS_FILE, "wb") as f:
+        pickle.dump({user.member_id: user}, f)
+
+    store = SqliteUsers(data.USERS_DB_FILE)
+    store.load()
+
+    assert store.member_id_to_user == {user.member_id: user}
+
+
+def test_sqlite_users_migrates_legacy_timezone_offsets():
+    store = SqliteUsers(data.USERS_DB_FILE)
+    store.connection.execute(
+        "INSERT INTO users (member_id, is_active, timezone) VALUES (1, 1, -5)"
+    )
+    store.load()
+
+    assert store.member_id_to_user[1].timezone == ZoneInfo("America/New_York")
+
+
+def test_sqlite_users_adds_history_columns_to_existing_database():
+    connection = sqlite3.connect(data.USERS_DB_FILE)
+    connection.executescript(
+        "CREATE TABLE commitments (owner_id INTEGER PRIMARY KEY, name TEXT, "
+        "description TEXT, next_check_in TEXT, recurrence TEXT, streak "
+        "INTEGER, num_missed_in_a_row INTEGER, reminder TEXT, "
+        "next_check_in_utc INTEGER, next_reminder_utc INTEGER)"
+    )
+    connection.close()
+    user = _get_user(committed=True)
+    user.commitment.cycle_check_in(missed=False)
+    store = SqliteUsers(data.USERS_DB_FILE)
+    store.record(user)
+    store.close()
+
+    loaded = SqliteUsers(data.USERS_DB_FILE)
+    loaded.load()
+
+    assert loaded.member_id_to_user == {user.member_id: user}
@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+from accountabot.data import Users
+from accountabot.leaderboard import Leaderboard
+from accountabot.leaderboard import PAGE_SIZE
+from accountabot.leaderboard import RankedList
+from accountabot.membership import GuildIndex
+from tests.conftest import _get_user
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import GUILD_ID
+from tests.conftest import OVERDUE_COMMITED_USER_ID
+
+
+def test_ranked_list_matches_sorted_list():
+    rng = random.Random(0)
+    ranked = RankedList(random.Random(1))
+    expected: list[tuple] = []
+    for _ in range(2000):
+        key = (rng.randrange(-50, 0), rng.randrange(100))
+        if key in expected:
+            ranked.remove(key)
+            expected.remove(key)
+        else:
+            ranked.insert(key)
+            expected.append(key)
+        expected.sort()
+    assert len(ranked) == len(expected)
+    assert list(ranked) == expected
+    for index in rng.sample(range(len(expected)), 50):
+        assert ranked[index] == expected[index]
+        assert ranked.index(expected[index]) == index
+    assert list(ranked.slice(10, 20)) == expected[10:20]
+    with pytest.raises(KeyError):
+        ranked.remove((1, 1))
+    with pytest.raises(IndexError):
+        ranked[len(expected)]
+
+
+def test_ranked_list_from_sorted_keys_supports_updates():
+    rng = random.Random(0)
+    keys = sorted(
+        {(rng.randrange(-50, 0), rng.randrange(100)) for _ in range(500)}
+    )
+    ranked = RankedList.from_sorted(keys, random.Random(1))
+
+    assert len(ranked) == len(keys)
+    assert list(ranked) == keys
+    for index in rng.sample(range(len(keys)), 50):
+        assert ranked[index] == keys[index]
+        assert ranked.index(keys[index]) == index
+
+    ranked.remove(keys.pop(10))
+    ranked.insert((0, 0))
+    keys.append((0, 0))
+
+    assert list(ranked) == keys
+    assert ranked.index((0, 0)) == len(keys) - 1
+    assert list(ranked.slice(5, 15)) == keys[5:15]
+    assert list(RankedList.from_sorted([])) == []
+
+
+def test_leaderboard_ranks_by_streak_and_misses(
+    leaderboard: Leaderboard, users: Users, guild_index: GuildIndex
+):
+    assert leaderboard.page(GUILD_ID, "streaks", 1) == ""
+
+    committed = users.member_id_to_user[COMMITTED_USER_ID]
+    overdue = users.member_id_to_user[OVERDUE_COMMITED_USER_ID]
+    for _ in range(3):
+        committed.commitment.cycle_check_in(missed=False)
+    overdue.commitment.cycle_check_in(missed=False)
+    for user in [committed, overdue]:
+        leaderboard.update(user, guild_index.guild_ids_of(user.member_id))
+
+    assert leaderboard.page(GUILD_ID, "streaks", 1) == (
+        f"1. <@{COMMITTED_USER_ID}>: 3\n2. <@{OVERDUE_COMMITED_USER_ID}>: 1"
+    )
+    assert (
+        leaderboard.rank_of(OVERDUE_COMMITED_USER_ID, GUILD_ID, "streaks") == 2
+    )
+
+    committed.commitment.cycle_check_in(missed=True)
+    leaderboard.update(committed, guild_index.guild_ids_of(COMMITTED_USER_ID))
+
+    assert leaderboard.page(GUILD_ID, "streaks", 1) == (
+        f"1. <@{OVERDUE_COMMITED_USER_ID}>: 1"
+    )
+    assert leaderboard.page(GUILD_ID, "misses", 1) == (
+        f"1. <@{COMMITTED_USER_ID}>: 1"
+    )
+
+    overdue.is_active = False
+    leaderboard.update(
+        overdue, guild_index.guild_ids_of(OVERDUE_COMMITED_USER_ID)
+    )
+
+    assert leaderboard.page(GUILD_ID, "streaks", 1) == ""
+    assert (
+        leaderboard.rank_of(OVERDUE_COMMITED_USER_ID, GUILD_ID, "streaks")
+        is None
+    )
+
+
+def test_leaderboard_follows_membership_and_pages(
+    leaderboard: Leaderboard, guild_index: GuildIndex
+):
+    for member_id in range(10, 10 + 2 * PAGE_SIZE + 1):
+        user = _get_user(committed=True)
+        user.member_id = member_id
+        user.commitment.streak = member_id
+        guild_index.add_member(member_id, GUILD_ID)
+        leaderboard.update(user, guild_index.guild_ids_of(member_id))
+
+    assert leaderboard.num_pages(GUILD_ID, "streaks") == 3
+    assert leaderboard.page(GUILD_ID, "streaks", 3) == "21. <@10>: 10"
+
+    leaderboard.remove_member(30, GUILD_ID)
+    leaderboard.add_member(30, 200)
+
+    assert leaderboard.num_pages(GUILD_ID, "streaks") == 2
+    assert leaderboard.page(GUILD_ID, "streaks", 1).startswith("1. <@29>: 29")
+    assert leaderboard.page(200, "streaks", 1) == "1. <@30>: 30"
+
+    leaderboard.remove_guild(200)
+
+    assert leaderboard.page(200, "streaks", 1) == ""
@@ -0,0 +1,111 @@
+from unittest.mock import MagicMock
+
+import discord
+import pytest
+
+from accountabot import data
+from accountabot import lifecycle
+from accountabot.data import User
+from accountabot.data import Users
+from accountabot.leaderboard import Leaderboard
+from accountabot.lifecycle import Lifecycle
+from accountabot.membership import GuildIndex
+from accountabot.schedule import Schedule
+from accountabot.snapshot import LazyUsers
+from accountabot.snapshot import write_snapshot
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import GUILD_ID
+from tests.conftest import OVERDUE_COMMITED_USER_ID
+
+
+@pytest.fixture
+def check_loop(
+    users: Users,
+    schedule: Schedule,
+    guild_index: GuildIndex,
+    leaderboard: Leaderboard,
+    monkeypatch,
+):
+    monkeypatch.setattr(lifecycle, "get_users", lambda: users)
+    monkeypatch.setattr(lifecycle, "get_schedule", lambda: schedule)
+    monkeypatch.setattr(lifecycle, "get_guild_index", lambda: guild_index)
+    monkeypatch.setattr(lifecycle, "get_leaderboard", lambda: leaderboard)
+    check_loop = MagicMock()
+    check_loop.is_running.return_value = False
+    check_loop.start.side_effect = (
+        lambda _: check_loop.is_running.configure_mock(return_value=True)
+    )
+    monkeypatch.setattr(lifecycle, "commitment_check_loop", check_loop)
+    return check_loop
+
+
+@pytest.fixture
+def population(users: Users) -> dict[int, User]:
+    population = dict(users.member_id_to_user)
+    population[COMMITTED_USER_ID].commitment.cycle_check_in(missed=False)
+    return population
+
+
+def test_lifecycle_loads_once_and_resumes_warm(
+    check_loop: MagicMock,
+    client: discord.Client,
+    users: Users,
+    guild_index: GuildIndex,
+):
+    bot_lifecycle = Lifecycle()
+
+    bot_lifecycle.ready(client)
+
+    assert users.load.call_count == 1
+    check_loop.start.assert_called_once_with(client)
+
+    client.guilds[0].members = []
+    bot_lifecycle.ready(client)
+    bot_lifecycle.resumed(client)
+
+    assert users.load.call_count == 1
+    assert check_loop.start.call_count == 1
+    assert bot_lifecycle.num_resumes == 1
+    assert GUILD_ID not in guild_index.guild_ids_of(COMMITTED_USER_ID)
+
+
+def test_lifecycle_retries_failed_load_and_restarts_stopped_loop(
+    check_loop: MagicMock, client: discord.Client, users: Users
+):
+    bot_lifecycle = Lifecycle()
+    users.load.side_effect = [OSError, None]
+
+    with pytest.raises(OSError):
+        bot_lifecycle.ready(client)
+    bot_lifecycle.ready(client)
+
+    assert users.load.call_count == 2
+    assert bot_lifecycle.num_resumes == 0
+
+    check_loop.is_running.return_value = False
+    bot_lifecycle.resumed(client)
+
+    assert check_loop.start.call_count == 2
+
+
+def test_lifecycle_keeps_mapped_snapshot_lazy(
+    check_loop: MagicMock,
+    client: discord.Client,
+    population: dict[int, User],
+    schedule: Schedule,
+    leaderboard: Leaderboard,
+    monkeypatch,
+):
+    monkeypatch.setattr(data, "SNAPSHOT_FORMAT", "mmap")
+    write_snapshot(data.USERS_FILE, population, {})
+    users = Users(member_id_to_user={})
+    monkeypatch.setattr(lifecycle, "get_users", lambda: users)
+
+    Lifecycle().ready(client)
+
+    assert isinstance(users.member_id_to_user, LazyUsers)
+    assert len(users.member_id_to_user._member_id_to_user) == 0
+    assert len(schedule.check_ins) == 2
+    assert OVERDUE_COMMITED_USER_ID in schedule.check_ins
+    assert leaderboard.rank_of(COMMITTED_USER_ID, GUILD_ID, "streaks") == 1
+    users.close()
@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from accountabot.locks import UserLocks
+
+
+@pytest.mark.asyncio
+async def test_user_locks_serialize_each_user_and_are_dropped():
+    locks = UserLocks()
+    events = []
+
+    async def change(member_id: int, name: str):
+        async with locks.hold(member_id):
+            events.append(f"{name} start")
+            await asyncio.sleep(0)
+            events.append(f"{name} end")
+
+    await asyncio.gather(change(1, "a"), change(1, "b"), change(2, "c"))
+
+    assert events.index("a end") < events.index("b start")
+    assert events.index("c start") < events.index("a end")
+    assert len(locks) == 0
+    assert not locks.locked(1)
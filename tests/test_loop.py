@@ -1,19 +1,175 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import MagicMock
+
 import discord
 import pytest
 
+from accountabot import loop
+from accountabot.data import Users
+from accountabot.locks import get_user_locks
 from accountabot.loop import commitment_check_loop
+from accountabot.membership import GuildIndex
+from accountabot.schedule import Schedule
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import GUILD_ID
+from tests.conftest import OVERDUE_COMMITED_USER_ID
 
 
 @pytest.mark.asyncio
 async def test_commitment_check_loop_sends_failure_and_reminder(
+    client: discord.Client,
     guild: discord.Guild,
 ):
-    await commitment_check_loop([guild])
+    await commitment_check_loop(client)
     send = guild.text_channels[0].send
-    titles = [
-        call_args.args[1]["embed"].title for call_args in send.call_args_list
-    ]
 
-    assert send.call_count == 2
-    assert "Reminder" in titles
-    assert "Missed commitment" in titles
+    assert send.call_count == 1
+    assert sorted(_sent_titles(send)) == ["Missed commitment", "Reminder"]
+    assert send.call_args.args[1]["content"] == (
+        f"@everyone <@{COMMITTED_USER_ID}>"
+    )
+
+
+@pytest.mark.asyncio
+async def test_commitment_check_loop_saves_once_before_sending(
+    client: discord.Client,
+    guild: discord.Guild,
+    users: Users,
+    guild_index: GuildIndex,
+):
+    other_guild = MagicMock(spec=discord.Guild, id=GUILD_ID + 1)
+    other_guild.members = guild.members
+    guild_index.add_guild(other_guild, [OVERDUE_COMMITED_USER_ID])
+    events: list[str] = []
+    users.save.side_effect = lambda: events.append("save")
+
+    def channel(guild: discord.Guild) -> MagicMock:
+        async def send(*_, **__):
+            events.append("send")
+
+        return MagicMock(spec=discord.TextChannel, guild=guild, send=send)
+
+    guild.text_channels = [channel(guild)]
+    other_guild.text_channels = [channel(other_guild)]
+    other_guild.get_channel.return_value = None
+    client.guilds = [guild, other_guild]
+    await commitment_check_loop(client)
+
+    assert events == ["save", "send", "send"]
+
+
+@pytest.mark.asyncio
+async def test_commitment_check_loop_reschedules_missed_commitment(
+    client: discord.Client,
+    guild: discord.Guild,
+    users: Users,
+    schedule: Schedule,
+):
+    user = users.member_id_to_user[OVERDUE_COMMITED_USER_ID]
+    await commitment_check_loop(client)
+    await commitment_check_loop(client)
+    titles = _sent_titles(guild.text_channels[0].send)
+
+    assert user.commitment.num_missed_in_a_row == 1
+    assert titles.count("Missed commitment") == 1
+    assert OVERDUE_COMMITED_USER_ID in schedule.check_ins
+
+
+@pytest.mark.asyncio
+async def test_commitment_check_loop_catches_up_after_downtime(
+    client: discord.Client,
+    guild: discord.Guild,
+    users: Users,
+    schedule: Schedule,
+):
+    user = users.member_id_to_user[OVERDUE_COMMITED_USER_ID]
+    commitment = user.commitment
+    commitment.next_check_in -= timedelta(days=3)
+    schedule.update(user)
+    await commitment_check_loop(client)
+    send = guild.text_channels[0].send
+
+    assert commitment.num_missed_in_a_row == 4
+    assert _sent_titles(send).count("Missed commitment") == 1
+    assert any(
+        "missed accountability commitment 4 times" in embed.description
+        for embed in send.call_args.args[1]["embeds"]
+    )
+    assert users.record.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_commitment_check_loop_sends_to_guilds_concurrently(
+    client: discord.Client,
+    guild: discord.Guild,
+    guild_index: GuildIndex,
+    monkeypatch,
+):
+    monkeypatch.setattr(loop, "GUILD_SEND_TIMEOUT_SECONDS", 0.05)
+    slow_guild = MagicMock(spec=discord.Guild, id=GUILD_ID + 1)
+    slow_guild.members = guild.members
+    guild_index.add_guild(slow_guild, [OVERDUE_COMMITED_USER_ID])
+    sent_at = {}
+
+    def channel(guild: discord.Guild, delay: float) -> MagicMock:
+        async def send(*_, **__):
+            await asyncio.sleep(delay)
+            sent_at[guild.id] = asyncio.get_running_loop().time()
+
+        return MagicMock(spec=discord.TextChannel, guild=guild, send=send)
+
+    guild.text_channels = [channel(guild, 0)]
+    slow_guild.text_channels = [channel(slow_guild, 10)]
+    slow_guild.get_channel.return_value = None
+    client.guilds = [slow_guild, guild]
+    start = asyncio.get_running_loop().time()
+    await commitment_check_loop(client)
+
+    assert list(sent_at) == [GUILD_ID]
+    assert asyncio.get_running_loop().time() - start < 1
+
+
+@pytest.mark.asyncio
+async def test_commitment_check_loop_waits_for_user_lock(
+    client: discord.Client, guild: discord.Guild, users: Users
+):
+    user = users.member_id_to_user[OVERDUE_COMMITED_USER_ID]
+    next_check_in = user.commitment.next_check_in
+    async with get_user_locks().hold(OVERDUE_COMMITED_USER_ID):
+        tick = asyncio.create_task(commitment_check_loop(client))
+        await asyncio.sleep(0.01)
+
+        assert user.commitment.next_check_in == next_check_in
+        assert not tick.done()
+
+    await tick
+
+    assert user.commitment.num_missed_in_a_row == 1
+
+
+@pytest.mark.asyncio
+async def test_commitment_check_loop_notifies_guilds_joined_later(
+    client: discord.Client,
+    guild: discord.Guild,
+    users: Users,
+    schedule: Schedule,
+):
+    user = users.member_id_to_user[OVERDUE_COMMITED_USER_ID]
+    client.guilds = []
+    await commitment_check_loop(client)
+    user.commitment.next_check_in -= timedelta(days=1)
+    schedule.update(user)
+    client.guilds = [guild]
+    await commitment_check_loop(client)
+
+    assert _sent_titles(guild.text_channels[0].send) == ["Missed commitment"]
+    assert user.commitment.num_missed_in_a_row == 2
+
+
+def _sent_titles(send: MagicMock) -> list[str]:
+    return [
+        embed.title
+        for call_args in send.call_args_list
+        for embed in call_args.args[1]["embeds"]
+    ]
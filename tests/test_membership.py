@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+
+import discord
+
+from accountabot.data import Users
+from accountabot.membership import GuildIndex
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import GUILD_ID
+from tests.conftest import UNCOMMITED_USER_ID
+from tests.conftest import UNREGISTERED_USER_ID
+
+
+def test_guild_index_only_tracks_registered_members(
+    guild_index: GuildIndex,
+):
+    assert guild_index.guild_ids_of(COMMITTED_USER_ID) == {GUILD_ID}
+    assert guild_index.guild_ids_of(UNREGISTERED_USER_ID) == set()
+    assert UNREGISTERED_USER_ID not in guild_index.member_ids_of(GUILD_ID)
+
+
+def test_guild_index_follows_member_events(guild_index: GuildIndex):
+    guild_index.add_member(COMMITTED_USER_ID, 200)
+    guild_index.remove_member(COMMITTED_USER_ID, GUILD_ID)
+
+    assert guild_index.guild_ids_of(COMMITTED_USER_ID) == {200}
+    assert COMMITTED_USER_ID not in guild_index.member_ids_of(GUILD_ID)
+
+
+def test_guild_index_follows_guild_events(
+    guild_index: GuildIndex, users: Users
+):
+    other_guild = MagicMock(spec=discord.Guild, id=200)
+    other_guild.members = [
+        MagicMock(spec=discord.Member, id=id)
+        for id in [UNREGISTERED_USER_ID, UNCOMMITED_USER_ID]
+    ]
+    guild_index.add_guild(other_guild, users.member_id_to_user)
+    guild_index.remove_guild(GUILD_ID)
+
+    assert guild_index.guild_ids_of(UNCOMMITED_USER_ID) == {200}
+    assert guild_index.guild_ids_of(COMMITTED_USER_ID) == set()
+    assert guild_index.guild_ids_of(UNREGISTERED_USER_ID) == set()
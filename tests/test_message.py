@@ -0,0 +1,220 @@
+import asyncio
+import time
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import discord
+import pytest
+
+from accountabot import message
+from accountabot import metrics
+from accountabot.data import Users
+from accountabot.message import announcement_channel
+from accountabot.message import invalidate_announcement_channel
+from accountabot.message import message_guild_digest
+from accountabot.message import Notification
+from accountabot.message import save_and_message_interaction
+from accountabot.message import start_response_budget
+from tests.conftest import MockSendMessage
+
+
+def _channel(can_send: bool, forbidden: bool = False) -> MagicMock:
+    channel = MagicMock(spec=discord.TextChannel, send=MockSendMessage())
+    channel.permissions_for.return_value = MagicMock(
+        send_messages=can_send, embed_links=True
+    )
+    if forbidden:
+        channel.send.side_effect = discord.errors.Forbidden(
+            MagicMock(status=403), "Missing permissions"
+        )
+    return channel
+
+
+@pytest.fixture(autouse=True)
+def patch_message_users(users: Users):
+    with patch("accountabot.message.get_users") as message_users:
+        message_users.return_value = users
+        yield
+
+
+@pytest.mark.asyncio
+async def test_message_guild_digest_uses_permitted_channel_once(
+    guild: discord.Guild,
+):
+    locked, open_ = _channel(can_send=False), _channel(can_send=True)
+    guild.text_channels = [locked, open_]
+    await message_guild_digest(guild, [Notification("first")])
+    await message_guild_digest(guild, [Notification("second")])
+
+    assert locked.send.call_count == 0
+    assert open_.send.call_count == 2
+    assert open_.permissions_for.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_message_guild_digest_falls_back_on_forbidden(
+    guild: discord.Guild,
+):
+    stale, open_ = _channel(True, forbidden=True), _channel(can_send=False)
+    guild.text_channels = [stale, open_]
+    await message_guild_digest(guild, [Notification("message")])
+
+    assert open_.send.call_count == 1
+    assert announcement_channel(guild) is open_
+
+
+def test_announcement_channel_prefers_configured_override(
+    guild: discord.Guild, users: Users
+):
+    first, configured = _channel(can_send=True), _channel(can_send=True)
+    guild.text_channels = [first, configured]
+
+    assert announcement_channel(guild) is first
+
+    users.guild_id_to_channel_id[guild.id] = 1234
+    guild.get_channel.return_value = configured
+    invalidate_announcement_channel(guild.id)
+
+    assert announcement_channel(guild) is configured
+    guild.get_channel.assert_called_with(1234)
+
+
+@pytest.mark.asyncio
+async def test_message_guild_digest_packs_notifications(
+    guild: discord.Guild,
+):
+    notifications = [
+        Notification(message="x" * 100, title="Reminder", mention=f"<@{i}>")
+        for i in range(25)
+    ] + [
+        Notification(message="y" * 4000, title="Missed", mention="@everyone")
+        for _ in range(2)
+    ]
+    num_messages = await message_guild_digest(guild, notifications)
+    calls = guild.text_channels[0].send.call_args_list
+
+    assert num_messages == len(calls) == 4
+    assert [len(call.args[1]["embeds"]) for call in calls] == [10, 10, 6, 1]
+    assert calls[0].args[1]["content"] == " ".join(f"<@{i}>" for i in range(10))
+    assert calls[2].args[1]["content"].endswith("<@24> @everyone")
+    assert calls[3].args[1]["content"] == "@everyone"
+
+
+class _Response:
+    """Interaction response that remembers whether it was responded to"""
+
+    def __init__(self, events: list[str], delay: float = 0):
+        self._events = events
+        self._delay = delay
+        self._is_done = False
+
+    def is_done(self) -> bool:
+        return self._is_done
+
+    async def defer(self, **_):
+        await asyncio.sleep(self._delay)
+        self._is_done = True
+        self._events.append("defer")
+
+    async def send_message(self, **_):
+        assert not self._is_done
+        self._is_done = True
+        self._events.append("send_message")
+
+
+def _interaction(events: list[str], users: Users, delay: float = 0):
+    interaction = MagicMock(spec=discord.Interaction, extras={})
+    interaction.command.name = "check"
+    interaction.response = _Response(events, delay)
+
+    async def followup(ephemeral: bool, **_):
+        events.append("ephemeral followup" if ephemeral else "followup")
+
+    async def delete_original_response():
+        events.append("delete")
+
+    interaction.followup.send = followup
+    interaction.delete_original_response = delete_original_response
+    users.save.side_effect = lambda: events.append("save")
+    return interaction
+
+
+@pytest.mark.asyncio
+async def test_save_and_message_interaction_responds_before_saving(
+    users: Users,
+):
+    events: list[str] = []
+    interaction = _interaction(events, users)
+    await save_and_message_interaction(interaction, "first")
+    await save_and_message_interaction(interaction, "second")
+
+    assert events == ["send_message", "save", "followup", "save"]
+
+
+@pytest.mark.asyncio
+async def test_slow_interaction_is_deferred_and_followed_up(
+    users: Users, monkeypatch
+):
+    monkeypatch.setattr(message, "INTERACTION_BUDGET_SECONDS", 0.01)
+    events: list[str] = []
+    interaction = _interaction(events, users)
+    start_response_budget(interaction)
+    await asyncio.sleep(0.05)
+    await save_and_message_interaction(interaction, "slow")
+
+    assert events == ["defer", "followup", "save"]
+
+
+@pytest.mark.asyncio
+async def test_ephemeral_reply_after_deferral_stays_private(
+    users: Users, monkeypatch
+):
+    monkeypatch.setattr(message, "INTERACTION_BUDGET_SECONDS", 0.01)
+    events: list[str] = []
+    interaction = _interaction(events, users)
+    start_response_budget(interaction)
+    await asyncio.sleep(0.05)
+    await save_and_message_interaction(interaction, "error", ephemeral=True)
+    await save_and_message_interaction(interaction, "error", ephemeral=True)
+
+    assert events == [
+        "defer",
+        "delete",
+        "ephemeral followup",
+        "save",
+        "ephemeral followup",
+        "save",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reply_waits_for_deferral_in_flight(users: Users, monkeypatch):
+    monkeypatch.setattr(message, "INTERACTION_BUDGET_SECONDS", 0)
+    events: list[str] = []
+    interaction = _interaction(events, users, delay=0.02)
+    start_response_budget(interaction)
+    await asyncio.sleep(0.01)
+    await save_and_message_interaction(interaction, "racing")
+
+    assert events == ["defer", "followup", "save"]
+
+
+@pytest.mark.asyncio
+async def test_fast_interaction_is_not_deferred_and_misses_are_counted(
+    users: Users, monkeypatch
+):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    events: list[str] = []
+    interaction = _interaction(events, users)
+    start_response_budget(interaction)
+    await save_and_message_interaction(interaction, "fast")
+    await asyncio.sleep(0)
+    late = _interaction(events, users)
+    late.extras[metrics.COMMAND_STARTED_AT] = time.perf_counter() - 5
+    await save_and_message_interaction(late, "late")
+
+    assert events == ["send_message", "save", "send_message", "save"]
+    assert (
+        'accountabot_interaction_deadline_misses_total{command="check"} 1.0'
+        in metrics.render().splitlines()
+    )
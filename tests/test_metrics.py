@@ -0,0 +1,63 @@
+from urllib.request import urlopen
+
+import pytest
+
+from accountabot import metrics
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    registry = []
+    monkeypatch.setattr(metrics, "_registry", registry)
+    monkeypatch.setattr(metrics, "_enabled", False)
+    return registry
+
+
+def test_metrics_are_not_recorded_when_disabled():
+    counter = metrics.Counter("test_total", "Test")
+    counter.inc()
+
+    assert not any(
+        line.startswith("test_total") for line in metrics.render().splitlines()
+    )
+
+
+def test_histogram_renders_cumulative_buckets(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    histogram = metrics.Histogram(
+        "test_seconds", "Test", ("kind",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5.0, "a")
+    lines = metrics.render().splitlines()
+
+    assert 'test_seconds_bucket{kind="a",le="0.1"} 1.0' in lines
+    assert 'test_seconds_bucket{kind="a",le="1.0"} 2.0' in lines
+    assert 'test_seconds_bucket{kind="a",le="+Inf"} 3.0' in lines
+    assert 'test_seconds_sum{kind="a"} 5.55' in lines
+    assert 'test_seconds_count{kind="a"} 3.0' in lines
+
+
+def test_counter_escapes_label_values(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    counter = metrics.Counter("test_total", "Test", ("reason",))
+    counter.inc('say "hi"', amount=2)
+
+    assert 'test_total{reason="say \\"hi\\""} 2.0' in metrics.render()
+
+
+def test_server_serves_metrics():
+    gauge = metrics.Gauge("test_users", "Test")
+    server = metrics.start_server(0)
+    try:
+        gauge.set(3)
+        port = server.server_address[1]
+        with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert "# TYPE test_users gauge" in body
+    assert "test_users 3" in body
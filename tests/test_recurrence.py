@@ -1,4 +1,5 @@
 from datetime import datetime
+from datetime import timedelta
 
 import pytest
 
@@ -31,14 +32,91 @@ def test_weekly_recurrence():
     assert r_mwf.next_occurence(datetime(2024, 2, 29)) == datetime(2024, 3, 1)
 
 
+def test_interval_recurrence():
+    r = Recurrence(Repetition.INTERVAL, parameter=3)
+
+    assert r.next_occurence(datetime(2022, 8, 30)) == datetime(2022, 9, 2)
+    assert r.next_occurence(datetime(2022, 12, 30)) == datetime(2023, 1, 2)
+
+
+def test_times_per_week_recurrence_spreads_days():
+    r = Recurrence(Repetition.TIMES_PER_WEEK, parameter=3)
+
+    assert r.weekdays == [Weekday.MONDAY, Weekday.WEDNESDAY, Weekday.FRIDAY]
+    # 9/2/2022 is a Friday
+    assert r.next_occurence(datetime(2022, 9, 2)) == datetime(2022, 9, 5)
+    assert str(r) == "3 times per week, on Monday, Wednesday, Friday"
+    assert Recurrence.from_str(str(r)) is r
+
+
+def test_monthly_recurrence_clamps_to_end_of_month():
+    r = Recurrence(Repetition.MONTHLY, parameter=31)
+
+    assert r.next_occurence(datetime(2022, 12, 31)) == datetime(2023, 1, 31)
+    assert r.next_occurence(datetime(2023, 1, 31)) == datetime(2023, 2, 28)
+    assert r.next_occurence(datetime(2024, 1, 31)) == datetime(2024, 2, 29)
+    assert r.next_occurence(datetime(2023, 2, 28)) == datetime(2023, 3, 31)
+    assert r.next_occurence(datetime(2023, 4, 2)) == datetime(2023, 4, 30)
+
+
+def test_weekly_recurrence_without_weekdays_throws():
+    with pytest.raises(ValueError):
+        Recurrence(Repetition.WEEKLY, [])
+
+
+@pytest.mark.parametrize(
+    "recurrence",
+    [
+        Recurrence(Repetition.DAILY),
+        Recurrence(Repetition.WEEKLY, [Weekday.TUESDAY]),
+        Recurrence(
+            Repetition.WEEKLY,
+            [Weekday.MONDAY, Weekday.WEDNESDAY, Weekday.FRIDAY],
+        ),
+        Recurrence(Repetition.INTERVAL, parameter=3),
+        Recurrence(Repetition.TIMES_PER_WEEK, parameter=2),
+        Recurrence(Repetition.MONTHLY, parameter=29),
+    ],
+)
+@pytest.mark.parametrize("num_days", [0, 1, 6, 7, 8, 30, 365])
+def test_recurrence_occurences_match_repeated_steps(
+    recurrence: Recurrence, num_days: int
+):
+    start = datetime(2022, 8, 29, 9, 30)
+    end = start + timedelta(days=num_days, hours=2)
+    occurence = recurrence.next_occurence(start)
+    num_occurences = 0
+    while occurence <= end:
+        num_occurences += 1
+        occurence = recurrence.next_occurence(occurence)
+
+    assert recurrence.num_occurences_until(start, end) == num_occurences
+    assert recurrence.next_occurence_after(start, end) == occurence
+    assert Recurrence.from_str(str(recurrence)) is recurrence
+
+
 @pytest.mark.parametrize(
-    "value", ["random string", "daly", "weekly random", "weekly"]
+    "value",
+    [
+        "random string",
+        "daly",
+        "weekly random",
+        "weekly",
+        "every 0 days",
+        "8 times per week",
+        "monthly on day 32",
+    ],
 )
 def test_recurrence_from_str_invalid_value_throws(value: str):
     with pytest.raises(ValueError):
         Recurrence.from_str(value)
 
 
+def test_recurrence_bounds_error_uses_user_wording():
+    with pytest.raises(ValueError, match="'N times per week' needs N between"):
+        Recurrence.from_str("8 times per week")
+
+
 @pytest.mark.parametrize(
     ["value", "expected"],
     [
@@ -57,6 +135,22 @@ def test_recurrence_from_str_invalid_value_throws(value: str):
                 [Weekday.WEDNESDAY, Weekday.FRIDAY, Weekday.SATURDAY],
             ),
         ),
+        (
+            "every 3 days",
+            Recurrence(Repetition.INTERVAL, parameter=3),
+        ),
+        (
+            "Every 1 day",
+            Recurrence(Repetition.DAILY),
+        ),
+        (
+            "4 times a week",
+            Recurrence(Repetition.TIMES_PER_WEEK, parameter=4),
+        ),
+        (
+            "Monthly on the 15th",
+            Recurrence(Repetition.MONTHLY, parameter=15),
+        ),
     ],
 )
 def test_recurrence_from_str_with_valid_values(
@@ -0,0 +1,167 @@
+from datetime import datetime
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from accountabot.data import Users
+from accountabot.data import utc_time
+from accountabot.schedule import CheckInQueue
+from accountabot.schedule import ReminderWheel
+from accountabot.schedule import Schedule
+from tests.conftest import COMMITTED_USER_ID
+from tests.conftest import MOCK_DATETIME
+from tests.conftest import OVERDUE_COMMITED_USER_ID
+from tests.conftest import UNCOMMITED_USER_ID
+
+
+def test_check_in_queue_pops_due_in_order():
+    queue = CheckInQueue()
+    queue.push(1, datetime(2022, 1, 3))
+    queue.push(2, datetime(2022, 1, 1))
+    queue.push(3, datetime(2022, 1, 2))
+
+    assert queue.next_due() == datetime(2022, 1, 1)
+    assert queue.pop_due(datetime(2022, 1, 2)) == [2, 3]
+    assert queue.pop_due(datetime(2022, 1, 2)) == []
+    assert len(queue) == 1
+
+
+def test_check_in_queue_push_replaces_and_remove_discards():
+    queue = CheckInQueue()
+    queue.push(1, datetime(2022, 1, 1))
+    queue.push(1, datetime(2022, 1, 5))
+    queue.push(2, datetime(2022, 1, 2))
+    queue.remove(2)
+
+    assert queue.pop_due(datetime(2022, 1, 4)) == []
+    assert queue.pop_due(datetime(2022, 1, 5)) == [1]
+    assert queue.next_due() is None
+
+
+def test_check_in_queue_compacts_stale_entries():
+    queue = CheckInQueue()
+    for day in range(1, 29):
+        queue.push(1, datetime(2022, 2, day))
+
+    assert len(queue._heap) <= 3
+    assert queue.pop_due(datetime(2022, 3, 1)) == [1]
+
+
+def test_schedule_tracks_active_committed_users(users: Users):
+    schedule = Schedule()
+    schedule.rebuild(users.member_id_to_user.values())
+
+    assert COMMITTED_USER_ID in schedule.check_ins
+    assert UNCOMMITED_USER_ID not in schedule.check_ins
+    assert schedule.due_check_ins(MOCK_DATETIME) == [OVERDUE_COMMITED_USER_ID]
+
+    user = users.member_id_to_user[COMMITTED_USER_ID]
+    user.is_active = False
+    schedule.update(user)
+
+    assert COMMITTED_USER_ID not in schedule.check_ins
+
+
+def test_schedule_keys_by_utc_instant(users: Users):
+    schedule = Schedule()
+    user = users.member_id_to_user[COMMITTED_USER_ID]
+    schedule.update(user)
+
+    assert schedule.check_ins.next_due() == utc_time(
+        user, user.commitment.next_check_in
+    )
+    assert schedule.due_check_ins(MOCK_DATETIME) == []
+    assert schedule.due_check_ins(MOCK_DATETIME + timedelta(seconds=1)) == [
+        COMMITTED_USER_ID
+    ]
+
+
+def test_reminder_wheel_without_since_fires_only_at_exact_minute():
+    wheel = ReminderWheel()
+    wheel.add(1, datetime(2022, 1, 2, 13, 30, 45))
+    wheel.add(2, datetime(2022, 1, 3, 13, 30))
+
+    assert wheel.due(None, datetime(2022, 1, 1, 13, 30)) == []
+    assert wheel.due(None, datetime(2022, 1, 2, 13, 30, 10)) == [
+        (1, datetime(2022, 1, 2, 13, 30))
+    ]
+    assert wheel.due(None, datetime(2022, 1, 3, 13, 30)) == [
+        (2, datetime(2022, 1, 3, 13, 30))
+    ]
+    assert wheel.due(None, datetime(2022, 1, 2, 13, 31)) == []
+
+
+def test_reminder_wheel_fires_everything_since_last_call():
+    wheel = ReminderWheel()
+    wheel.add(1, datetime(2022, 1, 1, 23, 58))
+    wheel.add(2, datetime(2022, 1, 2, 0, 2))
+    wheel.add(3, datetime(2022, 1, 2, 0, 3))
+
+    assert wheel.due(
+        datetime(2022, 1, 1, 23, 57), datetime(2022, 1, 2, 0, 2)
+    ) == [
+        (1, datetime(2022, 1, 1, 23, 58)),
+        (2, datetime(2022, 1, 2, 0, 2)),
+    ]
+    assert (
+        wheel.due(datetime(2022, 1, 1, 23, 58), datetime(2022, 1, 1, 23, 59))
+        == []
+    )
+
+
+def test_reminder_wheel_scans_at_most_a_day():
+    wheel = ReminderWheel()
+    wheel.add(1, datetime(2022, 1, 1, 12, 0))
+    wheel.add(2, datetime(2022, 1, 3, 12, 0))
+
+    assert wheel.due(datetime(2021, 12, 1), datetime(2022, 1, 3, 13, 0)) == [
+        (2, datetime(2022, 1, 3, 12, 0))
+    ]
+
+
+def test_reminder_wheel_add_moves_and_remove_discards():
+    wheel = ReminderWheel()
+    wheel.add(1, datetime(2022, 1, 2, 8, 0))
+    wheel.add(1, datetime(2022, 1, 2, 9, 0))
+    wheel.add(2, datetime(2022, 1, 2, 9, 0))
+    wheel.remove(2)
+
+    assert wheel.due(None, datetime(2022, 1, 2, 8, 0)) == []
+    assert wheel.due(None, datetime(2022, 1, 2, 9, 0)) == [
+        (1, datetime(2022, 1, 2, 9, 0))
+    ]
+    assert len(wheel) == 1
+
+
+def test_schedule_reminders_follow_timezone_and_check_in_date(users: Users):
+    schedule = Schedule()
+    user = users.member_id_to_user[COMMITTED_USER_ID]
+    schedule.update(user)
+
+    assert schedule.due_reminders(MOCK_DATETIME) == [
+        (COMMITTED_USER_ID, MOCK_DATETIME)
+    ]
+
+    user.timezone = ZoneInfo("America/New_York")
+    schedule.update(user)
+
+    assert schedule.reminders.due(None, MOCK_DATETIME) == []
+    assert schedule.reminders.due(None, MOCK_DATETIME - timedelta(hours=3)) == [
+        (COMMITTED_USER_ID, MOCK_DATETIME - timedelta(hours=3))
+    ]
+
+    user.commitment.reminder = None
+    schedule.update(user)
+
+    assert COMMITTED_USER_ID not in schedule.reminders
+
+
+def test_schedule_reminders_survive_skipped_ticks(users: Users):
+    schedule = Schedule()
+    user = users.member_id_to_user[COMMITTED_USER_ID]
+    schedule.update(user)
+
+    assert schedule.due_reminders(MOCK_DATETIME - timedelta(minutes=2)) == []
+    assert schedule.due_reminders(MOCK_DATETIME + timedelta(minutes=3)) == [
+        (COMMITTED_USER_ID, MOCK_DATETIME)
+    ]
+    assert schedule.due_reminders(MOCK_DATETIME + timedelta(minutes=4)) == []
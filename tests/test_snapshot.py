@@ -0,0 +1,162 @@
+import pickle
+from datetime import time
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from accountabot import data
+from accountabot.data import index_entry
+from accountabot.data import IndexEntry
+from accountabot.data import Recurrence
+from accountabot.data import User
+from accountabot.data import Users
+from accountabot.snapshot import is_snapshot
+from accountabot.snapshot import read_snapshot
+from accountabot.snapshot import SnapshotError
+from accountabot.snapshot import write_snapshot
+from tests.conftest import _get_user
+
+
+def _population() -> dict[int, User]:
+    committed = _get_user(committed=True)
+    committed.commitment.reminder = time(20, 30, 15)
+    committed.commitment.name = "Läufe 🏃"
+    for missed in [False, True, False]:
+        committed.commitment.cycle_check_in(missed=missed)
+    uncommitted = _get_user(committed=False)
+    uncommitted.is_active = False
+    uncommitted.timezone = ZoneInfo("Asia/Kolkata")
+    monthly = _get_user(committed=True, overdue=True)
+    monthly.member_id = 2**63 + 1
+    monthly.commitment.owner_id = monthly.member_id
+    monthly.commitment.recurrence = Recurrence.from_str("monthly on day 31")
+    monthly.commitment.streak = 12
+    return {user.member_id: user for user in [committed, uncommitted, monthly]}
+
+
+def test_snapshot_round_trips_users_and_guilds():
+    population = _population()
+    write_snapshot("users.snap", population, {10: 100, 20: 200})
+
+    users, guild_id_to_channel_id = read_snapshot("users.snap")
+
+    assert is_snapshot("users.snap")
+    assert dict(users) == population
+    assert guild_id_to_channel_id == {10: 100, 20: 200}
+    monthly = users[2**63 + 1].commitment.recurrence
+    assert monthly is Recurrence.from_str("monthly on day 31")
+
+
+def test_snapshot_decodes_users_on_first_access():
+    population = _population()
+    write_snapshot("users.snap", population, {})
+    users, _ = read_snapshot("users.snap")
+    member_id = next(iter(population))
+
+    assert member_id in users
+    assert 0 not in users
+    assert len(users) == len(population)
+    assert not users._member_id_to_user
+
+    assert users[member_id] is users[member_id]
+    assert list(users._member_id_to_user) == [member_id]
+
+
+def test_snapshot_users_keep_changes_in_memory():
+    population = _population()
+    write_snapshot("users.snap", population, {})
+    users, _ = read_snapshot("users.snap")
+    removed, changed, _ = population
+    new_user = _get_user(committed=False)
+    new_user.member_id = 42
+
+    del users[removed]
+    users[changed].is_active = True
+    users[new_user.member_id] = new_user
+
+    assert removed not in users
+    assert set(users) == set(population) - {removed} | {42}
+    assert len(users) == len(population)
+    assert users[changed].is_active
+    with pytest.raises(KeyError):
+        users[removed]
+
+    users[new_user.member_id] = new_user
+    users[removed] = population[removed]
+    del users[new_user.member_id]
+
+    assert len(users) == len(population) == len(set(users))
+
+
+def test_snapshot_index_entries_dont_decode_users():
+    population = _population()
+    write_snapshot("users.snap", population, {})
+    users, _ = read_snapshot("users.snap")
+    removed, changed, _ = population
+    new_user = _get_user(committed=True)
+    new_user.member_id = 42
+
+    assert list(users.index_entries()) == [
+        index_entry(population[member_id]) for member_id in sorted(population)
+    ]
+    assert not users._member_id_to_user
+
+    del users[removed]
+    users[changed].commitment = None
+    users[new_user.member_id] = new_user
+    entries = {entry.member_id: entry for entry in users.index_entries()}
+
+    assert entries == {
+        member_id: index_entry(user) for member_id, user in users.items()
+    }
+    assert entries[changed] == IndexEntry(changed)
+
+
+def test_snapshot_rejects_other_files():
+    with open("users.pkl", "wb") as f:
+        pickle.dump({}, f)
+
+    assert not is_snapshot("users.pkl")
+    with pytest.raises(SnapshotError):
+        read_snapshot("users.pkl")
+
+
+def test_convert_snapshot_between_pickle_and_mmap():
+    population = _population()
+    with open("users.pkl", "wb") as f:
+        pickle.dump(population, f)
+
+    data.convert_snapshot("users.pkl", "users.snap", "mmap")
+    data.convert_snapshot("users.snap", "converted.pkl", "pickle")
+
+    with open("converted.pkl", "rb") as f:
+        converted = pickle.load(f)
+    assert is_snapshot("users.snap")
+    assert converted.member_id_to_user == population
+
+
+def test_users_load_converts_and_replays_journal_over_mmap_snapshot(
+    monkeypatch,
+):
+    monkeypatch.setattr(data, "SNAPSHOT_FORMAT", data.SNAPSHOT_FORMAT)
+    monkeypatch.setattr(data, "COMPACTION_MIN_RECORDS", 1)
+    population = _population()
+    with open(data.USERS_FILE, "wb") as f:
+        pickle.dump(population, f)
+    data.use_snapshot_format("mmap")
+
+    users = Users(member_id_to_user={})
+    users.load()
+
+    assert is_snapshot(data.USERS_FILE)
+    user = users.member_id_to_user[next(iter(population))]
+    user.commitment.cycle_check_in(missed=False)
+    users.record(user)
+    users.set_announcement_channel(10, 100)
+    users.close()
+    loaded = Users(member_id_to_user={})
+    loaded.load()
+
+    assert is_snapshot(data.USERS_FILE)
+    assert dict(loaded.member_id_to_user) == population | {user.member_id: user}
+    assert loaded.guild_id_to_channel_id == {10: 100}
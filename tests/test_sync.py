@@ -0,0 +1,108 @@
+import json
+from unittest.mock import AsyncMock
+from unittest.mock import MagicMock
+
+import discord
+import pytest
+
+from accountabot import sync
+from accountabot.sync import COMMAND_SYNCS_FILE
+from accountabot.sync import CommandSync
+from accountabot.sync import fingerprint
+
+
+def _command(name: str, description: str) -> MagicMock:
+    command = MagicMock()
+    command.to_dict.return_value = {
+        "type": 1,
+        "name": name,
+        "description": description,
+    }
+    return command
+
+
+def _tree(*commands: MagicMock) -> MagicMock:
+    tree = MagicMock()
+    tree.get_commands.return_value = list(commands)
+    tree.sync = AsyncMock()
+    return tree
+
+
+def _synced_guild_ids(tree: MagicMock) -> list[int]:
+    return [call.kwargs["guild"].id for call in tree.sync.call_args_list]
+
+
+def test_fingerprint_ignores_command_order():
+    check = _command("check", "Check in")
+    info = _command("info", "Display info")
+
+    assert fingerprint(_tree(check, info)) == fingerprint(_tree(info, check))
+    assert fingerprint(_tree(check, info)) != fingerprint(
+        _tree(check, _command("info", "Display your info"))
+    )
+
+
+@pytest.mark.asyncio
+async def test_command_sync_only_syncs_out_of_date_guilds():
+    tree = _tree(_command("check", "Check in"))
+    command_sync = CommandSync(tree, interval=0)
+
+    assert command_sync.plan([10, 20, 10]) == 2
+    await command_sync.join()
+
+    assert _synced_guild_ids(tree) == [10, 20]
+    with open(COMMAND_SYNCS_FILE) as f:
+        assert json.load(f) == {
+            "10": command_sync.fingerprint,
+            "20": command_sync.fingerprint,
+        }
+
+    restarted = CommandSync(tree, interval=0)
+
+    assert restarted.plan([10, 20, 30]) == 1
+    await restarted.join()
+
+    assert _synced_guild_ids(tree) == [10, 20, 30]
+
+    changed_tree = _tree(_command("check", "Check in your commitment"))
+    deployed = CommandSync(changed_tree, interval=0)
+
+    assert deployed.plan([10, 20, 30]) == 3
+    await deployed.join()
+
+
+@pytest.mark.asyncio
+async def test_command_sync_retries_failed_and_forgotten_guilds():
+    tree = _tree(_command("check", "Check in"))
+    tree.sync.side_effect = [
+        discord.HTTPException(MagicMock(status=500), "error"),
+        None,
+    ]
+    command_sync = CommandSync(tree, interval=0)
+
+    command_sync.plan([10, 20])
+    await command_sync.join()
+
+    assert not command_sync.is_synced(10)
+    assert command_sync.is_synced(20)
+
+    command_sync.forget(20)
+    await command_sync.join()
+
+    assert CommandSync(tree).plan([]) == 0
+    assert not CommandSync(tree).is_synced(20)
+
+
+@pytest.mark.asyncio
+async def test_command_sync_saves_in_batches(monkeypatch):
+    monkeypatch.setattr(sync, "SAVE_BATCH_SIZE", 2)
+    dump = MagicMock(wraps=sync._dump)
+    monkeypatch.setattr(sync, "_dump", dump)
+    tree = _tree(_command("check", "Check in"))
+    command_sync = CommandSync(tree, interval=0)
+
+    command_sync.plan([10, 20, 30, 40, 50])
+    await command_sync.join()
+
+    assert [len(call.args[1]) for call in dump.call_args_list] == [2, 4, 5]
+    assert all(CommandSync(tree).is_synced(guild_id) for guild_id in [10, 50])
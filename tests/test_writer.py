@@ -0,0 +1,36 @@
+import threading
+
+from accountabot.writer import WriteBehind
+
+
+def test_write_behind_coalesces_submissions_into_one_batch():
+    batches = []
+    writer = WriteBehind(batches.append, name="test-writer", delay=60)
+    writer.submit([1, 2])
+    writer.submit([3])
+    writer.flush()
+
+    assert batches == [[1, 2, 3]]
+
+    writer.submit([4])
+    writer.close()
+
+    assert batches == [[1, 2, 3], [4]]
+
+
+def test_write_behind_retries_failed_batch():
+    batches = []
+    failed = threading.Event()
+
+    def write(items):
+        if not failed.is_set():
+            failed.set()
+            raise OSError("disk full")
+        batches.append(items)
+
+    writer = WriteBehind(write, name="test-writer", delay=0.01)
+    writer.submit([1])
+    writer.submit([2])
+
+    assert writer.close(timeout=5)
+    assert batches == [[1, 2]]